@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from config import ANTIFLOOD_DEBOUNCE, ANTIFLOOD_RATE, ANTIFLOOD_BURST
+from send_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите немного"
+
+class AntiFloodMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений против повторных нажатий и флуда.
+
+    - обновления одного пользователя обрабатываются строго по очереди, так что
+      второе нажатие видит состояние FSM после первого;
+    - повтор того же callback (те же данные на том же сообщении) в течение
+      debounce секунд отбрасывается;
+    - пользователь, превысивший rate обновлений в секунду (с запасом burst),
+      временно игнорируется.
+
+    На отброшенные callback бот все равно отвечает, чтобы у кнопки пропали часы.
+    """
+
+    def __init__(self, debounce: float = 1.0, rate: float = 2, burst: float = 5):
+        self.debounce = debounce
+        self.rate = rate
+        self.burst = burst
+        self._locks: Dict[int, List[Any]] = {}  # user_id -> [lock, число обновлений в работе/ожидании]
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._last_callbacks: Dict[Tuple[int, int, str], float] = {}  # (user_id, message_id, data) -> время
+        self._seen = 0
+
+        # Метрики
+        self.passed = 0
+        self.duplicates = 0
+        self.throttled = 0
+        self.waited = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Снимок счетчиков: сколько лишней работы отброшено"""
+        return {
+            "passed": self.passed,
+            "duplicates_dropped": self.duplicates,
+            "throttled": self.throttled,
+            "serialized_waits": self.waited,
+            "users_in_progress": len(self._locks),
+        }
+
+    def install(self, dp: Dispatcher):
+        """Подключает middleware раньше FSM-middleware диспетчера.
+
+        Пока обновление ждет своей очереди, состояние пользователя еще не
+        прочитано, поэтому фильтры по состоянию видят результат предыдущего
+        обновления. Пользователь события к этому моменту уже известен.
+        """
+        dp.update.outer_middleware.unregister(dp.fsm)
+        dp.update.outer_middleware(self)
+        dp.update.outer_middleware(dp.fsm)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        self._seen += 1
+        if self._seen % 1000 == 0:
+            self._purge(now)
+
+        callback = event.callback_query if isinstance(event, Update) else None
+        if callback and self._is_duplicate(user.id, callback, now):
+            self.duplicates += 1
+            await self._answer(callback)
+            return None
+
+        bucket = self._buckets.get(user.id)
+        if bucket is None:
+            bucket = self._buckets[user.id] = TokenBucket(self.rate, self.burst, now)
+        if bucket.delay(now) > 0:
+            self.throttled += 1
+            logger.debug("Пользователь %s превысил лимит обновлений", user.id)
+            if callback:
+                await self._answer(callback, THROTTLED_TEXT)
+            return None
+        bucket.take()
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        lock = entry[0]
+        if lock.locked():
+            self.waited += 1
+        try:
+            async with lock:
+                self.passed += 1
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    def _is_duplicate(self, user_id: int, callback, now: float) -> bool:
+        message_id = callback.message.message_id if callback.message else 0
+        key = (user_id, message_id, callback.data or "")
+        last = self._last_callbacks.get(key)
+        if last is not None and now - last < self.debounce:
+            return True
+        self._last_callbacks[key] = now
+        return False
+
+    @staticmethod
+    async def _answer(callback, text: Optional[str] = None):
+        try:
+            await callback.answer(text)
+        except Exception as e:
+            logger.debug("Не удалось ответить на отброшенный callback: %s", e)
+
+    def _purge(self, now: float):
+        """Удаляет записи пользователей, которые давно ничего не присылали"""
+        for key in [k for k, last in self._last_callbacks.items() if now - last >= self.debounce]:
+            del self._last_callbacks[key]
+        for user_id in [u for u, b in self._buckets.items() if u not in self._locks and b.is_full(now)]:
+            del self._buckets[user_id]
+
+# Глобальная защита от повторных нажатий
+antiflood = AntiFloodMiddleware(
+    debounce=ANTIFLOOD_DEBOUNCE,
+    rate=ANTIFLOOD_RATE,
+    burst=ANTIFLOOD_BURST
+)
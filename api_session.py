@@ -0,0 +1,52 @@
+import logging
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import BOT_API_URL, BOT_API_LOCAL, API_POOL_SIZE, API_KEEPALIVE, API_TIMEOUT, API_METHOD_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+class TunedAiohttpSession(AiohttpSession):
+    """Сессия Bot API с настраиваемым пулом соединений и таймаутами по методам.
+
+    Все запросы процесса идут через один пул: pool_size соединений, простаивающее
+    соединение живет keepalive секунд (у aiohttp по умолчанию 15 - после паузы
+    в трафике каждый запрос заново открывает TLS). Таймаут берется из
+    method_timeouts по имени метода, иначе общий; у getUpdates к нему
+    добавляется время длинного опроса. api_url - свой сервер Bot API
+    (например, локальный telegram-bot-api).
+    """
+
+    def __init__(self, api_url: Optional[str] = None, local: bool = False, pool_size: int = 100,
+                 keepalive: float = 60, timeout: float = 30, method_timeouts: Optional[Dict[str, float]] = None):
+        api = TelegramAPIServer.from_base(api_url, is_local=local) if api_url else PRODUCTION
+        super().__init__(limit=pool_size, api=api, timeout=timeout)
+        self._connector_init.update(keepalive_timeout=keepalive, enable_cleanup_closed=True)
+        self.method_timeouts = method_timeouts or {}
+
+    def request_timeout(self, method: TelegramMethod) -> float:
+        if isinstance(method, GetUpdates):
+            return self.timeout + (method.timeout or 0)
+        return self.method_timeouts.get(method.__api_method__, self.timeout)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType],
+                           timeout: Optional[int] = None) -> TelegramType:
+        return await super().make_request(bot, method, self.request_timeout(method) if timeout is None else timeout)
+
+def create_api_session() -> TunedAiohttpSession:
+    """Сессия Bot API согласно настройкам"""
+    if BOT_API_URL:
+        logger.info("Bot API: %s%s", BOT_API_URL, " (локальный режим)" if BOT_API_LOCAL else "")
+    return TunedAiohttpSession(
+        api_url=BOT_API_URL or None,
+        local=BOT_API_LOCAL,
+        pool_size=API_POOL_SIZE,
+        keepalive=API_KEEPALIVE,
+        timeout=API_TIMEOUT,
+        method_timeouts=API_METHOD_TIMEOUTS
+    )
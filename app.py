@@ -0,0 +1,241 @@
+import asyncio
+import logging
+from functools import partial
+from typing import Optional, Tuple
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.filters import Command
+
+from config import (
+    BOT_TOKEN, BOT_MODE, UPDATE_CONCURRENCY, FSM_STORAGE, FSM_DB_PATH, FSM_CACHE_SIZE, FSM_TTL, FSM_EXPIRY_INTERVAL,
+    METRICS_HOST, METRICS_PORT, SHARD_ID, POLLING_TIMEOUT, UPDATE_OFFSET_PATH, DRAIN_TIMEOUT,
+    PAYMENT_WEBHOOK_HOST, PAYMENT_WEBHOOK_PORT
+)
+from logging_setup import stop_logging
+from fsm_storage import SQLiteFSMStorage
+from handlers import (
+    cmd_start, handle_order_subscription, handle_support, handle_faq, handle_back_to_menu,
+    process_plan_selection, process_spotify_login, process_payment_completed, 
+    process_start_over, handle_unknown_message, cmd_admin_orders, handle_orders_page,
+    cmd_admin_metrics, cmd_admin_export, cmd_admin_stats, confirm_payment
+)
+from states import OrderState
+from callbacks import CallbackRouter, MenuAction, MenuCallback, PlanCallback, OrdersPageCallback
+from webhook import run_webhook
+from api_session import create_api_session
+from polling import OffsetStore, ReliablePolling
+from sharding import ALLOWED_UPDATES, ignore_stop_signals, consume_updates
+from ingest import notify_admin_started
+from render import init_render_cache
+from catalog import catalog_watcher, get_catalog
+from storage import order_storage, order_reaper, admin_order_view
+from notifications import admin_outbox
+from renewals import renewal_scheduler
+from payments import payment_provider
+from payment_service import payment_webhook, payment_reconciler
+from send_scheduler import send_scheduler
+from screens import screen_stats
+from antiflood import antiflood
+from metrics import (
+    metrics, UpdateMetricsMiddleware, HandlerMetricsMiddleware, ApiMetricsMiddleware, start_metrics_server
+)
+
+logger = logging.getLogger(__name__)
+
+def build_callback_router() -> CallbackRouter:
+    """Маршруты callback-кнопок"""
+    router = CallbackRouter()
+    
+    # Главное меню
+    router.register(MenuCallback, handle_order_subscription, action=MenuAction.ORDER)
+    router.register(MenuCallback, handle_support, action=MenuAction.SUPPORT)
+    router.register(MenuCallback, handle_faq, action=MenuAction.FAQ)
+    router.register(MenuCallback, handle_back_to_menu, action=MenuAction.BACK)
+    router.register(MenuCallback, process_start_over, action=MenuAction.START_OVER)
+    
+    # Шаги заказа: кнопка действует только в своем состоянии и для плана из каталога
+    router.register(
+        PlanCallback, process_plan_selection,
+        state=OrderState.choosing_subscription,
+        validate=lambda data: get_catalog().is_current(data.plan_id, data.version)
+    )
+    router.register(
+        MenuCallback, process_payment_completed,
+        state=OrderState.payment_processing,
+        action=MenuAction.PAID
+    )
+    
+    # Листание списка заказов администратора
+    router.register(OrdersPageCallback, handle_orders_page)
+    return router
+
+async def setup_handlers(dp: Dispatcher):
+    """Регистрация обработчиков"""
+    
+    # Команды
+    dp.message.register(cmd_start, Command("start"))
+    dp.message.register(cmd_admin_orders, Command("orders"))
+    dp.message.register(cmd_admin_metrics, Command("metrics"))
+    dp.message.register(cmd_admin_export, Command("export"))
+    dp.message.register(cmd_admin_stats, Command("stats"))
+    
+    # Все callback - через таблицу маршрутов: один обработчик и поиск в словаре
+    callback_router = build_callback_router()
+    dp.callback_query.register(callback_router.dispatch, callback_router.match)
+    metrics.register_collector("callbacks", callback_router.stats)
+    
+    # Обработчики текстовых сообщений по состояниям
+    dp.message.register(
+        process_spotify_login,
+        OrderState.entering_spotify_login
+    )
+    
+    # Обработчик неизвестных сообщений
+    dp.message.register(handle_unknown_message)
+
+async def on_startup(bot: Bot, notify_admin: bool = True):
+    """Действия при запуске бота"""
+    logger.info("Бот запущен и готов к работе!")
+    admin_outbox.start(bot)
+    order_reaper.start(keep=payment_reconciler.holds)
+    renewal_scheduler.start(bot)
+    # Цены и планы меняются правкой файла каталога, без перезапуска
+    catalog_watcher.start()
+    # Оплату подтверждают уведомления провайдера и периодическая сверка
+    await payment_webhook.start(partial(confirm_payment, bot), PAYMENT_WEBHOOK_HOST, PAYMENT_WEBHOOK_PORT)
+    payment_reconciler.start(partial(confirm_payment, bot))
+    
+    # Уведомляем администратора о запуске
+    if notify_admin:
+        await notify_admin_started(bot)
+
+async def on_shutdown(bot: Bot):
+    """Действия при остановке бота (обновления к этому моменту уже обработаны)"""
+    # Новые подтверждения оплаты не принимаем: провайдер повторит их после запуска
+    await payment_webhook.close()
+    await payment_reconciler.close()
+    await payment_provider.close()
+    await catalog_watcher.close()
+    # Даем отправить накопившиеся уведомления, остаток останется в базе до запуска
+    await admin_outbox.flush(DRAIN_TIMEOUT)
+    # Дописываем отложенные изменения заказов и очередь уведомлений на диск
+    await order_reaper.close()
+    await renewal_scheduler.close()
+    await admin_outbox.close()
+    admin_order_view.close()
+    order_storage.close()
+    logger.info("Бот остановлен")
+
+def create_bot() -> Bot:
+    """Бот с планировщиком отправки и метриками запросов к Bot API"""
+    bot = Bot(token=BOT_TOKEN, session=create_api_session())
+    bot.session.middleware(send_scheduler)
+    # После планировщика: время запроса без ожидания лимитов
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+    return bot
+
+async def create_dispatcher() -> Tuple[Dispatcher, Optional[asyncio.Task]]:
+    """Диспетчер с FSM-хранилищем, метриками и обработчиками.
+
+    Вторым значением возвращается задача очистки FSM-сессий (или None).
+    """
+    if FSM_STORAGE == "sqlite":
+        storage = SQLiteFSMStorage(FSM_DB_PATH, max_size=FSM_CACHE_SIZE, ttl=FSM_TTL)
+        expiry_task = asyncio.create_task(storage.run_expiry(FSM_EXPIRY_INTERVAL))
+    else:
+        storage = MemoryStorage()
+        expiry_task = None
+    dp = Dispatcher(storage=storage)
+    
+    # Обновления пользователя - по очереди, повторные нажатия и флуд отбрасываются
+    antiflood.install(dp)
+    
+    # Метрики: обновления по состояниям FSM и время обработчиков
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    dp.message.middleware(HandlerMetricsMiddleware(metrics))
+    dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+    metrics.register_collector("send_scheduler", send_scheduler.stats)
+    metrics.register_collector("screens", lambda: dict(screen_stats))
+    metrics.register_collector("antiflood", antiflood.stats)
+    metrics.register_collector("order_reaper", order_reaper.stats)
+    metrics.register_collector("renewals", renewal_scheduler.stats)
+    metrics.register_collector("payments", lambda: {
+        **payment_reconciler.stats(), "webhooks": payment_webhook.received, "webhooks_rejected": payment_webhook.rejected
+    })
+    metrics.register_collector("catalog", catalog_watcher.stats)
+    metrics.register_collector("orders", lambda: order_storage.stats.snapshot())
+    
+    # Собираем клавиатуры и тексты до приема обновлений; дальше - один раз на версию каталога
+    init_render_cache()
+    
+    # Регистрируем обработчики
+    await setup_handlers(dp)
+    return dp, expiry_task
+
+async def worker_main(update_queue, acks, flushing):
+    """Процесс-обработчик шарда: обрабатывает обновления, которые раздает процесс приема"""
+    logger.info("Запуск обработчика шарда %s...", SHARD_ID)
+    bot = create_bot()
+    dp, expiry_task = await create_dispatcher()
+    metrics_runner = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    await on_startup(bot, notify_admin=False)
+    await dp.emit_startup(bot=bot)
+    
+    try:
+        await consume_updates(bot, dp, update_queue, acks, UPDATE_CONCURRENCY)
+    finally:
+        # Дальше только сохранение данных: процесс приема его не прерывает
+        flushing.set()
+        if expiry_task:
+            expiry_task.cancel()
+        # Закрывает FSM-хранилище
+        await dp.emit_shutdown(bot=bot)
+        await on_shutdown(bot)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+def run_worker(update_queue, acks, flushing):
+    """Точка входа процесса-обработчика шарда"""
+    ignore_stop_signals()
+    try:
+        asyncio.run(worker_main(update_queue, acks, flushing))
+    except Exception as e:
+        logger.exception("Критическая ошибка обработчика шарда %s: %s", SHARD_ID, e)
+    finally:
+        stop_logging()
+
+async def run_bot():
+    """Один процесс: получает и обрабатывает обновления"""
+    # Создаем бота и диспетчер
+    bot = create_bot()
+    dp, expiry_task = await create_dispatcher()
+    
+    # Запускаем бота
+    logger.info("Запуск бота...")
+    metrics_runner = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    await on_startup(bot)
+    
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            # Продолжаем с сохраненной позиции; при остановке обработчики дорабатывают
+            polling = ReliablePolling(
+                bot, dp, OffsetStore(UPDATE_OFFSET_PATH), UPDATE_CONCURRENCY,
+                polling_timeout=POLLING_TIMEOUT, drain_timeout=DRAIN_TIMEOUT, allowed_updates=ALLOWED_UPDATES
+            )
+            metrics.register_collector("polling", polling.stats)
+            await dp.emit_startup(bot=bot)
+            try:
+                await polling.run()
+            finally:
+                # Закрывает FSM-хранилище
+                await dp.emit_shutdown(bot=bot)
+    finally:
+        if expiry_task:
+            expiry_task.cancel()
+        await on_shutdown(bot)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
@@ -0,0 +1,118 @@
+"""Архив просроченных заказов: сжатые сегменты JSONL только для дописывания.
+
+Каждая запись в сегмент - отдельный член gzip в конце файла, поэтому уже
+записанные данные не переписываются. Когда сегмент дорастает до
+segment_bytes, начинается следующий (orders-000002.jsonl.gz и т.д.). После
+перезапуска запись идет в новый сегмент: хвост прежнего мог оборваться при
+аварийной остановке, и дописанное после обрыва уже не прочитать.
+
+Архив можно читать без бота:
+    python archive.py order_archive [--user ID] [--order ORDER_ID] [--status STATUS]
+                      [--from ГГГГ-ММ-ДД] [--to ГГГГ-ММ-ДД]
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^orders-(\d+)\.jsonl\.gz$")
+
+class OrderArchive:
+    """Сжатый архив заказов в каталоге directory"""
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._current: Optional[str] = None  # сегмент, который пишет этот процесс
+
+    def segments(self) -> List[str]:
+        """Файлы сегментов от старых к новым"""
+        if not os.path.isdir(self.directory):
+            return []
+        numbered = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbered.append((int(match.group(1)), name))
+        return [os.path.join(self.directory, name) for _, name in sorted(numbered)]
+
+    def _segment_for_append(self) -> str:
+        if self._current and os.path.getsize(self._current) < self.segment_bytes:
+            return self._current
+        segments = self.segments()
+        number = int(SEGMENT_PATTERN.match(os.path.basename(segments[-1])).group(1)) + 1 if segments else 1
+        self._current = os.path.join(self.directory, f"orders-{number:06d}.jsonl.gz")
+        return self._current
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Дописывает заказы в текущий сегмент и дожидается записи на диск.
+
+        Вызывается из потока, а не из цикла событий: сжатие и fsync блокируют.
+        """
+        if not records:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._segment_for_append()
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(path, "ab") as file:
+            file.write(gzip.compress(payload.encode("utf-8")))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Все заказы архива по порядку архивации"""
+        for path in self.segments():
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as file:
+                    for line in file:
+                        yield json.loads(line)
+            except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+                # Обрыв записи при аварийной остановке: предыдущие члены gzip целы
+                logger.warning("Сегмент %s поврежден в конце: %s", path, e)
+
+    def query(self, user_id: Optional[int] = None, order_id: Optional[str] = None,
+              status: Optional[str] = None, date_from: Optional[date] = None,
+              date_to: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """Заказы архива, подходящие под фильтры (дата - по времени создания)"""
+        created_from = datetime.combine(date_from, datetime.min.time()).isoformat() if date_from else None
+        created_to = datetime.combine(date_to + timedelta(days=1), datetime.min.time()).isoformat() if date_to else None
+        for record in self.iter_records():
+            if user_id is not None and record["user_id"] != user_id:
+                continue
+            if order_id and record["order_id"] != order_id:
+                continue
+            if status and record["status"] != status:
+                continue
+            if created_from and record["created_at"] < created_from:
+                continue
+            if created_to and record["created_at"] >= created_to:
+                continue
+            yield record
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directories", nargs="+", help="каталоги архива (по одному на шард)")
+    parser.add_argument("--user", type=int, help="user_id")
+    parser.add_argument("--order", help="ID заказа, например ORDER_00042")
+    parser.add_argument("--status", help="статус на момент архивации")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="создан не раньше, ГГГГ-ММ-ДД")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="создан не позже, ГГГГ-ММ-ДД")
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        for record in OrderArchive(directory).query(
+            user_id=args.user, order_id=args.order, status=args.status,
+            date_from=args.date_from, date_to=args.date_to
+        ):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
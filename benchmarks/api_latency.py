@@ -0,0 +1,137 @@
+"""Задержка запросов к Bot API: сессия aiogram по умолчанию и настроенная.
+
+Локальный сервер с самоподписанным сертификатом (openssl) изображает Bot API:
+отвечает на любой метод через --latency мс. Меряется задержка запроса
+deleteMessage в трех режимах:
+  последовательно - один запрос за другим, соединение одно и то же;
+  пачка           - --burst запросов одновременно (больше размера пула);
+  после паузы     - --idle секунд без запросов, затем пачка из 20: у aiohttp
+                    по умолчанию простаивающее соединение закрывается через
+                    15 с, и каждый запрос заново проходит TLS-рукопожатие.
+Настроенная сессия берет пул, keep-alive и таймауты из настроек бота
+(API_POOL_SIZE, API_KEEPALIVE, ...). Задержка до api.telegram.org - это
+--latency 50 и больше, до локального telegram-bot-api - около 1.
+
+Запуск: python benchmarks/api_latency.py [--latency МС] [--burst N] [--idle СЕК] [--no-tls]
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_FILE", "")
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from api_session import TunedAiohttpSession
+from config import API_POOL_SIZE, API_KEEPALIVE, API_TIMEOUT, API_METHOD_TIMEOUTS
+
+BOT_TOKEN = "123456:benchmark"
+
+def make_certificate(directory: str) -> ssl.SSLContext:
+    """Самоподписанный сертификат для 127.0.0.1; возвращает контекст сервера"""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def timed(bot: Bot) -> float:
+    started = time.perf_counter()
+    await bot.delete_message(chat_id=1, message_id=1)
+    return time.perf_counter() - started
+
+async def sequential(bot: Bot, count: int = 200) -> List[float]:
+    return [await timed(bot) for _ in range(count)]
+
+async def burst(bot: Bot, count: int) -> List[float]:
+    return list(await asyncio.gather(*(timed(bot) for _ in range(count))))
+
+def row(name: str, session: str, values: List[float]):
+    print(f"{name:<16}{session:<14}{percentile(values, 0.5) * 1e3:>10.1f}"
+          f"{percentile(values, 0.95) * 1e3:>10.1f}{max(values) * 1e3:>10.1f}")
+
+async def run(args):
+    latency = args.latency / 1000
+
+    async def handle(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({"ok": True, "result": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    with tempfile.TemporaryDirectory() as directory:
+        server_ssl = None if args.no_tls else make_certificate(directory)
+        client_ssl = ssl.create_default_context(cafile=os.path.join(directory, "cert.pem")) if server_ssl else False
+        site = web.TCPSite(runner, "127.0.0.1", args.port, ssl_context=server_ssl)
+        await site.start()
+
+    url = f"{'http' if args.no_tls else 'https'}://127.0.0.1:{args.port}"
+    sessions = {
+        "по умолчанию": AiohttpSession(api=TelegramAPIServer.from_base(url)),
+        "настроенная": TunedAiohttpSession(
+            api_url=url, pool_size=API_POOL_SIZE, keepalive=API_KEEPALIVE,
+            timeout=API_TIMEOUT, method_timeouts=API_METHOD_TIMEOUTS
+        ),
+    }
+    bots = {}
+    for name, session in sessions.items():
+        # Доверяем самоподписанному сертификату сервера
+        session._connector_init["ssl"] = client_ssl
+        bots[name] = Bot(token=BOT_TOKEN, session=session)
+
+    print(f"Задержка сервера: {args.latency:.0f} мс, {'HTTP' if args.no_tls else 'HTTPS'}, "
+          f"пул настроенной сессии: {API_POOL_SIZE}, keep-alive: {API_KEEPALIVE:.0f} с")
+    print(f"{'режим':<16}{'сессия':<14}{'p50, мс':>10}{'p95, мс':>10}{'макс, мс':>10}")
+    try:
+        for name, bot in bots.items():
+            await timed(bot)  # прогрев: первое соединение
+            row("последовательно", name, await sequential(bot))
+        for name, bot in bots.items():
+            started = time.perf_counter()
+            values = await burst(bot, args.burst)
+            row(f"пачка {args.burst}", name, values)
+            print(f"{'':<30}всего {(time.perf_counter() - started) * 1e3:.0f} мс")
+        if args.idle > 0:
+            for bot in bots.values():
+                await burst(bot, 20)
+            await asyncio.sleep(args.idle)
+            for name, bot in bots.items():
+                row(f"после {args.idle:.0f} с", name, await burst(bot, 20))
+    finally:
+        for bot in bots.values():
+            await bot.session.close()
+        await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=20, help="задержка ответа сервера, мс")
+    parser.add_argument("--burst", type=int, default=500, help="запросов в пачке")
+    parser.add_argument("--idle", type=float, default=20, help="пауза перед последним замером, сек (0 - без него)")
+    parser.add_argument("--port", type=int, default=8088, help="порт сервера")
+    parser.add_argument("--no-tls", action="store_true", help="без TLS (например, нет openssl)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
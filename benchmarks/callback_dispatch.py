@@ -0,0 +1,97 @@
+"""Стоимость выбора обработчика callback в зависимости от числа кнопок.
+
+Сравниваются цепочка фильтров F.data == "..." (по одному зарегистрированному
+обработчику на кнопку, как раньше в setup_handlers) и CallbackRouter (один
+обработчик и поиск маршрута в словаре). Обновления проходят через
+dp.feed_update без сети: обработчики ничего не отправляют. Меряется нажатие
+последней зарегистрированной кнопки (худший случай для цепочки) и
+неизвестная кнопка, которую цепочка проверяет целиком. Таблица на неизвестную
+кнопку еще и отвечает (answerCallbackQuery в сессию-заглушку), цепочка -
+оставляет ее без ответа.
+
+Запуск: python benchmarks/callback_dispatch.py [число_кнопок ...]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_FILE", "")
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.base import BaseSession
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import Update
+
+from callbacks import CallbackRouter
+
+ITERATIONS = 500
+
+class ButtonCallback(CallbackData, prefix="b"):
+    name: str
+
+class NullSession(BaseSession):
+    """Сессия без сети: любой запрос к Bot API успешен"""
+
+    async def close(self):
+        pass
+
+    async def make_request(self, bot, method, timeout=None):
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+def make_handler(index: int):
+    async def handler(callback_query):
+        return index
+    handler.__name__ = f"button_{index}"
+    return handler
+
+def filter_chain_dispatcher(buttons: int) -> Dispatcher:
+    dp = Dispatcher()
+    for i in range(buttons):
+        dp.callback_query.register(make_handler(i), F.data == ButtonCallback(name=str(i)).pack())
+    return dp
+
+def router_dispatcher(buttons: int) -> Dispatcher:
+    dp = Dispatcher()
+    router = CallbackRouter()
+    for i in range(buttons):
+        router.register(ButtonCallback, make_handler(i), name=str(i))
+    dp.callback_query.register(router.dispatch, router.match)
+    return dp
+
+def callback_update(data: str) -> Update:
+    sender = {"id": 1, "is_bot": False, "first_name": "User"}
+    return Update.model_validate({
+        "update_id": 1,
+        "callback_query": {"id": "1", "from": sender, "chat_instance": "1", "data": data},
+    })
+
+async def measure(dp: Dispatcher, bot: Bot, update: Update) -> float:
+    for _ in range(100):
+        await dp.feed_update(bot, update)
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / ITERATIONS
+
+async def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [8, 32, 128, 512]
+    bot = Bot(token="123456:benchmark", session=NullSession())
+    print(f"{'кнопок':>8}{'цепочка, мкс':>16}{'таблица, мкс':>16}"
+          f"{'неизв. цепочка':>18}{'неизв. таблица':>18}")
+    for buttons in sizes:
+        last = callback_update(ButtonCallback(name=str(buttons - 1)).pack())
+        unknown = callback_update(ButtonCallback(name="missing").pack())
+        chain, table = filter_chain_dispatcher(buttons), router_dispatcher(buttons)
+        results = [await measure(chain, bot, last), await measure(table, bot, last),
+                   await measure(chain, bot, unknown), await measure(table, bot, unknown)]
+        print(f"{buttons:>8}" + "".join(f"{value * 1e6:>{width}.1f}"
+                                        for value, width in zip(results, (16, 16, 18, 18))))
+    await bot.session.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
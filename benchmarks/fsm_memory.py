@@ -0,0 +1,49 @@
+"""Оценка памяти FSM-состояний при большом числе пользователей.
+
+Запуск: python benchmarks/fsm_memory.py [число_пользователей] [размер_кэша]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteFSMStorage
+from states import OrderState
+
+async def touch_users(storage, users: int):
+    """Проводит каждого пользователя до шага оплаты"""
+    for user_id in range(users):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        await storage.set_state(key, OrderState.payment_processing)
+        await storage.set_data(key, {
+            "selected_plan": "3_months",
+            "spotify_login": f"user{user_id}@example.com:password{user_id}",
+            "payment_url": f"https://payment-gateway.example.com/pay?order_id=ORDER_{user_id:05d}&amount=370",
+        })
+
+async def measure(name: str, storage, users: int):
+    tracemalloc.start()
+    await touch_users(storage, users)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {users:>8} пользователей  память {current / 2**20:8.1f} МБ "
+          f"(пик {peak / 2**20:.1f} МБ, {current / users:.0f} Б/польз.)")
+    await storage.close()
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    cache_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+
+    await measure("MemoryStorage", MemoryStorage(), users)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteFSMStorage(os.path.join(tmp, "fsm.db"), max_size=cache_size)
+        await measure(f"SQLiteFSMStorage (кэш {cache_size})", storage, users)
+
+if __name__ == "__main__":
+    asyncio.run(main())
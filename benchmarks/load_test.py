@@ -0,0 +1,292 @@
+"""Нагрузочный тест: локальный имитатор Telegram Bot API и N пользователей,
+которые одновременно проходят весь сценарий заказа через настоящие
+обработчики (setup_handlers) в режиме polling.
+
+Сценарий пользователя: /start -> "Оформить подписку" -> выбор плана ->
+логин:пароль -> "Я оплатил". Задержка шага - от появления обновления
+в getUpdates до завершения обработчика. Имитатор работает в том же цикле
+событий, что и бот, поэтому абсолютные числа занижены; сравнивать стоит
+прогоны на одной машине.
+
+Запуск: python benchmarks/load_test.py [--users N] [--fsm memory|sqlite]
+        [--orders memory|sqlite] [--rate-limits] [--max-p95-ms МС]
+
+С --max-p95-ms скрипт завершается с кодом 1, если p95 выше порога, и может
+служить проверкой для изменений, влияющих на производительность.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+from callbacks import MenuAction, MenuCallback, PlanCallback
+
+BOT_TOKEN = "123456:load-test"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot"}
+ADMIN_ID = 1
+
+class FakeBotAPI:
+    """Имитатор Bot API: отдает обновления через getUpdates и отвечает на запросы бота"""
+
+    def __init__(self):
+        self.updates: Deque[Dict[str, Any]] = deque()
+        self.has_updates = asyncio.Event()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.messages: Dict[int, Dict[str, Any]] = {}  # chat_id -> последнее сообщение бота
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.handlers = {
+            "getMe": lambda params: BOT_USER,
+            "sendMessage": self.send_message,
+            "sendPhoto": self.send_photo,
+            "editMessageText": self.edit_message,
+            "editMessageCaption": self.edit_message,
+            "editMessageMedia": self.edit_media,
+            "deleteMessage": lambda params: True,
+            "answerCallbackQuery": lambda params: True,
+        }
+
+    # Обновления от пользователей
+
+    def push_update(self, **payload) -> int:
+        update_id = next(self.update_ids)
+        self.updates.append({"update_id": update_id, **payload})
+        self.has_updates.set()
+        return update_id
+
+    async def get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self.has_updates.clear()
+            try:
+                await asyncio.wait_for(self.has_updates.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                return []
+        return list(itertools.islice(self.updates, int(params.get("limit") or 100)))
+
+    # Ответы на запросы бота
+
+    def _message(self, params: Dict[str, Any], **fields) -> Dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": int(params.get("message_id") or next(self.message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+        if params.get("reply_markup"):
+            message["reply_markup"] = json.loads(params["reply_markup"])
+        self.messages[chat_id] = message
+        return message
+
+    def _photo(self, file_id: str) -> List[Dict[str, Any]]:
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 640, "height": 640}]
+
+    def send_message(self, params):
+        return self._message(params, text=params["text"])
+
+    def send_photo(self, params):
+        photo = params["photo"]
+        file_id = photo if isinstance(photo, str) else f"photo-{next(self.file_ids)}"
+        return self._message(params, photo=self._photo(file_id), caption=params.get("caption"))
+
+    def edit_message(self, params):
+        previous = self.messages.get(int(params["chat_id"]), {})
+        if "text" in params:
+            return self._message(params, text=params["text"])
+        return self._message(params, photo=previous.get("photo"), caption=params.get("caption"))
+
+    def edit_media(self, params):
+        media = json.loads(params["media"])
+        return self._message(params, photo=self._photo(media["media"]), caption=media.get("caption"))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        form = await request.post()
+        params = {key: (value if isinstance(value, str) else value.file) for key, value in form.items()}
+        if method == "getUpdates":
+            result = await self.get_updates(params)
+        elif method in self.handlers:
+            result = self.handlers[method](params)
+        else:
+            return web.json_response({"ok": False, "error_code": 400, "description": f"Bad Request: {method}"})
+        return web.json_response({"ok": True, "result": result})
+
+class LoadTest:
+    """Пользователи, проходящие сценарий заказа, и замеры задержек"""
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+        self.pending: Dict[int, asyncio.Future] = {}  # update_id -> завершение обработки
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def track(self, update_id: int) -> asyncio.Future:
+        future = self.pending[update_id] = asyncio.get_running_loop().create_future()
+        return future
+
+    async def done_middleware(self, handler, event, data):
+        """Внешний middleware диспетчера: отмечает конец обработки обновления"""
+        try:
+            return await handler(event, data)
+        finally:
+            future = self.pending.pop(event.update_id, None)
+            if future and not future.done():
+                future.set_result(time.perf_counter())
+
+    async def step(self, name: str, **payload):
+        started = time.perf_counter()
+        future = self.track(self.api.push_update(**payload))
+        finished = await asyncio.wait_for(future, timeout=60)
+        self.latencies[name].append(finished - started)
+
+    async def user(self, user_id: int):
+        sender = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+        chat = {"id": user_id, "type": "private"}
+        message_ids = itertools.count(1)
+
+        def message(text: str) -> Dict[str, Any]:
+            return {"message_id": next(message_ids), "date": int(time.time()), "chat": chat,
+                    "from": sender, "text": text}
+
+        def button(prefix: str) -> str:
+            """callback_data кнопки из последнего сообщения бота - то, что нажал бы пользователь"""
+            keyboard = self.api.messages[user_id]["reply_markup"]["inline_keyboard"]
+            return next(button["callback_data"] for row in keyboard for button in row
+                        if button.get("callback_data", "").startswith(prefix))
+
+        def callback(data: str) -> Dict[str, Any]:
+            return {"id": f"{user_id}-{data}", "from": sender, "chat_instance": str(user_id),
+                    "data": data, "message": self.api.messages[user_id]}
+
+        await self.step("start", message=message("/start"))
+        await self.step("order_subscription", callback_query=callback(MenuCallback(action=MenuAction.ORDER).pack()))
+        await self.step("select_plan", callback_query=callback(button(PlanCallback(plan_id="3_months").pack())))
+        await self.step("spotify_login", message=message(f"user{user_id}@example.com:password{user_id}"))
+        await self.step("payment_completed", callback_query=callback(MenuCallback(action=MenuAction.PAID).pack()))
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def report(test: LoadTest, users: int, elapsed: float):
+    all_latencies = [value for values in test.latencies.values() for value in values]
+    print(f"Пользователей: {users}, обновлений: {len(all_latencies)}, время: {elapsed:.2f} с, "
+          f"пропускная способность: {len(all_latencies) / elapsed:.0f} обновлений/с")
+    print(f"{'шаг':<22}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, values in list(test.latencies.items()) + [("всего", all_latencies)]:
+        print(f"{name:<22}{percentile(values, 0.5) * 1e3:>10.1f}"
+              f"{percentile(values, 0.95) * 1e3:>10.1f}{percentile(values, 0.99) * 1e3:>10.1f}")
+    print("Вызовы Bot API:", ", ".join(f"{method}={count}" for method, count in sorted(test.api.calls.items())))
+    return percentile(all_latencies, 0.95)
+
+async def run(args) -> Optional[float]:
+    # Модули бота читают настройки при импорте
+    from aiogram import Bot
+
+    from logging_setup import setup_logging
+    setup_logging()  # как в bot.py: до загрузки хранилищ
+    from app import create_dispatcher
+    from api_session import create_api_session
+    from config import UPDATE_OFFSET_PATH
+    from polling import OffsetStore, ReliablePolling
+    from sharding import ALLOWED_UPDATES
+    from metrics import metrics, ApiMetricsMiddleware
+    from send_scheduler import send_scheduler
+    from storage import order_storage
+
+    api = FakeBotAPI()
+    app = web.Application(client_max_size=50 * 2**20)  # загрузка изображения меню
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    # Сессия бота с его настройками пула, направленная на имитатор через BOT_API_URL
+    bot = Bot(token=BOT_TOKEN, session=create_api_session())
+    if args.rate_limits:
+        bot.session.middleware(send_scheduler)
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+    # Диспетчер собирается так же, как в боте: FSM, защита от флуда, метрики, обработчики
+    dp, expiry_task = await create_dispatcher()
+
+    test = LoadTest(api)
+    dp.update.outer_middleware(test.done_middleware)
+    # Прием обновлений - как в app.run_bot: с сохранением позиции getUpdates
+    stop_polling = asyncio.Event()
+    polling = asyncio.create_task(ReliablePolling(
+        bot, dp, OffsetStore(UPDATE_OFFSET_PATH), args.concurrency,
+        polling_timeout=1, allowed_updates=ALLOWED_UPDATES
+    ).run(stop_polling))
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(test.user(1000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_polling.set()
+        await polling
+        if expiry_task:
+            expiry_task.cancel()
+        await bot.session.close()
+        await runner.cleanup()
+        order_storage.close()
+
+    completed = sum(1 for order in order_storage.get_all_orders().values() if order.status == "completed")
+    if completed != args.users:
+        print(f"❌ Завершено заказов: {completed} из {args.users}")
+    return report(test, args.users, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="одновременных пользователей")
+    parser.add_argument("--fsm", choices=("memory", "sqlite"), default="memory", help="FSM-хранилище")
+    parser.add_argument("--orders", choices=("memory", "sqlite"), default="memory", help="хранилище заказов")
+    parser.add_argument("--concurrency", type=int, default=100, help="обновлений в обработке одновременно")
+    parser.add_argument("--rate-limits", action="store_true", help="включить планировщик лимитов Telegram")
+    parser.add_argument("--port", type=int, default=8089, help="порт имитатора Bot API")
+    parser.add_argument("--max-p95-ms", type=float, help="порог p95 для проверки")
+    args = parser.parse_args()
+
+    # Бот ищет изображение меню относительно рабочего каталога
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            "LOAD_TEST_DIR": tmp,
+            "BOT_TOKEN": BOT_TOKEN,
+            "ADMIN_ID": str(ADMIN_ID),
+            "ORDER_STORAGE": args.orders,
+            "FSM_STORAGE": args.fsm,
+            "FSM_DB_PATH": os.path.join(tmp, "fsm.db"),
+            "ORDER_DB_PATH": os.path.join(tmp, "orders.db"),
+            "OUTBOX_DB_PATH": os.path.join(tmp, "outbox.db"),
+            "RENEWAL_DB_PATH": os.path.join(tmp, "renewals.db"),
+            "MEDIA_CACHE_PATH": os.path.join(tmp, "media_cache.json"),
+            "UPDATE_OFFSET_PATH": os.path.join(tmp, "update_offset.json"),
+            "BOT_API_URL": f"http://127.0.0.1:{args.port}",
+            "METRICS_PORT": "0",
+            "LOG_FILE": "",
+            "LOG_LEVEL": "WARNING",
+        })
+        p95 = asyncio.run(run(args))
+
+    if args.max_p95_ms is not None and p95 * 1e3 > args.max_p95_ms:
+        print(f"❌ p95 {p95 * 1e3:.1f} мс выше порога {args.max_p95_ms} мс")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Задержки цикла событий при всплеске логов: запись в файл и консоль прямо
+из цикла (как было с basicConfig) против очереди с потоком записи.
+
+Медленный диск (или заблокированная консоль) моделируется паузой на каждую
+запись в файл.
+
+Запуск: python benchmarks/logging_stall.py [число_записей] [пауза_записи_мс]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_setup import build_handlers, setup_logging, stop_logging
+
+logger = logging.getLogger("benchmark")
+
+class SlowFile:
+    """Файл, каждая запись в который занимает latency секунд"""
+
+    def __init__(self, path: str, latency: float):
+        self.file = open(path, "a", encoding="utf-8")
+        self.latency = latency
+
+    def write(self, data: str):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+async def monitor(stalls, stop: asyncio.Event, interval: float = 0.001):
+    """Измеряет, насколько позже запланированного просыпается цикл"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+async def burst(records: int, chunk: int = 50):
+    """Всплеск логов из обработчиков: chunk записей между переключениями задач"""
+    spent = 0.0
+    for i in range(0, records, chunk):
+        started = time.perf_counter()
+        for j in range(i, min(i + chunk, records)):
+            logger.info("Обновлен заказ %s пользователя %s: %s", f"ORDER_{j:05d}", j, "status")
+        spent += time.perf_counter() - started
+        await asyncio.sleep(0)
+    return spent
+
+async def run(records: int):
+    stalls = []
+    stop = asyncio.Event()
+    monitor_task = asyncio.create_task(monitor(stalls, stop))
+    await asyncio.sleep(0.01)
+    spent = await burst(records)
+    stop.set()
+    await monitor_task
+    stalls.sort()
+    return spent, stalls[len(stalls) * 99 // 100], stalls[-1]
+
+def make_handlers(log_file: str, latency: float):
+    """Консоль в /dev/null и файл с заданной задержкой записи"""
+    handlers = build_handlers(log_file, rotation="size")
+    handlers[0].setStream(open(os.devnull, "w"))
+    handlers[1].setStream(SlowFile(log_file, latency))
+    return handlers
+
+def configure_direct(handlers):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+def configure_queued(handlers):
+    setup_logging("INFO", handlers)
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latencies = [float(sys.argv[2]) / 1e3] if len(sys.argv) > 2 else [0.0, 0.0005]
+    print(f"{'диск':<12}{'режим':<10}{'в логгере, мс':>16}{'p99 задержки, мс':>19}{'макс. задержка, мс':>21}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for latency in latencies:
+            disk = f"{latency * 1e3:g} мс/зап"
+            for name, configure in (("напрямую", configure_direct), ("очередь", configure_queued)):
+                handlers = make_handlers(os.path.join(tmp, f"{name}.log"), latency)
+                configure(handlers)
+                spent, p99, worst = asyncio.run(run(records))
+                stop_logging()
+                for handler in handlers:
+                    handler.close()
+                print(f"{disk:<12}{name:<10}{spent * 1e3:>16.1f}{p99 * 1e3:>19.2f}{worst * 1e3:>21.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Сравнение памяти: заказы-словари (старый формат) и записи Order со __slots__.
+
+Запуск: python benchmarks/order_memory.py [число_заказов]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import get_catalog
+from models import Order
+
+SUBSCRIPTION_PLANS = get_catalog().plans
+PLAN_IDS = list(SUBSCRIPTION_PLANS)
+
+def build_dicts(count: int):
+    """Заказы в старом формате: словарь с копией плана и ISO-датами"""
+    orders = {}
+    now = datetime.now().timestamp()
+    for seq in range(1, count + 1):
+        plan_id = PLAN_IDS[seq % len(PLAN_IDS)]
+        orders[seq] = {
+            "order_id": f"ORDER_{seq:05d}",
+            "user_id": 100000000 + seq,
+            "username": f"user{seq}",
+            "first_name": "Иван",
+            "created_at": datetime.fromtimestamp(now + seq).isoformat(),
+            "status": "completed",
+            "subscription_plan": dict(SUBSCRIPTION_PLANS[plan_id]),
+            "spotify_login": f"user{seq}@example.com:password",
+            "payment_url": f"https://payment-gateway.example.com/pay?order_id=ORDER_{seq:05d}&amount=370",
+            "completed_at": datetime.fromtimestamp(now + seq + 60).isoformat(),
+        }
+    return orders
+
+def build_records(count: int):
+    """Заказы в новом формате: Order со ссылкой на план по plan_id"""
+    orders = {}
+    now = datetime.now().timestamp()
+    for seq in range(1, count + 1):
+        plan_id = PLAN_IDS[seq % len(PLAN_IDS)]
+        orders[seq] = Order(
+            seq=seq,
+            user_id=100000000 + seq,
+            username=f"user{seq}",
+            first_name="Иван",
+            created_at=now + seq,
+            status="completed",
+            plan_id=plan_id,
+            price=SUBSCRIPTION_PLANS[plan_id]["price"],
+            spotify_login=f"user{seq}@example.com:password",
+            payment_url=f"https://payment-gateway.example.com/pay?order_id=ORDER_{seq:05d}&amount=370",
+            completed_at=now + seq + 60,
+        )
+    return orders
+
+def measure(name: str, build, count: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    orders = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<34} {current / 2**20:9.1f} МБ  ({current / count:.0f} Б/заказ)")
+    del orders
+    return current
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Заказов: {count}")
+    old = measure("dict + копия плана (старый формат)", build_dicts, count)
+    new = measure("Order со __slots__ + plan_id", build_records, count)
+    print(f"Экономия: {(old - new) / 2**20:.1f} МБ ({100 * (old - new) / old:.0f}%)")
+
+if __name__ == "__main__":
+    main()
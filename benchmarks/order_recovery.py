@@ -0,0 +1,61 @@
+"""Время запуска хранилища ORDER_STORAGE=log в зависимости от истории заказов.
+
+Для каждой длины истории создаются заказы (создание, выбор плана, ввод
+логина); все, кроме последних ACTIVE_ORDERS, брошены и уходят в архив, как
+это делает OrderReaper, из последних оплачена половина.
+Затем хранилище открывается заново: со снимками читается последний снимок
+и хвост журнала, без снимков (snapshot_every больше числа событий) -
+журнал целиком.
+
+Запуск: python benchmarks/order_recovery.py [длина_истории ...]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_FILE", "")
+
+from storage import LogOrderStorage
+
+ACTIVE_ORDERS = 2000  # заказов, которые остаются в памяти
+
+def build_history(directory: str, orders: int, snapshot_every: int):
+    storage = LogOrderStorage(directory, snapshot_every=snapshot_every)
+    for user_id in range(orders):
+        storage.create_order(user_id, {"username": f"user{user_id}", "first_name": "Иван"})
+        storage.update_order(user_id, plan_id="3_months", price=370)
+        storage.update_order(user_id, spotify_login=f"user{user_id}@example.com:password",
+                             status="awaiting_payment")
+        if user_id >= orders - ACTIVE_ORDERS and user_id % 2:
+            storage.complete_order(user_id)
+    expired = storage.expire_orders(float("inf"), max(orders - ACTIVE_ORDERS, 0))
+    storage.purge_orders(expired)
+    storage.close()
+    return len(storage.orders)
+
+def measure(orders: int, snapshot_every: int):
+    with tempfile.TemporaryDirectory() as directory:
+        kept = build_history(directory, orders, snapshot_every)
+        started = time.perf_counter()
+        storage = LogOrderStorage(directory, snapshot_every=snapshot_every)
+        elapsed = time.perf_counter() - started
+        assert len(storage.orders) == kept
+        replayed = storage.log.lsn - storage.log.snapshot_lsn
+        storage.close()
+    return elapsed, replayed, kept
+
+def main():
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 50000, 200000]
+    print(f"{'история':>10}{'в памяти':>10}{'снимки, мс':>14}{'событий':>10}{'без снимков, мс':>18}{'событий':>10}")
+    for orders in sizes:
+        with_snapshots, replayed, kept = measure(orders, 10000)
+        without_snapshots, replayed_all, _ = measure(orders, 10 ** 9)
+        print(f"{orders:>10}{kept:>10}{with_snapshots * 1e3:>14.0f}{replayed:>10}"
+              f"{without_snapshots * 1e3:>18.0f}{replayed_all:>10}")
+
+if __name__ == "__main__":
+    main()
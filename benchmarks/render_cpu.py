@@ -0,0 +1,71 @@
+"""Микробенчмарк CPU на отрисовку экрана в обработчике: сборка на каждое
+обновление (как раньше) против готовых объектов из кэша отрисовки.
+
+Запуск: python benchmarks/render_cpu.py [число_итераций]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.methods import EditMessageText, SendMessage, SendPhoto
+
+from catalog import get_catalog
+from keyboards import get_main_menu_keyboard, get_subscription_keyboard, get_back_to_menu_keyboard
+from render import build_render_cache
+from texts import WELCOME_TEXT, format_subscription_text, format_plan_selected_text
+
+CATALOG = get_catalog()
+SUBSCRIPTION_PLANS = CATALOG.plans
+
+def per_update_main_menu():
+    return SendPhoto(chat_id=1, photo="file_id", caption=WELCOME_TEXT,
+                     reply_markup=get_main_menu_keyboard(), parse_mode="Markdown")
+
+def per_update_subscription():
+    return SendMessage(chat_id=1, text=format_subscription_text(SUBSCRIPTION_PLANS),
+                       reply_markup=get_subscription_keyboard(SUBSCRIPTION_PLANS, CATALOG.version), parse_mode="Markdown")
+
+def per_update_plan_selected():
+    return EditMessageText(chat_id=1, message_id=1, text=format_plan_selected_text(SUBSCRIPTION_PLANS["3_months"]),
+                           reply_markup=get_back_to_menu_keyboard(), parse_mode="Markdown")
+
+cache = build_render_cache(CATALOG)
+
+def cached_main_menu():
+    return SendPhoto(chat_id=1, photo="file_id", caption=WELCOME_TEXT,
+                     reply_markup=cache.main_menu_keyboard, parse_mode="Markdown")
+
+def cached_subscription():
+    return SendMessage(chat_id=1, text=cache.subscription_text,
+                       reply_markup=cache.subscription_keyboard, parse_mode="Markdown")
+
+def cached_plan_selected():
+    return EditMessageText(chat_id=1, message_id=1, text=cache.plan_selected_texts["3_months"],
+                           reply_markup=cache.back_to_menu_keyboard, parse_mode="Markdown")
+
+def cpu_per_call(func, iterations: int) -> float:
+    """CPU-время одного вызова в микросекундах"""
+    for _ in range(iterations // 10):
+        func()
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - started) / iterations * 1e6
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [
+        ("главное меню", per_update_main_menu, cached_main_menu),
+        ("выбор плана", per_update_subscription, cached_subscription),
+        ("план выбран", per_update_plan_selected, cached_plan_selected),
+    ]
+    print(f"{'экран':<16}{'сборка, мкс':>14}{'кэш, мкс':>12}{'ускорение':>12}")
+    for name, before, after in cases:
+        t_before = cpu_per_call(before, iterations)
+        t_after = cpu_per_call(after, iterations)
+        print(f"{name:<16}{t_before:>14.1f}{t_after:>12.1f}{t_before / t_after:>11.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Расписание напоминаний о продлении в зависимости от числа подписок.
+
+Создаются оплаченные заказы с датой оплаты в пределах последнего года и
+случайным планом. Меряется сборка кучи при запуске (RenewalScheduler.rebuild):
+первый запуск считает окончание всех подписок, повторный читает его из
+таблицы. И поиск напоминаний, которые пора отправить: в куче - взгляд на
+вершину, при периодическом обходе - расчет окончания каждой подписки.
+
+Запуск: python benchmarks/renewal_schedule.py [число_подписок ...]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_FILE", "")
+
+from catalog import get_catalog
+from storage import OrderStorage
+from renewals import RenewalScheduler, subscription_expiry
+
+YEAR = 365 * 24 * 3600
+REMIND_BEFORE = 3 * 24 * 3600
+
+def build_storage(subscriptions: int) -> OrderStorage:
+    storage = OrderStorage()
+    plans = list(get_catalog().plans.items())
+    now = time.time()
+    for user_id in range(subscriptions):
+        plan_id, plan = random.choice(plans)
+        storage.create_order(user_id, {"username": f"user{user_id}", "first_name": "Иван"})
+        storage.update_order(user_id, plan_id=plan_id, price=plan["price"], status="awaiting_payment")
+        storage.complete_order(user_id)
+        storage.get_order(user_id).completed_at = now - random.random() * YEAR
+    return storage
+
+def full_scan(storage: OrderStorage, now: float) -> int:
+    """Что делал бы периодический обход: окончание каждой подписки"""
+    due = 0
+    for order in storage.get_orders_by_status("completed"):
+        expires_at = subscription_expiry(order)
+        if expires_at and now < expires_at <= now + REMIND_BEFORE:
+            due += 1
+    return due
+
+def close(scheduler: RenewalScheduler):
+    """Дожидается записи таблицы без цикла событий"""
+    scheduler._executor.shutdown(wait=True)
+    scheduler._conn.close()
+
+def main():
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 300000]
+    print(f"{'подписок':>10}{'в куче':>10}{'первый запуск, мс':>19}{'перезапуск, мс':>16}"
+          f"{'вершина, мкс':>14}{'обход, мс':>12}")
+    for subscriptions in sizes:
+        storage = build_storage(subscriptions)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "renewals.db")
+            scheduler = RenewalScheduler(storage, path, REMIND_BEFORE)
+            started = time.perf_counter()
+            scheduler.rebuild()
+            first_start = time.perf_counter() - started
+            close(scheduler)
+
+            scheduler = RenewalScheduler(storage, path, REMIND_BEFORE)
+            started = time.perf_counter()
+            scheduled = scheduler.rebuild()
+            restart = time.perf_counter() - started
+
+            now = time.time()
+            started = time.perf_counter()
+            for _ in range(1000):
+                scheduler._pop_due(0)
+            peek = (time.perf_counter() - started) / 1000
+
+            started = time.perf_counter()
+            full_scan(storage, now)
+            scan = time.perf_counter() - started
+            close(scheduler)
+        print(f"{subscriptions:>10}{scheduled:>10}{first_start * 1e3:>19.0f}{restart * 1e3:>16.0f}"
+              f"{peek * 1e6:>14.2f}{scan * 1e3:>12.0f}")
+
+if __name__ == "__main__":
+    main()
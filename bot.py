@@ -1,101 +1,23 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.filters import Command, StateFilter
-from aiogram import F
 
-from config import BOT_TOKEN, ADMIN_ID
-from handlers import (
-    cmd_start, handle_order_subscription, handle_support, handle_faq, handle_back_to_menu,
-    process_plan_selection, process_spotify_login, process_payment_completed, 
-    process_start_over, handle_unknown_message, cmd_admin_orders
+from config import (
+    BOT_TOKEN, ADMIN_ID, BOT_MODE, WEBHOOK_URL, WORKERS, PAYMENT_PROVIDER, PAYMENT_SECRET
 )
-from states import OrderState
+from logging_setup import setup_logging, stop_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
-
-logger = logging.getLogger(__name__)
+# Настройка логирования до импорта модулей, которые пишут в лог при загрузке
+# (хранилища восстанавливают данные с диска)
+setup_logging()
 
-async def setup_handlers(dp: Dispatcher):
-    """Регистрация обработчиков"""
-    
-    # Команды
-    dp.message.register(cmd_start, Command("start"))
-    dp.message.register(cmd_admin_orders, Command("orders"))
-    
-    # Callback-обработчики главного меню
-    dp.callback_query.register(
-        handle_order_subscription,
-        F.data == "order_subscription"
-    )
-    
-    dp.callback_query.register(
-        handle_support,
-        F.data == "support"
-    )
-    
-    dp.callback_query.register(
-        handle_faq,
-        F.data == "faq"
-    )
-    
-    dp.callback_query.register(
-        handle_back_to_menu,
-        F.data == "back_to_menu"
-    )
-    
-    # Callback-обработчики заказа
-    dp.callback_query.register(
-        process_plan_selection,
-        F.data.startswith("select_plan_"),
-        OrderState.choosing_subscription
-    )
-    
-    dp.callback_query.register(
-        process_payment_completed,
-        F.data == "payment_completed",
-        OrderState.payment_processing
-    )
-    
-    dp.callback_query.register(
-        process_start_over,
-        F.data == "start_over"
-    )
-    
-    # Обработчики текстовых сообщений по состояниям
-    dp.message.register(
-        process_spotify_login,
-        OrderState.entering_spotify_login
-    )
-    
-    # Обработчик неизвестных сообщений
-    dp.message.register(handle_unknown_message)
+from ingest import run_ingest
 
-async def on_startup(bot: Bot):
-    """Действия при запуске бота"""
-    logger.info("Бот запущен и готов к работе!")
-    
-    # Уведомляем администратора о запуске
-    try:
-        await bot.send_message(
-            ADMIN_ID,
-            "🤖 Бот Spotify Family запущен и готов к приему заказов!"
-        )
-    except Exception as e:
-        logger.error(f"Не удалось отправить уведомление администратору: {e}")
+logger = logging.getLogger(__name__)
 
-async def on_shutdown(bot: Bot):
-    """Действия при остановке бота"""
-    logger.info("Бот остановлен")
+def run_worker(update_queue, acks, flushing):
+    """Точка входа процесса-обработчика шарда (модуль бота импортируется только в нем)"""
+    from app import run_worker
+    run_worker(update_queue, acks, flushing)
 
 async def main():
     """Главная функция запуска бота"""
@@ -106,26 +28,26 @@ async def main():
         logger.error("❌ Не установлен токен бота! Установите переменную окружения BOT_TOKEN")
         return
     
-    if ADMIN_ID == "123456789":
-        logger.warning("⚠️ Не установлен ID администратора! Установите переменную окружения ADMIN_ID")
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        logger.error("❌ Не задан WEBHOOK_URL для режима webhook")
+        return
     
-    # Создаем бота и диспетчер
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    if PAYMENT_PROVIDER == "fake" and not PAYMENT_SECRET:
+        # Без ключа подпись уведомления может сделать кто угодно
+        logger.error("❌ Не задан PAYMENT_SECRET для PAYMENT_PROVIDER=fake")
+        return
     
-    # Регистрируем обработчики
-    await setup_handlers(dp)
+    if ADMIN_ID == "123456789":
+        logger.warning("⚠️ Не установлен ID администратора! Установите переменную окружения ADMIN_ID")
     
-    # Запускаем бота
-    logger.info("Запуск бота...")
-    await on_startup(bot)
+    if WORKERS > 0:
+        # Процесс приема не открывает хранилища: они есть только у обработчиков
+        logger.info("Запуск бота с %d процессами-обработчиками...", WORKERS)
+        await run_ingest(run_worker)
+        return
     
-    try:
-        await dp.start_polling(bot, skip_updates=True)
-    finally:
-        await on_shutdown(bot)
-        await bot.session.close()
+    from app import run_bot
+    await run_bot()
 
 if __name__ == '__main__':
     try:
@@ -133,4 +55,6 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
-        logger.error(f"Критическая ошибка: {e}")
+        logger.exception("Критическая ошибка: %s", e)
+    finally:
+        stop_logging()
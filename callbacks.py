@@ -0,0 +1,128 @@
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, Literal, Optional, Tuple, Type
+
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+from texts import STALE_CALLBACK_TEXT
+
+logger = logging.getLogger(__name__)
+
+# Фабрики callback_data: короткий префикс и типизированные поля ("m:order", "p:3_months:1a2b3c4d")
+
+class MenuAction(str, Enum):
+    ORDER = "order"
+    SUPPORT = "support"
+    FAQ = "faq"
+    BACK = "back"
+    START_OVER = "restart"
+    PAID = "paid"
+
+class MenuCallback(CallbackData, prefix="m"):
+    """Кнопки меню и шагов заказа"""
+    action: MenuAction
+
+class PlanCallback(CallbackData, prefix="p"):
+    """Выбор плана подписки из клавиатуры версии каталога version"""
+    plan_id: str
+    version: str = ""
+
+class OrdersPageCallback(CallbackData, prefix="o"):
+    """Страница списка заказов администратора (курсор и фильтры)"""
+    direction: Literal["p", "n"]  # p - более новые, n - более старые
+    cursor: int
+    status: str = ""
+    plan_id: str = ""
+    date_from: str = ""  # ГГГГММДД
+    date_to: str = ""
+
+@dataclass(frozen=True)
+class CallbackRoute:
+    """Обработчик callback и условия, при которых кнопка еще действует"""
+    handler: CallableObject
+    name: str
+    state: Optional[str] = None  # требуемое состояние FSM
+    validate: Optional[Callable[[Any], bool]] = None  # проверка разобранных данных
+
+class CallbackRouter:
+    """Таблица маршрутов callback: префикс и ключевое поле -> обработчик.
+
+    Вместо цепочки фильтров F.data == "..." диспетчер вызывает один
+    обработчик, а маршрут находится поиском в словаре. Данные разбираются
+    фабрикой CallbackData; неизвестные, поврежденные и устаревшие (не в том
+    состоянии FSM, план из прошлой версии каталога) нажатия отклоняются до вызова
+    обработчика маршрута.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Type[CallbackData]] = {}
+        self._key_fields: Dict[str, Optional[str]] = {}
+        self._routes: Dict[Tuple[str, Any], CallbackRoute] = {}
+        self.rejected = 0
+
+    def register(self, factory: Type[CallbackData], handler: Callable, state: Optional[State] = None,
+                 validate: Optional[Callable[[Any], bool]] = None, **key: Any):
+        """Добавляет маршрут; key - значение ключевого поля фабрики (например, action=MenuAction.FAQ)"""
+        prefix = factory.__prefix__
+        if len(key) > 1:
+            raise ValueError(f"Маршрут {handler.__name__}: допускается одно ключевое поле")
+        field, value = next(iter(key.items())) if key else (None, None)
+        if self._key_fields.setdefault(prefix, field) != field:
+            raise ValueError(f"У фабрики {factory.__name__} уже другое ключевое поле: {self._key_fields[prefix]}")
+        if (prefix, value) in self._routes:
+            raise ValueError(f"Маршрут {prefix}:{value} уже зарегистрирован")
+        self._factories[prefix] = factory
+        self._routes[(prefix, value)] = CallbackRoute(
+            CallableObject(handler), handler.__name__, state.state if state else None, validate
+        )
+
+    def resolve(self, data: str, raw_state: Optional[str]) -> Tuple[Optional[CallbackRoute], Optional[CallbackData]]:
+        """Находит маршрут для callback_data; (None, None), если нажатие нужно отклонить"""
+        prefix = data.split(":", 1)[0]
+        factory = self._factories.get(prefix)
+        if factory is None:
+            return None, None
+        try:
+            parsed = factory.unpack(data)
+        except (ValueError, TypeError):
+            # Лишние или недостающие поля, неверные типы и значения
+            return None, None
+        field = self._key_fields[prefix]
+        route = self._routes.get((prefix, getattr(parsed, field) if field else None))
+        if route is None:
+            return None, None
+        if route.state is not None and raw_state != route.state:
+            return None, None
+        if route.validate is not None and not route.validate(parsed):
+            return None, None
+        return route, parsed
+
+    async def match(self, callback_query: CallbackQuery, raw_state: Optional[str] = None) -> Dict[str, Any]:
+        """Фильтр диспетчера: передает маршрут обработчику dispatch.
+
+        handler_name попадает в данные обновления, поэтому метрики считают
+        время по обработчикам маршрутов, а не по dispatch.
+        """
+        route, parsed = self.resolve(callback_query.data or "", raw_state)
+        return {
+            "callback_route": route,
+            "callback_data": parsed,
+            "handler_name": route.name if route else "rejected_callback",
+        }
+
+    async def dispatch(self, callback_query: CallbackQuery, callback_route: Optional[CallbackRoute],
+                       **data: Any) -> Any:
+        """Единственный обработчик callback: вызывает обработчик маршрута"""
+        if callback_route is None:
+            self.rejected += 1
+            logger.debug("Отклонен callback %r", callback_query.data)
+            await callback_query.answer(STALE_CALLBACK_TEXT)
+            return None
+        return await callback_route.handler.call(callback_query, **data)
+
+    def stats(self) -> Dict[str, float]:
+        return {"routes": len(self._routes), "rejected": self.rejected}
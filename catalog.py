@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from config import PLANS_PATH, PLANS_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# id плана попадает в callback_data (до 64 байт), поэтому короткий и без разделителя ":".
+# Самая длинная кнопка - страница /orders: курсор до 10 цифр, статус и обе даты
+# оставляют плану 14 байт
+PLAN_ID_PATTERN = re.compile(r"[A-Za-z0-9_]{1,14}")
+
+Plan = Mapping[str, Any]
+
+@dataclass(frozen=True)
+class PlanCatalog:
+    """Версия каталога планов.
+
+    plans - планы, которые предлагаются пользователям, в порядке файла;
+    known - они же и архивные ("archived": true) и удаленные из файла
+    после запуска: по ним показываются и продлеваются старые заказы.
+    version - хеш содержимого файла, одинаковый во всех процессах и после
+    перезапуска. Объект не меняется: обновление каталога - замена ссылки.
+    """
+    version: str
+    plans: Mapping[str, Plan]
+    known: Mapping[str, Plan]
+
+    def is_current(self, plan_id: str, version: str) -> bool:
+        """Кнопка плана из клавиатуры этой версии и план еще продается"""
+        return version == self.version and plan_id in self.plans
+
+def _parse_plan(plan_id: str, data: Any) -> Tuple[Plan, bool]:
+    if not PLAN_ID_PATTERN.fullmatch(plan_id):
+        raise ValueError(f"Недопустимый id плана: {plan_id!r}")
+    if not isinstance(data, dict):
+        raise ValueError(f"План {plan_id}: ожидается объект")
+    name, price, months = data.get("name"), data.get("price"), data.get("months")
+    if not isinstance(name, str) or not name:
+        raise ValueError(f"План {plan_id}: нет названия")
+    for field, value in (("price", price), ("months", months)):
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise ValueError(f"План {plan_id}: {field} должно быть целым положительным числом")
+    plan = {"name": name, "price": price, "duration": data.get("duration") or name, "months": months}
+    return MappingProxyType(plan), bool(data.get("archived"))
+
+def parse_catalog(raw: bytes, previous: Optional[PlanCatalog] = None) -> PlanCatalog:
+    """Разбирает и проверяет файл каталога; ValueError - файл не годится"""
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"Файл каталога - не JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("Файл каталога: ожидается объект {id плана: план}")
+    plans: Dict[str, Plan] = {}
+    known: Dict[str, Plan] = {}
+    for plan_id, plan_data in data.items():
+        plan, archived = _parse_plan(plan_id, plan_data)
+        known[plan_id] = plan
+        if not archived:
+            plans[plan_id] = plan
+    if not plans:
+        raise ValueError("В каталоге нет ни одного продаваемого плана")
+    if previous:
+        # Удаленный из файла план остается известным до перезапуска: по нему еще идут заказы
+        for plan_id, plan in previous.known.items():
+            known.setdefault(plan_id, plan)
+    return PlanCatalog(
+        version=hashlib.sha256(raw).hexdigest()[:8],
+        plans=MappingProxyType(plans),
+        known=MappingProxyType(known)
+    )
+
+def load_catalog(path: str, previous: Optional[PlanCatalog] = None) -> PlanCatalog:
+    with open(path, "rb") as f:
+        return parse_catalog(f.read(), previous)
+
+_catalog = load_catalog(PLANS_PATH)
+
+def get_catalog() -> PlanCatalog:
+    """Текущая версия каталога; обработчик берет ее один раз и работает с ней до конца"""
+    return _catalog
+
+def set_catalog(catalog: PlanCatalog):
+    global _catalog
+    _catalog = catalog
+
+class CatalogWatcher:
+    """Следит за файлом каталога и подменяет каталог при изменении.
+
+    Раз в interval секунд сверяет время изменения и размер файла. Новый
+    файл сначала разбирается целиком: с ошибкой он не применяется, и бот
+    продолжает работать со старой версией. Заказы хранят цену, которую
+    видел пользователь, поэтому смена цен их не затрагивает.
+    """
+
+    def __init__(self, path: str, interval: float = 5):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self.errors = 0
+        self._signature = self._stat()
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> Dict[str, float]:
+        return {"plans": len(get_catalog().plans), "reloads": self.reloads, "errors": self.errors}
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """Перечитывает файл, если он изменился; True - каталог заменен"""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        current = get_catalog()
+        try:
+            catalog = load_catalog(self.path, current)
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            logger.error("Каталог планов не обновлен, остается версия %s: %s", current.version, e)
+            return False
+        if catalog.version == current.version:
+            return False
+        set_catalog(catalog)
+        self.reloads += 1
+        logger.info("Каталог планов обновлен: версия %s -> %s, планов в продаже: %d",
+                    current.version, catalog.version, len(catalog.plans))
+        return True
+
+    async def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Запускает слежение (interval=0 - каталог читается только при запуске)"""
+        if self.interval > 0:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+# Глобальное слежение за файлом каталога
+catalog_watcher = CatalogWatcher(PLANS_PATH, PLANS_RELOAD_INTERVAL)
@@ -1,36 +1,153 @@
 import os
-import logging
 
 # Конфигурация бота
 BOT_TOKEN = os.getenv("BOT_TOKEN", "your_bot_token_here")
 ADMIN_ID = os.getenv("ADMIN_ID", "123456789")  # ID администратора для уведомлений
 
-# Варианты подписок
-SUBSCRIPTION_PLANS = {
-    "1_month": {
-        "name": "1 месяц",
-        "price": 150,
-        "duration": "1 месяц"
-    },
-    "3_months": {
-        "name": "3 месяца", 
-        "price": 370,
-        "duration": "3 месяца"
-    },
-    "6_months": {
-        "name": "6 месяцев",
-        "price": 690,
-        "duration": "6 месяцев"
-    },
-    "12_months": {
-        "name": "12 месяцев",
-        "price": 1300,
-        "duration": "12 месяцев"
-    }
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "100"))  # обновлений в обработке одновременно
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))  # сек ожидания в одном запросе getUpdates
+UPDATE_OFFSET_PATH = os.getenv("UPDATE_OFFSET_PATH", "update_offset.json")  # позиция getUpdates между запусками
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))  # сек на доработку обновлений при остановке
+
+# Процессы-обработчики: при WORKERS > 0 основной процесс только принимает обновления
+# и раздает их WORKERS процессам по хешу id пользователя
+WORKERS = int(os.getenv("WORKERS", "0"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))  # обновлений в очереди одного обработчика
+SHARD_ID = int(os.environ["SHARD_ID"]) if os.getenv("SHARD_ID") else None  # задается процессом приема
+if SHARD_ID is not None and not 0 <= SHARD_ID < WORKERS:
+    # Номер шарда имеет смысл только вместе с числом обработчиков (от него зависят лимиты и файлы шардов)
+    raise ValueError(f"SHARD_ID={SHARD_ID} требует WORKERS больше {SHARD_ID}, задано WORKERS={WORKERS}")
+
+def shard_path(path: str, shard=SHARD_ID) -> str:
+    """Файл шарда (orders.db -> orders.shard1.db); вне обработчиков - сам path"""
+    if shard is None or not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard}{ext}"
+
+# Вебхук (для BOT_MODE=webhook)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # соединений от Telegram
+
+# Соединения с Bot API (пул на процесс)
+# Свой сервер Bot API, например локальный telegram-bot-api с --http-port=8181: http://127.0.0.1:8181
+# (его порт по умолчанию 8081 и следующие заняты PAYMENT_WEBHOOK_PORT); пусто - api.telegram.org
+BOT_API_URL = os.getenv("BOT_API_URL", "")
+BOT_API_LOCAL = os.getenv("BOT_API_LOCAL", "") == "1"  # сервер запущен с --local (файлы по пути на диске)
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "100"))  # соединений одновременно
+API_KEEPALIVE = float(os.getenv("API_KEEPALIVE", "60"))  # сек жизни простаивающего соединения
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))  # сек на запрос; у getUpdates - сверх времени опроса
+# Таймауты отдельных методов: "метод=сек,..."
+API_METHOD_TIMEOUTS = {
+    method.strip(): float(seconds)
+    for method, seconds in (
+        item.split("=", 1) for item in os.getenv(
+            "API_METHOD_TIMEOUTS", "answerCallbackQuery=10,sendPhoto=60,sendDocument=120"
+        ).split(",") if item.strip()
+    )
 }
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Защита от повторных нажатий и флуда входящими обновлениями
+ANTIFLOOD_DEBOUNCE = float(os.getenv("ANTIFLOOD_DEBOUNCE", "1"))  # сек, повтор того же callback отбрасывается
+ANTIFLOOD_RATE = float(os.getenv("ANTIFLOOD_RATE", "2"))  # обновлений в секунду от одного пользователя
+ANTIFLOOD_BURST = float(os.getenv("ANTIFLOOD_BURST", "5"))  # допустимая пачка обновлений от пользователя
+
+# Лимиты исходящих сообщений (ограничения Telegram Bot API)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))  # сообщений в секунду всего
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))  # сообщений в секунду в один чат
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))  # допустимая пачка сообщений в один чат
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "2"))  # повторов после RetryAfter
+if SHARD_ID is not None:
+    # Общий лимит Telegram делится между обработчиками; лимит на чат остается - чат живет в одном шарде
+    SEND_GLOBAL_RATE /= WORKERS
+
+# Медиа
+MAIN_MENU_IMAGE = "spotify_image.png"
+MEDIA_CACHE_PATH = shard_path(os.getenv("MEDIA_CACHE_PATH", "media_cache.json"))  # file_id загруженных файлов
+
+# Хранилище заказов: "memory" (по умолчанию), "sqlite" или "log" (журнал событий)
+ORDER_STORAGE = os.getenv("ORDER_STORAGE", "memory")
+ORDER_DB_PATH = shard_path(os.getenv("ORDER_DB_PATH", "orders.db"))
+# Базы заказов всех шардов - для сводных отчетов администратора
+ORDER_SHARD_DB_PATHS = [shard_path(os.getenv("ORDER_DB_PATH", "orders.db"), shard) for shard in range(WORKERS)]
+ORDER_WRITE_BATCH_SIZE = int(os.getenv("ORDER_WRITE_BATCH_SIZE", "500"))  # максимум заказов в одной транзакции
+ORDER_WRITE_INTERVAL = float(os.getenv("ORDER_WRITE_INTERVAL", "0.05"))  # сек, окно накопления пачки
+ORDER_TTL = float(os.getenv("ORDER_TTL", str(48 * 3600)))  # сек до переноса неоплаченного заказа в архив; 0 - никогда
+ORDER_REAP_INTERVAL = float(os.getenv("ORDER_REAP_INTERVAL", "600"))  # сек между проходами очистки
+ORDER_ARCHIVE_DIR = shard_path(os.getenv("ORDER_ARCHIVE_DIR", "order_archive"))  # сжатые сегменты архива
+ORDER_ARCHIVE_SEGMENT_BYTES = int(os.getenv("ORDER_ARCHIVE_SEGMENT_BYTES", str(16 * 1024 * 1024)))  # размер сегмента
+# Журнал событий заказов (для ORDER_STORAGE=log)
+ORDER_LOG_DIR = shard_path(os.getenv("ORDER_LOG_DIR", "order_log"))  # сегменты журнала и снимки
+ORDER_LOG_SEGMENT_BYTES = int(os.getenv("ORDER_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))  # размер сегмента
+ORDER_SNAPSHOT_EVENTS = int(os.getenv("ORDER_SNAPSHOT_EVENTS", "10000"))  # событий между снимками
+
+# FSM-хранилище: "sqlite" или "memory". По умолчанию - как у заказов: состояние
+# "ввод логина" или "ожидание оплаты" не должно переживать перезапуск без своего заказа
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory" if ORDER_STORAGE == "memory" else "sqlite")
+FSM_DB_PATH = shard_path(os.getenv("FSM_DB_PATH", "fsm.db"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))  # сессий в памяти
+FSM_TTL = float(os.getenv("FSM_TTL", str(24 * 3600)))  # сек простоя до сброса сессии
+FSM_EXPIRY_INTERVAL = float(os.getenv("FSM_EXPIRY_INTERVAL", "600"))  # сек между очистками
+
+# Очередь уведомлений администратору
+OUTBOX_DB_PATH = shard_path(os.getenv("OUTBOX_DB_PATH", "outbox.db"))
+OUTBOX_DIGEST_WINDOW = float(os.getenv("OUTBOX_DIGEST_WINDOW", "2"))  # сек, окно объединения в сводку
+OUTBOX_DIGEST_MAX = int(os.getenv("OUTBOX_DIGEST_MAX", "10"))  # уведомлений в одной сводке
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))  # сек, максимальная пауза между попытками
+
+# Оплата: "manual" - заказ завершается кнопкой "Я оплатил", "fake" - локальный провайдер (fake_provider.py)
+PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "manual")
+PAYMENT_API_URL = os.getenv("PAYMENT_API_URL", "http://127.0.0.1:8090")  # API провайдера
+PAYMENT_SECRET = os.getenv("PAYMENT_SECRET", "")  # ключ API и подписи уведомлений
+# Только локальные уведомления; для провайдера снаружи - "0.0.0.0" или адрес за прокси
+PAYMENT_WEBHOOK_HOST = os.getenv("PAYMENT_WEBHOOK_HOST", "127.0.0.1")
+PAYMENT_WEBHOOK_PORT = int(os.getenv("PAYMENT_WEBHOOK_PORT", "8081"))
+if SHARD_ID is not None:
+    # Уведомления о заказах шарда принимает его обработчик: 8082, 8083, ...
+    PAYMENT_WEBHOOK_PORT += SHARD_ID + 1
+PAYMENT_WEBHOOK_PATH = os.getenv("PAYMENT_WEBHOOK_PATH", "/payments/webhook")
+# Адрес, по которому провайдер присылает уведомления (без пути)
+PAYMENT_NOTIFY_URL = os.getenv("PAYMENT_NOTIFY_URL") or f"http://127.0.0.1:{PAYMENT_WEBHOOK_PORT}"
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "60"))  # сек между сверками с провайдером, 0 - выключена
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "100"))  # заказов в одном запросе статусов
+RECONCILE_MIN_AGE = float(os.getenv("RECONCILE_MIN_AGE", "120"))  # сек, более новые заказы ждут уведомления
+# сек, дольше которых открытый платеж не держит заказ от переноса в архив; 0 - без ограничения
+PAYMENT_HOLD_MAX_AGE = float(os.getenv("PAYMENT_HOLD_MAX_AGE", str(7 * 24 * 3600)))
+
+# Напоминания о продлении подписки
+RENEWAL_REMIND_BEFORE = float(os.getenv("RENEWAL_REMIND_BEFORE", str(3 * 24 * 3600)))  # сек до окончания, 0 - выключены
+RENEWAL_DB_PATH = shard_path(os.getenv("RENEWAL_DB_PATH", "renewals.db"))  # отметки об отправленных напоминаниях
+RENEWAL_RETRY_DELAY = float(os.getenv("RENEWAL_RETRY_DELAY", "600"))  # сек до повтора после ошибки сети
+RENEWAL_SEND_CONCURRENCY = int(os.getenv("RENEWAL_SEND_CONCURRENCY", "10"))  # напоминаний в отправке одновременно
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = shard_path(os.getenv("LOG_FILE", "bot.log"))  # пустая строка - только консоль
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" или "json"
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")  # "size" или "time"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # размер файла для LOG_ROTATION=size
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # период для LOG_ROTATION=time
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))  # старых файлов хранить
+
+# Метрики в формате Prometheus (GET /metrics); METRICS_PORT=0 отключает сервер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+if METRICS_PORT and SHARD_ID is not None:
+    # Каждый обработчик отдает метрики на своем порту: 9101, 9102, ...
+    METRICS_PORT += SHARD_ID + 1
+
+# Администрирование
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "10"))  # заказов на странице /orders
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))  # заказов, выбираемых за один шаг /export
+EXPORT_DIR = os.getenv("EXPORT_DIR") or None  # каталог временных файлов выгрузки (по умолчанию системный)
+
+# Каталог планов подписки: JSON-файл {id плана: {"name", "price", "duration", "months"}}.
+# Файл перечитывается при изменении; "archived": true снимает план с продажи, не ломая старые заказы
+PLANS_PATH = os.getenv("PLANS_PATH", "plans.json")
+PLANS_RELOAD_INTERVAL = float(os.getenv("PLANS_RELOAD_INTERVAL", "5"))  # сек между проверками файла, 0 - не следить
@@ -0,0 +1,12 @@
+import sqlite3
+
+def connect(path: str) -> sqlite3.Connection:
+    """Открывает встроенную базу SQLite в режиме WAL"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def connect_readonly(path: str) -> sqlite3.Connection:
+    """Открывает базу другого процесса только для чтения"""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
@@ -0,0 +1,139 @@
+"""Локальный платежный провайдер для проверки оплаты без сети.
+
+Отдает API, которым пользуется FakePaymentProvider: создание платежа,
+пакетный запрос статусов и подписанные уведомления об оплате на notify_url
+платежа. Страница оплаты /pay/<payment_id> - форма с одной кнопкой.
+
+Запуск: python fake_provider.py [--port 8090] [--secret КЛЮЧ] [--public-url URL]
+        [--drop-webhooks ДОЛЯ]
+
+С --drop-webhooks часть уведомлений не отправляется - так проверяется сверка
+(RECONCILE_INTERVAL). В боте: PAYMENT_PROVIDER=fake, PAYMENT_API_URL и
+PAYMENT_SECRET - те же, что здесь.
+"""
+import argparse
+import asyncio
+import html
+import json
+import logging
+import random
+from typing import Any, Dict, Optional, Set
+
+import aiohttp
+from aiohttp import web
+
+from payments import PAYMENT_PAID, PAYMENT_PENDING, SIGNATURE_HEADER, sign
+
+logger = logging.getLogger("fake_provider")
+
+MAX_STATUS_BATCH = 100
+
+class FakeProvider:
+    """Платежи в памяти и доставка уведомлений с повторами"""
+
+    def __init__(self, secret: str, public_url: str, drop_webhooks: float = 0.0):
+        self.secret = secret
+        self.public_url = public_url.rstrip("/")
+        self.drop_webhooks = drop_webhooks
+        self.payments: Dict[str, Dict[str, Any]] = {}  # payment_id -> платеж
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._deliveries: Set[asyncio.Task] = set()
+
+    def _authorized(self, request: web.Request) -> bool:
+        return request.headers.get("Authorization") == f"Bearer {self.secret}"
+
+    async def create_payment(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        data = await request.json()
+        payment_id = data["payment_id"]
+        if payment_id in self.payments:
+            return web.Response(status=409, text="Платеж с таким ключом уже есть")
+        self.payments[payment_id] = {"status": PAYMENT_PENDING, "amount": data["amount"], "notify_url": data["notify_url"]}
+        return web.json_response({"url": f"{self.public_url}/pay/{payment_id}"})
+
+    async def get_statuses(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        payment_ids = (await request.json())["payment_ids"]
+        if len(payment_ids) > MAX_STATUS_BATCH:
+            return web.Response(status=400, text=f"Не больше {MAX_STATUS_BATCH} платежей в запросе")
+        return web.json_response({"payments": {
+            payment_id: {"status": self.payments[payment_id]["status"], "amount": self.payments[payment_id]["amount"]}
+            for payment_id in payment_ids if payment_id in self.payments
+        }})
+
+    async def payment_page(self, request: web.Request) -> web.Response:
+        payment_id = request.match_info["payment_id"]
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return web.Response(status=404, text="Платеж не найден")
+        title = html.escape(f"Платеж {payment_id}: {payment['amount']} ₽")
+        if payment["status"] == PAYMENT_PAID:
+            body = f"<h1>{title}</h1><p>Оплачено</p>"
+        else:
+            body = f'<h1>{title}</h1><form method="post"><button>Оплатить</button></form>'
+        return web.Response(text=f"<!doctype html><meta charset=utf-8>{body}", content_type="text/html")
+
+    async def pay(self, request: web.Request) -> web.Response:
+        payment_id = request.match_info["payment_id"]
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return web.Response(status=404, text="Платеж не найден")
+        if payment["status"] != PAYMENT_PAID:
+            payment["status"] = PAYMENT_PAID
+            logger.info("Платеж %s оплачен", payment_id)
+            if random.random() >= self.drop_webhooks:
+                task = asyncio.create_task(self._deliver(payment_id, payment))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+            else:
+                logger.info("Уведомление по платежу %s не отправляется (--drop-webhooks)", payment_id)
+        raise web.HTTPSeeOther(f"/pay/{payment_id}")
+
+    async def _deliver(self, payment_id: str, payment: Dict[str, Any], attempts: int = 8):
+        """Отправляет подписанное уведомление, повторяя до ответа 200"""
+        body = json.dumps({"payment_id": payment_id, "status": payment["status"], "amount": payment["amount"]}).encode()
+        headers = {SIGNATURE_HEADER: sign(self.secret, body), "Content-Type": "application/json"}
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        for attempt in range(attempts):
+            try:
+                async with self._session.post(payment["notify_url"], data=body, headers=headers) as response:
+                    if response.status == 200:
+                        return
+                    logger.warning("Уведомление по платежу %s: ответ %s", payment_id, response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Уведомление по платежу %s не доставлено: %s", payment_id, e)
+            await asyncio.sleep(2 ** attempt)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/payments", self.create_payment)
+        app.router.add_post("/api/payments/status", self.get_statuses)
+        app.router.add_get("/pay/{payment_id}", self.payment_page)
+        app.router.add_post("/pay/{payment_id}", self.pay)
+        app.on_cleanup.append(self._close)
+        return app
+
+    async def _close(self, app: web.Application):
+        for task in self._deliveries:
+            task.cancel()
+        if self._session:
+            await self._session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--secret", default="", help="ключ API и подписи уведомлений (PAYMENT_SECRET бота)")
+    parser.add_argument("--public-url", help="адрес страниц оплаты для пользователей (по умолчанию http://host:port)")
+    parser.add_argument("--drop-webhooks", type=float, default=0.0, help="доля уведомлений, которые не отправляются")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    provider = FakeProvider(args.secret, args.public_url or f"http://{args.host}:{args.port}", args.drop_webhooks)
+    web.run_app(provider.app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
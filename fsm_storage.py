@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import db
+
+logger = logging.getLogger(__name__)
+
+class FSMRecord:
+    """Состояние и данные одного пользователя.
+
+    stored - время последнего обращения, записанное в базу: чтение меняет
+    только touched в памяти, и expire() дописывает его перед очисткой.
+    """
+    __slots__ = ("state", "data", "touched", "stored")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, touched: float = 0.0,
+                 stored: float = 0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.touched = touched
+        self.stored = stored
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM-хранилище с ограниченным LRU-кэшем в памяти поверх SQLite.
+
+    В памяти держится не больше max_size последних активных сессий, остальные
+    читаются из базы по требованию. Сессии, не использовавшиеся дольше ttl
+    секунд, считаются пустыми и удаляются фоновой очисткой.
+
+    Все обращения к базе выполняются в одном фоновом потоке по очереди, поэтому
+    запись не блокирует цикл событий, а чтение всегда видит предыдущие записи.
+    """
+
+    def __init__(self, path: str, max_size: int = 10000, ttl: float = 86400,
+                 key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._hot: "OrderedDict[str, FSMRecord]" = OrderedDict()
+        self._pending: Dict[str, FSMRecord] = {}  # key -> снимок, ожидающий записи
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._conn = db.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, touched REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_touched ON fsm(touched)")
+
+    # Работа с базой (выполняется в фоновом потоке)
+
+    def _db_get(self, key: str) -> Optional[FSMRecord]:
+        row = self._conn.execute("SELECT state, data, touched FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return FSMRecord(row[0], json.loads(row[1]), row[2], row[2])
+
+    def _db_write_pending(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        deletes = [(key,) for key, record in pending.items() if record.state is None and not record.data]
+        upserts = [
+            (key, record.state, json.dumps(record.data, ensure_ascii=False), record.touched)
+            for key, record in pending.items()
+            if record.state is not None or record.data
+        ]
+        with self._conn:
+            self._conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+            self._conn.executemany(
+                "INSERT INTO fsm (key, state, data, touched) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "state = excluded.state, data = excluded.data, touched = excluded.touched",
+                upserts
+            )
+
+    def _db_expire(self, deadline: float) -> int:
+        with self._conn:
+            return self._conn.execute("DELETE FROM fsm WHERE touched < ?", (deadline,)).rowcount
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _schedule_write(self, key: str, record: FSMRecord):
+        """Ставит снимок сессии в очередь на запись, не дожидаясь ее выполнения.
+
+        Изменения, накопившиеся до того, как фоновый поток освободится,
+        записываются одной транзакцией.
+        """
+        snapshot = FSMRecord(record.state, record.data.copy(), record.touched)
+        record.stored = record.touched
+        with self._lock:
+            self._pending[key] = snapshot
+            if len(self._pending) > 1:
+                # Запись уже запланирована и заберет это изменение
+                return
+        future = self._executor.submit(self._db_write_pending)
+        future.add_done_callback(self._log_write_error)
+
+    @staticmethod
+    def _log_write_error(future):
+        if future.exception() is not None:
+            logger.error("Ошибка записи FSM-состояний: %s", future.exception())
+
+    # Горячий уровень
+
+    def _remember(self, key: str, record: FSMRecord):
+        self._hot[key] = record
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.max_size:
+            # Вытесненная сессия остается в базе
+            self._hot.popitem(last=False)
+
+    async def _get_record(self, storage_key: StorageKey) -> FSMRecord:
+        key = self.key_builder.build(storage_key)
+        now = time.time()
+        record = self._hot.get(key)
+        if record is None:
+            with self._lock:
+                pending = self._pending.get(key)
+            if pending is not None:
+                # Сессия вытеснена из кэша, но еще не записана в базу
+                record = FSMRecord(pending.state, pending.data.copy(), pending.touched, pending.touched)
+            else:
+                record = await self._run(self._db_get, key)
+                # Пока шло чтение, сессию могли загрузить параллельно
+                record = self._hot.get(key, record)
+            if record is None:
+                record = FSMRecord(touched=now)
+        if now - record.touched > self.ttl:
+            # Сессия простаивала дольше TTL - начинаем заново
+            record = FSMRecord(touched=now)
+            self._schedule_write(key, record)
+        record.touched = now
+        self._remember(key, record)
+        return record
+
+    def _save(self, storage_key: StorageKey, record: FSMRecord):
+        key = self.key_builder.build(storage_key)
+        record.touched = time.time()
+        self._remember(key, record)
+        self._schedule_write(key, record)
+
+    # Интерфейс BaseStorage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._save(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._save(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any = None) -> Any:
+        return copy((await self._get_record(storage_key)).data.get(dict_key, default))
+
+    async def expire(self) -> int:
+        """Удаляет сессии, простаивающие дольше TTL"""
+        deadline = time.time() - self.ttl
+        # Записи в OrderedDict упорядочены по последнему обращению
+        while self._hot:
+            key, record = next(iter(self._hot.items()))
+            if record.touched >= deadline:
+                break
+            self._hot.popitem(last=False)
+        # Активные сессии, которые только читались: в базе у них старое время обращения.
+        # Запись встает в очередь потока раньше удаления, и строка не удаляется
+        for key, record in self._hot.items():
+            if record.stored < deadline and (record.state is not None or record.data):
+                self._schedule_write(key, record)
+        removed = await self._run(self._db_expire, deadline)
+        if removed:
+            logger.info("Удалено %d просроченных FSM-сессий", removed)
+        return removed
+
+    async def run_expiry(self, interval: float):
+        """Фоновая задача периодической очистки просроченных сессий"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.error("Ошибка очистки FSM-сессий: %s", e)
+
+    async def close(self) -> None:
+        # Дожидаемся всех отложенных записей
+        await self._run(lambda: None)
+        self._executor.shutdown(wait=True)
+        self._conn.close()
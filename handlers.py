@@ -1,14 +1,32 @@
+import asyncio
 import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 
-from config import SUBSCRIPTION_PLANS, ADMIN_ID
+from config import (
+    ADMIN_ID, MAIN_MENU_IMAGE, ORDERS_PAGE_SIZE, EXPORT_PAGE_SIZE, EXPORT_DIR, SHARD_ID
+)
 from states import OrderState
-from keyboards import (
-    get_main_menu_keyboard, get_subscription_keyboard, get_payment_keyboard, 
-    get_back_to_start_keyboard, get_back_to_menu_keyboard
+from keyboards import get_payment_keyboard, get_orders_page_keyboard
+from render import get_render_cache
+from catalog import get_catalog
+from texts import (
+    WELCOME_TEXT, SUPPORT_TEXT, FAQ_TEXT, PAYMENT_TEXT_TEMPLATE, PAYMENT_SUCCESS_TEXT,
+    PAYMENT_CREATE_ERROR_TEXT, PAYMENT_NOT_RECEIVED_TEXT, STALE_CALLBACK_TEXT, ORDER_LOST_TEXT
 )
-from storage import order_storage
+from storage import order_storage, admin_order_view, order_reaper
+from callbacks import PlanCallback, OrdersPageCallback
+from media_cache import media_cache
+from screens import show_screen
+from notifications import admin_outbox
+from renewals import renewal_scheduler
+from payments import PAYMENT_PAID, PaymentEvent, new_payment_id, payment_provider, payment_notify_url
+from metrics import metrics
+from export import EXPORT_FORMATS, export_orders
+from stats import FUNNEL, conversion
 
 logger = logging.getLogger(__name__)
 
@@ -17,31 +35,21 @@ async def cmd_start(message: types.Message, state: FSMContext):
     # Очищаем предыдущие состояния
     await state.clear()
     
-    welcome_text = (
-        "🎵 **Добро пожаловать в Spotify Family Bot!** 🎵\n\n"
-        "🔥 Получите доступ к **Spotify Premium** по лучшим ценам!\n\n"
-        "✅ **Что вы получаете:**\n"
-        "• Безлимитная музыка без рекламы\n"
-        "• Высокое качество звука\n"
-        "• Скачивание треков для офлайн прослушивания\n"
-        "• Доступ ко всем функциям Spotify Premium\n\n"
-        "💚 **Выберите действие:**"
-    )
-    
-    keyboard = get_main_menu_keyboard()
+    welcome_text = WELCOME_TEXT
+    keyboard = get_render_cache().main_menu_keyboard
     
     try:
         # Отправляем главное меню с изображением
-        from aiogram.types import FSInputFile
-        photo = FSInputFile("spotify_image.png")
-        await message.answer_photo(
-            photo=photo,
+        await media_cache.send_photo(
+            message.bot,
+            message.chat.id,
+            MAIN_MENU_IMAGE,
             caption=welcome_text,
             reply_markup=keyboard,
             parse_mode="Markdown"
         )
     except Exception as e:
-        logger.error(f"Ошибка отправки изображения в главном меню: {e}")
+        logger.error("Ошибка отправки изображения в главном меню: %s", e)
         # Если ошибка с изображением, отправляем только текст
         await message.answer(welcome_text, reply_markup=keyboard, parse_mode="Markdown")
 
@@ -54,176 +62,70 @@ async def handle_order_subscription(callback_query: types.CallbackQuery, state:
     }
     order_storage.create_order(user_id, user_data)
     
-    subscription_text = (
-        "🎵 **Выберите план подписки Spotify Premium:**\n\n"
-        "💚 **Доступные варианты:**\n"
-        "🔸 **1 месяц** — 150₽\n"
-        "🔸 **3 месяца** — 370₽ *(экономия 80₽)*\n"
-        "🔸 **6 месяцев** — 690₽ *(экономия 210₽)*\n"
-        "🔸 **12 месяцев** — 1300₽ *(экономия 500₽)*\n\n"
-        "✨ **Что включено в Premium:**\n"
-        "• Безлимитная музыка без рекламы\n"
-        "• Высокое качество звука (до 320 kbps)\n"
-        "• Офлайн прослушивание\n"
-        "• Пропуск треков без ограничений\n"
-        "• Доступ к Spotify Connect\n\n"
-        "💚 Выберите подходящий план:"
-    )
-    
-    keyboard = get_subscription_keyboard()
-    
-    # Удаляем сообщение с изображением и отправляем новое текстовое
+    render_cache = get_render_cache()
     if callback_query.message:
-        await callback_query.message.delete()
-        await callback_query.bot.send_message(
-            chat_id=callback_query.message.chat.id,
-            text=subscription_text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
+        await show_screen(callback_query.message, render_cache.subscription_text, render_cache.subscription_keyboard)
     
     await state.set_state(OrderState.choosing_subscription)
     await callback_query.answer()
 
 async def handle_support(callback_query: types.CallbackQuery):
     """Обработчик кнопки Support"""
-    support_text = (
-        "💬 **Поддержка**\n\n"
-        "Если возникли дополнительные вопросы, обратитесь по этому контакту:\n\n"
-        "👤 https://t.me/chanceofrain"
-    )
-    
-    keyboard = get_back_to_menu_keyboard()
     if callback_query.message:
-        # Удаляем сообщение с изображением и отправляем новое текстовое
-        await callback_query.message.delete()
-        await callback_query.bot.send_message(
-            chat_id=callback_query.message.chat.id,
-            text=support_text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
+        await show_screen(callback_query.message, SUPPORT_TEXT, get_render_cache().back_to_menu_keyboard)
     await callback_query.answer()
 
 async def handle_faq(callback_query: types.CallbackQuery):
     """Обработчик кнопки FAQ"""
-    faq_text = (
-        "📖 **Часто задаваемые вопросы**\n\n"
-        
-        "1️⃣ **Это официальная подписка?**\n"
-        "— Да, это настоящая подписка Spotify Premium через семейный план.\n\n"
-        
-        "2️⃣ **Нужно ли что-то платить каждый месяц?**\n"
-        "— Нет. Вы платите один раз за выбранный срок (1 / 3 / 6 / 12 месяцев).\n\n"
-        
-        "3️⃣ **Что мне нужно для подключения?**\n"
-        "— Логин и пароль от Spotify аккаунта.\n\n"
-        
-        "4️⃣ **Как происходит добавление в семью?**\n"
-        "— Мы отправляем приглашение в семью Spotify, вы подтверждаете адрес.\n\n"
-        
-        "5️⃣ **Это безопасно?**\n"
-        "— Да. Данные используются только для добавления в семью и не передаются третьим лицам.\n\n"
-        
-        "6️⃣ **Сколько времени занимает подключение?**\n"
-        "— От 5 до 30 минут. Иногда до 2 часов.\n\n"
-        
-        "7️⃣ **Что если меня удалят из семьи?**\n"
-        "— Мы восстановим вас бесплатно, если срок ещё не истёк.\n\n"
-        
-        "8️⃣ **Можно ли продлить подписку?**\n"
-        "— Да, просто оформите новый срок через бота."
-    )
-    
-    keyboard = get_back_to_menu_keyboard()
     if callback_query.message:
-        # Удаляем сообщение с изображением и отправляем новое текстовое
-        await callback_query.message.delete()
-        await callback_query.bot.send_message(
-            chat_id=callback_query.message.chat.id,
-            text=faq_text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
+        await show_screen(callback_query.message, FAQ_TEXT, get_render_cache().back_to_menu_keyboard)
     await callback_query.answer()
 
 async def handle_back_to_menu(callback_query: types.CallbackQuery, state: FSMContext):
     """Обработчик кнопки возврата в главное меню"""
     await state.clear()
     
-    welcome_text = (
-        "🎵 **Добро пожаловать в Spotify Family Bot!** 🎵\n\n"
-        "🔥 Получите доступ к **Spotify Premium** по лучшим ценам!\n\n"
-        "✅ **Что вы получаете:**\n"
-        "• Безлимитная музыка без рекламы\n"
-        "• Высокое качество звука\n"
-        "• Скачивание треков для офлайн прослушивания\n"
-        "• Доступ ко всем функциям Spotify Premium\n\n"
-        "💚 **Выберите действие:**"
-    )
-    
-    keyboard = get_main_menu_keyboard()
     if callback_query.message:
-        # Удаляем текущее сообщение и отправляем новое с изображением
-        await callback_query.message.delete()
-        
-        try:
-            # Отправляем главное меню с изображением
-            from aiogram.types import FSInputFile
-            photo = FSInputFile("spotify_image.png")
-            await callback_query.bot.send_photo(
-                chat_id=callback_query.message.chat.id,
-                photo=photo,
-                caption=welcome_text,
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки изображения в главном меню: {e}")
-            # Если ошибка с изображением, отправляем только текст
-            await callback_query.bot.send_message(
-                chat_id=callback_query.message.chat.id,
-                text=welcome_text,
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
+        # Главное меню с изображением
+        await show_screen(
+            callback_query.message,
+            WELCOME_TEXT,
+            get_render_cache().main_menu_keyboard,
+            photo=MAIN_MENU_IMAGE
+        )
     await callback_query.answer()
 
-async def process_plan_selection(callback_query: types.CallbackQuery, state: FSMContext):
-    """Обработка выбора плана подписки"""
-    plan_id = callback_query.data.replace("select_plan_", "") if callback_query.data else ""
-    
-    if plan_id not in SUBSCRIPTION_PLANS:
-        await callback_query.answer("❌ Неверный план подписки")
+async def process_plan_selection(callback_query: types.CallbackQuery, state: FSMContext, callback_data: PlanCallback):
+    """Обработка выбора плана подписки (план уже проверен маршрутизатором callback)"""
+    plan_id = callback_data.plan_id
+    render_cache = get_render_cache()
+    if not render_cache.catalog.is_current(plan_id, callback_data.version):
+        # Каталог обновился после проверки маршрутизатором
+        await callback_query.answer(STALE_CALLBACK_TEXT)
+        return
+    plan_info = render_cache.catalog.plans[plan_id]
+    user_id = callback_query.from_user.id if callback_query.from_user else 0
+    if order_storage.get_order(user_id) is None:
+        # Состояние пережило перезапуск, а заказ - нет
+        await state.clear()
+        await callback_query.answer(ORDER_LOST_TEXT, show_alert=True)
         return
-    
-    plan_info = SUBSCRIPTION_PLANS[plan_id]
     
     # Сохраняем выбранный план
     await state.update_data(selected_plan=plan_id)
-    user_id = callback_query.from_user.id if callback_query.from_user else 0
     order_storage.update_order(
         user_id,
-        subscription_plan=plan_info
+        plan_id=plan_id,
+        price=plan_info['price']
     )
     
     # Запрашиваем логин от Spotify с подробными инструкциями
-    text = (
-        f"✅ **Выбрана подписка:** {plan_info['name']} — {plan_info['price']}₽\n\n"
-        "📧 **Введите данные от Spotify:**\n\n"
-        "⚠️ **ВАЖНО:**\n"
-        "• Введите данные в формате: **логин:пароль**\n"
-        "• Проверьте данные перед отправкой — **они должны быть точными**\n"
-        "• Используйте **точно такой же** логин и пароль, как в приложении Spotify\n\n"
-        "📝 **Пример:**\n"
-        "• your_email@gmail.com:yourpassword123\n"
-        "• spotify_username:yourpassword\n\n"
-        "🔒 **Безопасность:** Данные используются только для добавления в семью и не передаются третьим лицам"
-    )
-    
-    keyboard = get_back_to_menu_keyboard()
     if callback_query.message:
-        await callback_query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+        await show_screen(
+            callback_query.message,
+            render_cache.plan_selected_texts[plan_id],
+            render_cache.back_to_menu_keyboard
+        )
     await state.set_state(OrderState.entering_spotify_login)
     await callback_query.answer()
 
@@ -238,7 +140,7 @@ async def process_spotify_login(message: types.Message, state: FSMContext):
     if ":" not in spotify_login:
         await message.answer(
             "❌ Неверный формат данных. Введите в формате: логин:пароль\n\nПример: myemail@gmail.com:mypassword123",
-            reply_markup=get_back_to_start_keyboard()
+            reply_markup=get_render_cache().back_to_start_keyboard
         )
         return
     
@@ -246,31 +148,44 @@ async def process_spotify_login(message: types.Message, state: FSMContext):
     if len(login_parts) != 2 or len(login_parts[0]) < 3 or len(login_parts[1]) < 3:
         await message.answer(
             "❌ Логин или пароль слишком короткие. Введите в формате: логин:пароль",
-            reply_markup=get_back_to_start_keyboard()
+            reply_markup=get_render_cache().back_to_start_keyboard
         )
         return
     
+    user_id = message.from_user.id if message.from_user else 0
+    if order_storage.get_order(user_id) is None:
+        # Состояние пережило перезапуск, а заказ - нет
+        await state.clear()
+        await message.answer(ORDER_LOST_TEXT, reply_markup=get_render_cache().back_to_start_keyboard)
+        return
+    
     # Сохраняем логин
     await state.update_data(spotify_login=spotify_login)
-    user_id = message.from_user.id if message.from_user else 0
     order_storage.update_order(
         user_id,
         spotify_login=spotify_login
     )
     
-    # Генерируем фиктивную ссылку на оплату
     state_data = await state.get_data()
     plan_id = state_data.get("selected_plan")
-    if not plan_id or plan_id not in SUBSCRIPTION_PLANS:
+    order = order_storage.get_order(user_id)
+    # План мог уйти из продажи после выбора: заказ оформляется по цене, которую видел пользователь
+    if not plan_id or not order or order.price is None:
+        # План не выбран в этом заказе (например, состояние осталось от прошлого) - начинаем заново
+        await state.clear()
+        await message.answer(ORDER_LOST_TEXT, reply_markup=get_render_cache().back_to_start_keyboard)
         return
-        
-    plan_info = SUBSCRIPTION_PLANS[plan_id]
     
-    # Фиктивная ссылка на оплату
-    payment_url = f"https://payment-gateway.example.com/pay?order_id={state_data.get('order_id')}&amount={plan_info['price']}"
+    # Платеж у провайдера по уникальному ключу; провайдер сообщит об оплате на payment_notify_url
+    order_storage.update_order(user_id, payment_id=new_payment_id(order))
+    try:
+        payment_url = await payment_provider.create_payment(order, payment_notify_url)
+    except Exception as e:
+        logger.error("Не удалось создать платеж по заказу %s: %s", order.order_id, e)
+        await message.answer(PAYMENT_CREATE_ERROR_TEXT, reply_markup=get_render_cache().back_to_start_keyboard)
+        return
     
     await state.update_data(payment_url=payment_url)
-    user_id = message.from_user.id if message.from_user else 0
     order_storage.update_order(
         user_id,
         payment_url=payment_url,
@@ -278,16 +193,10 @@ async def process_spotify_login(message: types.Message, state: FSMContext):
     )
     
     # Отправляем сообщение с оплатой
-    payment_text = (
-        f"💳 **К оплате:** {plan_info['price']}₽\n\n"
-        f"📋 **Детали заказа:**\n"
-        f"• **Подписка:** {plan_info['name']}\n"
-        f"• **Spotify аккаунт:** {spotify_login}\n\n"
-        "🔥 **Что делать дальше:**\n"
-        "1️⃣ Нажмите кнопку **'💳 Оплатить'**\n"
-        "2️⃣ Совершите платеж\n"
-        "3️⃣ Нажмите **'✅ Я оплатил'**\n\n"
-        "⚡️ После подтверждения оплаты вы получите доступ к Spotify Premium в течение 5-30 минут!"
+    payment_text = PAYMENT_TEXT_TEMPLATE.format(
+        price=order.price,
+        plan_name=order.plan_name,
+        spotify_login=spotify_login
     )
     
     keyboard = get_payment_keyboard(payment_url)
@@ -299,49 +208,139 @@ async def process_payment_completed(callback_query: types.CallbackQuery, state:
     user_id = callback_query.from_user.id if callback_query.from_user else 0
     order = order_storage.get_order(user_id)
     
-    if not order:
-        await callback_query.answer("❌ Заказ не найден")
+    if order and order.status == "completed":
+        # Оплату уже подтвердил провайдер
+        await state.set_state(OrderState.order_completed)
+        await callback_query.answer("✅ Оплата уже подтверждена!")
         return
     
-    # Завершаем заказ
-    order_storage.complete_order(user_id)
+    # Заказ мог уйти в архив по ORDER_TTL или пропасть при перезапуске
+    if not order or order.status != "awaiting_payment":
+        await state.clear()
+        await callback_query.answer(ORDER_LOST_TEXT, show_alert=True)
+        return
+    
+    if payment_provider.confirms_payments:
+        # Нажатию кнопки не верим: спрашиваем статус платежа у провайдера
+        try:
+            statuses = await payment_provider.get_statuses([order.payment_id])
+        except Exception as e:
+            logger.error("Не удалось проверить оплату заказа %s: %s", order.order_id, e)
+            statuses = {}
+        event = statuses.get(order.payment_id)
+        if event and event.status == PAYMENT_PAID:
+            try:
+                await confirm_payment(callback_query.bot, event, "button")
+            except Exception as e:
+                # Заказ уже завершен в памяти, запись хранилище повторит
+                logger.error("Ошибка подтверждения оплаты заказа %s: %s", order.order_id, e)
+        # Заказ мог завершить и параллельно пришедший вебхук
+        if order.status != "completed":
+            await callback_query.answer(PAYMENT_NOT_RECEIVED_TEXT, show_alert=True)
+            return
+    else:
+        # Ручная проверка: заказ завершается по кнопке, администратор сверяет оплату
+        order_storage.complete_order(user_id)
+        try:
+            await order_storage.sync()
+        except Exception as e:
+            # Заказ уже завершен в памяти, запись хранилище повторит
+            logger.error("Ошибка записи заказа %s: %s", order.order_id, e)
+        notify_admin_about_order(order)
+        renewal_scheduler.schedule(order)
     
     # Уведомляем пользователя
-    success_text = (
-        "✅ Оплата успешно обработана!\n\n"
-        "📞 Администратор свяжется с вами в ближайшее время для активации подписки.\n"
-        "Обычно это занимает до 24 часов."
-    )
+    success_text = PAYMENT_SUCCESS_TEXT
     
     if callback_query.message:
-        await callback_query.message.edit_text(success_text, reply_markup=get_back_to_start_keyboard())
-    
-    # Уведомляем администратора
-    if callback_query.bot:
-        await notify_admin_about_order(callback_query.bot, order)
+        await callback_query.message.edit_text(success_text, reply_markup=get_render_cache().back_to_start_keyboard)
     
     await state.set_state(OrderState.order_completed)
     await callback_query.answer("✅ Оплата подтверждена!")
 
-async def notify_admin_about_order(bot, order):
-    """Отправляет уведомление администратору о новом заказе"""
+# Платежи без заказа, о которых уже предупрежден администратор (провайдер повторяет уведомления).
+# Хранятся последние UNMATCHED_PAYMENTS_LIMIT в порядке последнего повтора, старые вытесняются
+UNMATCHED_PAYMENTS_LIMIT = 1000
+_unmatched_payments: "OrderedDict[str, None]" = OrderedDict()
+
+async def confirm_payment(bot, event: PaymentEvent, source: str) -> bool:
+    """Завершает заказ, оплату которого подтвердил провайдер.
+
+    Общий путь для уведомления, сверки и кнопки "Я оплатил". Повторное
+    подтверждение уже завершенного заказа ничего не делает. Пользователю
+    пишем, только если оплату нашли не по его нажатию. Заказ, ушедший по
+    ORDER_TTL в архив, возвращается из него; если заказа нет и там,
+    администратор получает предупреждение, а вызов - LookupError.
+    """
+    order = order_storage.get_order_by_id(event.order_id)
+    # Ключ платежа сверяется целиком: с тем же ID мог быть заказ до перезапуска
+    if not order or order.payment_id != event.payment_id:
+        order = await order_reaper.restore(event.order_id, event.payment_id)
+    if not order:
+        if event.payment_id in _unmatched_payments:
+            _unmatched_payments.move_to_end(event.payment_id)
+        else:
+            _unmatched_payments[event.payment_id] = None
+            if len(_unmatched_payments) > UNMATCHED_PAYMENTS_LIMIT:
+                _unmatched_payments.popitem(last=False)
+            admin_outbox.enqueue(
+                f"⚠️ Оплачен платеж {event.payment_id} ({event.amount}₽), но заказа {event.order_id} "
+                "нет ни в хранилище, ни в архиве, нужна проверка"
+            )
+        raise LookupError(f"Заказ для платежа {event.payment_id} не найден")
+    if order.status != "awaiting_payment":
+        return False
+    if event.amount is not None and event.amount != order.price:
+        logger.error("Сумма оплаты заказа %s не совпадает: %s вместо %s", order.order_id, event.amount, order.price)
+        admin_outbox.enqueue(
+            f"⚠️ Заказ {order.order_id}: оплачено {event.amount}₽ вместо {order.price}₽, нужна проверка"
+        )
+        return False
+    
+    # Заказ завершается и сохраняется на диск до ответа провайдеру и пользователю.
+    # Неудачную запись хранилище повторит само, а повтор уведомления уже увидит
+    # завершенный заказ, поэтому администратор, напоминание и пользователь не
+    # зависят от sync(); ошибка записи поднимается после них
+    order_storage.complete_order_by_id(order.order_id)
+    sync_error = None
+    try:
+        await order_storage.sync()
+    except Exception as e:
+        sync_error = e
+    logger.info("Оплата заказа %s подтверждена (%s)", order.order_id, source)
+    notify_admin_about_order(order)
+    renewal_scheduler.schedule(order)
+    
+    if source != "button":
+        try:
+            await bot.send_message(
+                order.user_id, PAYMENT_SUCCESS_TEXT, reply_markup=get_render_cache().back_to_start_keyboard
+            )
+        except Exception as e:
+            logger.warning("Не удалось сообщить пользователю %s об оплате: %s", order.user_id, e)
+    if sync_error:
+        raise sync_error
+    return True
+
+def notify_admin_about_order(order):
+    """Ставит в очередь уведомление администратору о новом заказе"""
     try:
         admin_text = (
             "🔔 Новый оплаченный заказ:\n\n"
-            f"📋 ID заказа: {order['order_id']}\n"
-            f"📅 Подписка: {order['subscription_plan']['name']} - {order['subscription_plan']['price']}₽\n"
-            f"📧 Spotify логин: {order['spotify_login']}\n"
-            f"👤 Пользователь: {order['first_name']}\n"
-            f"📱 Telegram: @{order['username'] or 'не указан'}\n"
-            f"🆔 User ID: {order['user_id']}\n"
-            f"⏰ Время заказа: {order['created_at']}"
+            f"📋 ID заказа: {order.order_id}\n"
+            f"📅 Подписка: {order.plan_name} - {order.price}₽\n"
+            f"📧 Spotify логин: {order.spotify_login}\n"
+            f"👤 Пользователь: {order.first_name}\n"
+            f"📱 Telegram: @{order.username or 'не указан'}\n"
+            f"🆔 User ID: {order.user_id}\n"
+            f"⏰ Время заказа: {order.created_at_iso}"
         )
         
-        await bot.send_message(ADMIN_ID, admin_text)
-        logger.info(f"Уведомление администратору отправлено для заказа {order['order_id']}")
+        admin_outbox.enqueue(admin_text)
+        logger.info("Уведомление администратору поставлено в очередь для заказа %s", order.order_id)
         
     except Exception as e:
-        logger.error(f"Ошибка отправки уведомления администратору: {e}")
+        logger.error("Ошибка постановки уведомления администратору в очередь: %s", e)
 
 async def process_start_over(callback_query: types.CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Начать заново'"""
@@ -359,67 +358,261 @@ async def handle_unknown_message(message: types.Message, state: FSMContext):
     if current_state == OrderState.choosing_subscription:
         await message.answer(
             "Пожалуйста, выберите план подписки, используя кнопки выше.",
-            reply_markup=get_back_to_start_keyboard()
+            reply_markup=get_render_cache().back_to_start_keyboard
         )
     elif current_state == OrderState.entering_spotify_login:
         await message.answer(
             "Пожалуйста, введите ваш логин/почту от Spotify:",
-            reply_markup=get_back_to_start_keyboard()
+            reply_markup=get_render_cache().back_to_start_keyboard
         )
     elif current_state == OrderState.payment_processing:
         await message.answer(
             "Пожалуйста, используйте кнопки для оплаты выше.",
-            reply_markup=get_back_to_start_keyboard()
+            reply_markup=get_render_cache().back_to_start_keyboard
         )
     else:
         await message.answer(
             "Для начала работы с ботом нажмите /start",
-            reply_markup=get_back_to_start_keyboard()
+            reply_markup=get_render_cache().back_to_start_keyboard
         )
 
 # Команда для администратора для просмотра заказов
+ORDER_STATUSES = ("created", "awaiting_payment", "completed")
+
+def order_filters_usage(command):
+    """Подсказка по фильтрам заказов с планами текущего каталога"""
+    return (
+        f"Использование: {command} [status={'|'.join(ORDER_STATUSES)}] "
+        f"[plan={'|'.join(get_catalog().known)}] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД]"
+    )
+
+def parse_order_filters(args):
+    """Разбирает фильтры команды /orders вида ключ=значение"""
+    filters = {"status": None, "plan_id": None, "date_from": None, "date_to": None}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key == "status" and value in ORDER_STATUSES:
+            filters["status"] = value
+        elif key == "plan" and value in get_catalog().known:
+            filters["plan_id"] = value
+        elif key in ("from", "to") and value:
+            filters["date_from" if key == "from" else "date_to"] = datetime.strptime(value, "%Y-%m-%d").date()
+        else:
+            raise ValueError(f"Неизвестный фильтр: {arg}")
+    return filters
+
+def pack_orders_page(direction, cursor, filters):
+    """Упаковывает курсор и фильтры в callback_data (до 64 байт)"""
+    return OrdersPageCallback(
+        direction=direction,
+        cursor=cursor,
+        status=filters["status"] or "",
+        plan_id=filters["plan_id"] or "",
+        date_from=filters["date_from"].strftime("%Y%m%d") if filters["date_from"] else "",
+        date_to=filters["date_to"].strftime("%Y%m%d") if filters["date_to"] else "",
+    ).pack()
+
+def unpack_orders_page(callback_data: OrdersPageCallback):
+    """Фильтры страницы заказов из callback_data"""
+    return {
+        "status": callback_data.status or None,
+        "plan_id": callback_data.plan_id or None,
+        "date_from": datetime.strptime(callback_data.date_from, "%Y%m%d").date() if callback_data.date_from else None,
+        "date_to": datetime.strptime(callback_data.date_to, "%Y%m%d").date() if callback_data.date_to else None,
+    }
+
+def format_order(order):
+    """Форматирует заказ для списка администратора"""
+    return (
+        f"\n🆔 {order.order_id}\n"
+        f"👤 {order.first_name} (@{order.username or 'не указан'})\n"
+        f"📧 {order.spotify_login or 'не указан'}\n"
+        f"📅 {order.plan_name}\n"
+        f"💰 {order.price or 0}₽\n"
+        f"📊 Статус: {order.status}\n"
+        f"⏰ {order.created_at_iso}\n"
+        "─────────────────"
+    )
+
+async def render_orders_page(filters, cursor=None, backward=False):
+    """Возвращает текст и клавиатуру страницы заказов"""
+    orders, has_more = await admin_order_view.query_orders(
+        cursor=cursor, backward=backward, limit=ORDERS_PAGE_SIZE, **filters
+    )
+    if not orders:
+        return "📋 Заказов не найдено.", None
+    
+    applied = [f"{key}={value}" for key, value in filters.items() if value]
+    header = "📋 Заказы" + (f" ({', '.join(applied)})" if applied else "") + ":\n"
+    text = header + "".join(format_order(order) for order in orders)
+    
+    # Есть ли более новые (prev) и более старые (next) заказы
+    has_newer = has_more if backward else cursor is not None
+    has_older = cursor is not None if backward else has_more
+    keyboard = get_orders_page_keyboard(
+        pack_orders_page("p", orders[0].seq, filters) if has_newer else None,
+        pack_orders_page("n", orders[-1].seq, filters) if has_older else None
+    )
+    return text, keyboard
+
 async def cmd_admin_orders(message: types.Message):
-    """Команда для администратора для просмотра всех заказов"""
+    """Команда для администратора для просмотра заказов постранично"""
     user_id = message.from_user.id if message.from_user else 0
     if str(user_id) != ADMIN_ID:
         await message.answer("❌ У вас нет доступа к этой команде.")
         return
     
-    orders = order_storage.get_all_orders()
+    try:
+        filters = parse_order_filters((message.text or "").split()[1:])
+    except ValueError as e:
+        await message.answer(f"❌ {e}\n\n{order_filters_usage('/orders')}")
+        return
     
-    if not orders:
-        await message.answer("📋 Заказов пока нет.")
+    text, keyboard = await render_orders_page(filters)
+    await message.answer(text, reply_markup=keyboard)
+
+async def handle_orders_page(callback_query: types.CallbackQuery, callback_data: OrdersPageCallback):
+    """Листание страниц списка заказов"""
+    user_id = callback_query.from_user.id if callback_query.from_user else 0
+    if str(user_id) != ADMIN_ID:
+        await callback_query.answer("❌ У вас нет доступа к этой команде.")
         return
     
-    response_parts = ["📋 Все заказы:\n"]
-    
-    for user_id, order in orders.items():
-        order_info = (
-            f"\n🆔 {order['order_id']}\n"
-            f"👤 {order['first_name']} (@{order.get('username', 'не указан')})\n"
-            f"📧 {order.get('spotify_login', 'не указан')}\n"
-            f"📅 {order.get('subscription_plan', {}).get('name', 'не выбрано')}\n"
-            f"💰 {order.get('subscription_plan', {}).get('price', 0)}₽\n"
-            f"📊 Статус: {order['status']}\n"
-            f"⏰ {order['created_at']}\n"
-            "─────────────────"
-        )
-        response_parts.append(order_info)
-    
-    # Разбиваем на части если слишком длинное сообщение
-    full_response = "\n".join(response_parts)
-    
-    if len(full_response) > 4000:
-        # Отправляем по частям
-        current_message = response_parts[0]
-        for part in response_parts[1:]:
-            if len(current_message + part) > 4000:
-                await message.answer(current_message)
-                current_message = part
+    try:
+        filters = unpack_orders_page(callback_data)
+    except ValueError:
+        await callback_query.answer("❌ Устаревшая кнопка")
+        return
+    
+    text, keyboard = await render_orders_page(
+        filters, cursor=callback_data.cursor, backward=callback_data.direction == "p"
+    )
+    if callback_query.message:
+        await callback_query.message.edit_text(text, reply_markup=keyboard)
+    await callback_query.answer()
+
+# Выгрузка заказов администратору
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024  # ограничение Bot API на отправку файла
+_export_lock = asyncio.Lock()
+
+async def cmd_admin_export(message: types.Message):
+    """Команда для администратора: заказы файлом .csv.gz или .jsonl.gz"""
+    user_id = message.from_user.id if message.from_user else 0
+    if str(user_id) != ADMIN_ID:
+        await message.answer("❌ У вас нет доступа к этой команде.")
+        return
+    
+    args = (message.text or "").split()[1:]
+    fmt = args.pop(0) if args and args[0] in EXPORT_FORMATS else "csv"
+    try:
+        filters = parse_order_filters(args)
+    except ValueError as e:
+        usage = order_filters_usage(f"/export [{'|'.join(EXPORT_FORMATS)}]")
+        await message.answer(f"❌ {e}\n\n{usage}")
+        return
+    
+    if _export_lock.locked():
+        await message.answer("⏳ Предыдущая выгрузка еще готовится, подождите.")
+        return
+    
+    async with _export_lock:
+        await message.answer("⏳ Готовлю выгрузку...")
+        path, count = await export_orders(admin_order_view, filters, fmt, EXPORT_DIR, EXPORT_PAGE_SIZE)
+        try:
+            if not count:
+                await message.answer("📋 Заказов не найдено.")
+            elif os.path.getsize(path) > MAX_DOCUMENT_SIZE:
+                await message.answer("❌ Файл больше 50 МБ, сузьте выгрузку фильтрами.")
             else:
-                current_message += part
-        
-        if current_message:
-            await message.answer(current_message)
-    else:
-        await message.answer(full_response)
+                filename = f"orders_{datetime.now():%Y%m%d_%H%M}.{fmt}.gz"
+                await message.answer_document(
+                    types.FSInputFile(path, filename=filename),
+                    caption=f"📦 Заказов: {count}"
+                )
+        finally:
+            os.remove(path)
+
+
+def format_funnel(funnel):
+    """Воронка: created → awaiting_payment → completed с конверсией между этапами"""
+    created, awaiting, completed = (funnel[stage] for stage in FUNNEL)
+    return (
+        f"🆕 {created} → 💳 {awaiting} ({conversion(awaiting, created)}) → "
+        f"✅ {completed} ({conversion(completed, awaiting)}), всего {conversion(completed, created)}"
+    )
+
+def format_stats(stats, today, days=7):
+    """Сводка продаж для администратора: сегодня по планам, воронка, выручка за неделю"""
+    day = stats.day(today)
+    lines = [f"📊 Статистика на {today:%d.%m.%Y}", "", "💰 Продано сегодня:"]
+    plans = get_catalog().known
+    for plan_id, plan in plans.items():
+        sold = day.sold.get(plan_id, 0)
+        if sold:
+            lines.append(f"• {plan['name']}: {sold} шт., {day.revenue[plan_id]}₽")
+    lines.append(f"Итого: {sum(day.sold.values())} шт., {sum(day.revenue.values())}₽")
+    
+    lines += ["", "🔻 Воронка сегодня:", format_funnel(day.funnel)]
+    lines += ["", "🔻 Воронка за все время:", format_funnel(stats.funnel)]
+    
+    lines += ["", f"📅 Выручка за {days} дней:"]
+    for recent in stats.recent_days(today, days):
+        recent_stats = stats.day(recent)
+        lines.append(f"• {recent:%d.%m}: {sum(recent_stats.sold.values())} шт., {sum(recent_stats.revenue.values())}₽")
+    
+    lines += ["", "📦 Планы за все время (выбрано / оплачено / выручка):"]
+    for plan_id, plan in plans.items():
+        lines.append(
+            f"• {plan['name']}: {stats.selected.get(plan_id, 0)} / {stats.sold.get(plan_id, 0)} / "
+            f"{stats.revenue.get(plan_id, 0)}₽"
+        )
+    return "\n".join(lines)
+
+async def cmd_admin_stats(message: types.Message):
+    """Команда для администратора: продажи и конверсия из готовых счетчиков"""
+    user_id = message.from_user.id if message.from_user else 0
+    if str(user_id) != ADMIN_ID:
+        await message.answer("❌ У вас нет доступа к этой команде.")
+        return
+    
+    await message.answer(format_stats(await admin_order_view.get_stats(), datetime.now().date()))
+
+def format_metrics(registry):
+    """Краткая сводка метрик для администратора"""
+    # Метрики ведет каждый процесс-обработчик; сводно - через их HTTP-порты
+    title = "📈 Метрики" if SHARD_ID is None else f"📈 Метрики шарда {SHARD_ID}"
+    lines = [title, "", "⏱ Обработчики (вызовов, p50 / p95):"]
+    for (name,), (_, _, count) in sorted(registry.handler_latency.series.items()):
+        p50 = registry.handler_latency.quantile(0.5, name)
+        p95 = registry.handler_latency.quantile(0.95, name)
+        lines.append(f"• {name}: {count}, ≤{p50:g} / ≤{p95:g} с")
+    
+    lines += ["", "🌐 Bot API (запросов, p95, ошибок):"]
+    errors = {}
+    for (method, _), value in registry.api_errors.values.items():
+        errors[method] = errors.get(method, 0) + value
+    for (method,), (_, _, count) in sorted(registry.api_latency.series.items()):
+        p95 = registry.api_latency.quantile(0.95, method)
+        lines.append(f"• {method}: {count}, ≤{p95:g} с, {errors.get(method, 0):g}")
+    lines.append(f"🔁 RetryAfter: {sum(registry.api_retry_after.values.values()):g}")
+    
+    lines += ["", "📊 Обновления по состояниям:"]
+    for (event, state), value in sorted(registry.updates.values.items()):
+        lines.append(f"• {event} / {state}: {value:g}")
+    
+    for prefix, values in registry.collect().items():
+        lines += ["", f"⚙️ {prefix}:"]
+        lines += [f"• {key}: {value:g}" for key, value in sorted(values.items())]
+    return "\n".join(lines)
+
+async def cmd_admin_metrics(message: types.Message):
+    """Команда для администратора: задержки обработчиков и запросов к Bot API"""
+    user_id = message.from_user.id if message.from_user else 0
+    if str(user_id) != ADMIN_ID:
+        await message.answer("❌ У вас нет доступа к этой команде.")
+        return
+    
+    text = format_metrics(metrics)
+    if len(text) > 4000:
+        text = text[:4000] + "\n…"
+    await message.answer(text)
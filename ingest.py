@@ -0,0 +1,49 @@
+import logging
+from typing import Callable
+
+from aiogram import Bot
+
+from config import BOT_TOKEN, ADMIN_ID, BOT_MODE, WORKERS, WORKER_QUEUE_SIZE, POLLING_TIMEOUT, UPDATE_OFFSET_PATH
+from api_session import create_api_session
+from polling import OffsetStore
+from sharding import (
+    ShardRouter, start_workers, drain_workers, ingest_polling, ingest_webhook, commit_ingest_offset
+)
+
+logger = logging.getLogger(__name__)
+
+async def notify_admin_started(bot: Bot):
+    """Уведомляет администратора о запуске"""
+    try:
+        await bot.send_message(
+            ADMIN_ID,
+            "🤖 Бот Spotify Family запущен и готов к приему заказов!"
+        )
+    except Exception as e:
+        logger.error("Не удалось отправить уведомление администратору: %s", e)
+
+async def run_ingest(worker_target: Callable):
+    """Процесс приема: получает обновления и раздает их обработчикам по шардам.
+
+    Сам ничего не обрабатывает, поэтому не импортирует обработчики и их
+    хранилища: заказы, уведомления и FSM открывают только процессы шардов.
+    worker_target - точка входа обработчика (запускается через spawn).
+    """
+    processes, queues, acks, flushing = start_workers(worker_target, WORKERS, WORKER_QUEUE_SIZE)
+    router = ShardRouter(queues, acks)
+    bot = Bot(token=BOT_TOKEN, session=create_api_session())
+    await notify_admin_started(bot)
+    store = OffsetStore(UPDATE_OFFSET_PATH)
+    
+    try:
+        if BOT_MODE == "webhook":
+            await ingest_webhook(bot, router)
+        else:
+            await ingest_polling(bot, router, store, POLLING_TIMEOUT)
+    finally:
+        # Обработчики дорабатывают принятые обновления и завершаются
+        await drain_workers(router, processes, flushing)
+        if BOT_MODE != "webhook":
+            await commit_ingest_offset(bot, router, store)
+        logger.info("Обновлений по шардам: %s", router.routed)
+        await bot.session.close()
@@ -1,27 +1,27 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from config import SUBSCRIPTION_PLANS
+from callbacks import MenuAction, MenuCallback, PlanCallback
 
 def get_main_menu_keyboard():
     """Создает главное меню бота"""
     buttons = [
-        [InlineKeyboardButton(text="🎟 Оформить подписку", callback_data="order_subscription")],
-        [InlineKeyboardButton(text="💬 Support", callback_data="support")],
-        [InlineKeyboardButton(text="📖 Наш FAQ", callback_data="faq")]
+        [InlineKeyboardButton(text="🎟 Оформить подписку", callback_data=MenuCallback(action=MenuAction.ORDER).pack())],
+        [InlineKeyboardButton(text="💬 Support", callback_data=MenuCallback(action=MenuAction.SUPPORT).pack())],
+        [InlineKeyboardButton(text="📖 Наш FAQ", callback_data=MenuCallback(action=MenuAction.FAQ).pack())]
     ]
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
-def get_subscription_keyboard():
-    """Создает клавиатуру с вариантами подписки"""
+def get_subscription_keyboard(plans, version=""):
+    """Создает клавиатуру с вариантами подписки; кнопки помечены версией каталога"""
     buttons = []
     
-    for plan_id, plan_info in SUBSCRIPTION_PLANS.items():
+    for plan_id, plan_info in plans.items():
         button_text = f"💚{plan_info['name']}💚 — {plan_info['price']}₽"
-        callback_data = f"select_plan_{plan_id}"
+        callback_data = PlanCallback(plan_id=plan_id, version=version).pack()
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
     
     # Добавляем кнопку "Назад"
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад в меню", callback_data="back_to_menu")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад в меню", callback_data=MenuCallback(action=MenuAction.BACK).pack())])
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
@@ -30,7 +30,7 @@ def get_payment_keyboard(payment_url):
     """Создает клавиатуру с кнопкой оплаты"""
     buttons = [
         [InlineKeyboardButton(text="💳 Оплатить", url=payment_url)],
-        [InlineKeyboardButton(text="✅ Я оплатил", callback_data="payment_completed")]
+        [InlineKeyboardButton(text="✅ Я оплатил", callback_data=MenuCallback(action=MenuAction.PAID).pack())]
     ]
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
@@ -38,7 +38,7 @@ def get_payment_keyboard(payment_url):
 def get_back_to_start_keyboard():
     """Клавиатура для возврата к началу"""
     buttons = [
-        [InlineKeyboardButton(text="🔄 Начать заново", callback_data="start_over")]
+        [InlineKeyboardButton(text="🔄 Начать заново", callback_data=MenuCallback(action=MenuAction.START_OVER).pack())]
     ]
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
@@ -46,7 +46,27 @@ def get_back_to_start_keyboard():
 def get_back_to_menu_keyboard():
     """Клавиатура для возврата в главное меню"""
     buttons = [
-        [InlineKeyboardButton(text="⬅️ Назад в меню", callback_data="back_to_menu")]
+        [InlineKeyboardButton(text="⬅️ Назад в меню", callback_data=MenuCallback(action=MenuAction.BACK).pack())]
     ]
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
+
+def get_renewal_keyboard():
+    """Клавиатура напоминания о продлении"""
+    buttons = [
+        [InlineKeyboardButton(text="🔄 Продлить подписку", callback_data=MenuCallback(action=MenuAction.ORDER).pack())]
+    ]
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    return keyboard
+
+def get_orders_page_keyboard(prev_data=None, next_data=None):
+    """Клавиатура листания списка заказов"""
+    row = []
+    if prev_data:
+        row.append(InlineKeyboardButton(text="◀️ Новее", callback_data=prev_data))
+    if next_data:
+        row.append(InlineKeyboardButton(text="Старее ▶️", callback_data=next_data))
+    if not row:
+        return None
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[row])
+    return keyboard
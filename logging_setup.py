@@ -0,0 +1,105 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import List, Optional
+
+from config import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_ROTATION, LOG_MAX_BYTES, LOG_ROTATE_WHEN, LOG_BACKUP_COUNT
+)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Стандартные атрибуты LogRecord; остальные пришли через extra и попадают в JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra добавляются как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LoopQueueHandler(QueueHandler):
+    """Кладет запись в очередь, не трогая диск и консоль.
+
+    Сообщение собирается здесь (аргументы могут измениться после вызова),
+    а трассировка сохраняется отдельно в exc_text, чтобы форматтер в потоке
+    записи мог вывести ее как поле JSON.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def build_handlers(log_file: Optional[str] = LOG_FILE, log_format: str = LOG_FORMAT,
+                   rotation: str = LOG_ROTATION) -> List[logging.Handler]:
+    """Обработчики, которые пишут записи (работают в потоке QueueListener)"""
+    formatter = JSONFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        if rotation == "time":
+            handlers.append(TimedRotatingFileHandler(
+                log_file, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+            ))
+        else:
+            handlers.append(RotatingFileHandler(
+                log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+            ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(level: str = LOG_LEVEL, handlers: Optional[List[logging.Handler]] = None) -> QueueListener:
+    """Настраивает корневой логгер: запись на диск и в консоль идет в отдельном потоке.
+
+    Поток событий только кладет записи в очередь. Очередь не ограничена,
+    чтобы всплеск логов не блокировал обработку обновлений.
+    """
+    global _listener
+    stop_logging()
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *(handlers or build_handlers()), respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(LoopQueueHandler(log_queue))
+    root.setLevel(level)
+    return _listener
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(stop_logging)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Any, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from config import MEDIA_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+class MediaCache:
+    """Кэш file_id загруженных в Telegram файлов.
+
+    Каждый файл загружается один раз, дальше используется file_id из ответа
+    Telegram. Кэш хранится в JSON-файле и сбрасывается, если содержимое
+    файла изменилось (по sha256).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = self._load()  # asset -> {"sha256", "file_id", "file_unique_id"}
+        self._digests: Dict[str, Tuple[int, int, str]] = {}  # asset -> (mtime_ns, size, sha256)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Читает кэш с диска"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать кэш медиа %s: %s", self.path, e)
+            return {}
+
+    def _save(self):
+        """Атомарно записывает кэш на диск"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить кэш медиа %s: %s", self.path, e)
+
+    def _digest(self, asset: str) -> str:
+        """Возвращает sha256 файла, пересчитывая его только при изменении mtime/размера"""
+        st = os.stat(asset)
+        cached = self._digests.get(asset)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
+        sha = hashlib.sha256()
+        with open(asset, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self._digests[asset] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def get_file_id(self, asset: str) -> Optional[str]:
+        """Возвращает file_id, если он актуален для текущего содержимого файла"""
+        entry = self.entries.get(asset)
+        if not entry:
+            return None
+        if entry.get("sha256") != self._digest(asset):
+            logger.info("Файл %s изменился, file_id будет получен заново", asset)
+            self.invalidate(asset)
+            return None
+        return entry.get("file_id")
+
+    def get_file_unique_id(self, asset: str) -> Optional[str]:
+        """Постоянный идентификатор загруженного файла: в отличие от file_id,
+        он одинаков в любом сообщении с этим файлом"""
+        if self.get_file_id(asset) is None:
+            return None
+        return self.entries[asset].get("file_unique_id")
+
+    def store(self, asset: str, file_id: str, file_unique_id: Optional[str] = None):
+        """Запоминает file_id (и file_unique_id) для файла"""
+        self.entries[asset] = {"sha256": self._digest(asset), "file_id": file_id, "file_unique_id": file_unique_id}
+        self._save()
+
+    def invalidate(self, asset: str):
+        """Удаляет file_id файла из кэша"""
+        if self.entries.pop(asset, None) is not None:
+            self._save()
+
+    async def send_photo(self, bot: Bot, chat_id: int, asset: str, **kwargs) -> Message:
+        """Отправляет фото по file_id, загружая файл только при необходимости"""
+        file_id = self.get_file_id(asset)
+        if file_id:
+            try:
+                message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+                if message.photo and not self.entries[asset].get("file_unique_id"):
+                    # Запись из кэша без file_unique_id дополняется по ответу Telegram
+                    self.store(asset, file_id, message.photo[-1].file_unique_id)
+                return message
+            except TelegramBadRequest as e:
+                if "file" not in e.message.lower():
+                    raise
+                # Telegram не принял сохраненный file_id - загружаем файл заново
+                logger.warning("Telegram отклонил file_id для %s: %s", asset, e.message)
+                self.invalidate(asset)
+
+        message = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(asset), **kwargs)
+        if message.photo:
+            self.store(asset, message.photo[-1].file_id, message.photo[-1].file_unique_id)
+        return message
+
+# Глобальный экземпляр кэша медиа
+media_cache = MediaCache(MEDIA_CACHE_PATH)
@@ -0,0 +1,222 @@
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+def _format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Счетчик с метками"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self.series: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Оценка квантиля: верхняя граница корзины, в которую он попадает"""
+        series = self.series.get(labels)
+        if not series or not series[2]:
+            return None
+        rank = q * series[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Метрики бота и снимки состояния других компонентов в формате Prometheus"""
+
+    def __init__(self):
+        self.handler_latency = Histogram(
+            "bot_handler_duration_seconds", "Время работы обработчика", ("handler",)
+        )
+        self.handler_errors = Counter(
+            "bot_handler_errors_total", "Исключения в обработчиках", ("handler", "error")
+        )
+        self.updates = Counter(
+            "bot_updates_total", "Обновления по типу и состоянию FSM", ("event", "state")
+        )
+        self.api_latency = Histogram(
+            "bot_api_request_duration_seconds", "Время запроса к Bot API", ("method",)
+        )
+        self.api_errors = Counter(
+            "bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error")
+        )
+        self.api_retry_after = Counter(
+            "bot_api_retry_after_total", "Ответы RetryAfter от Bot API", ("method",)
+        )
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def register_collector(self, prefix: str, collect: Callable[[], Dict[str, float]]):
+        """Добавляет источник мгновенных значений (например, send_scheduler.stats)"""
+        self._collectors[prefix] = collect
+
+    def collect(self) -> Dict[str, Dict[str, float]]:
+        return {prefix: collect() for prefix, collect in self._collectors.items()}
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.handler_latency, self.handler_errors, self.updates,
+                       self.api_latency, self.api_errors, self.api_retry_after):
+            lines.extend(metric.render())
+        for prefix, values in self.collect().items():
+            for key, value in sorted(values.items()):
+                name = f"bot_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: считает обновления по типу и состоянию FSM.
+
+    Регистрируется после FSM-middleware диспетчера, поэтому состояние уже известно.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        self.registry.updates.inc(event_type, data.get("raw_state") or "none")
+        return await handler(event, data)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время работы каждого обработчика и его исключения"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # handler_name задает маршрутизатор callback: обработчик маршрута, а не общий dispatch
+        handler_object = data.get("handler")
+        name = data.get("handler_name") or (
+            getattr(handler_object.callback, "__name__", "unknown") if handler_object else "unknown"
+        )
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.registry.handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.registry.handler_latency.observe(time.perf_counter() - started, name)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время каждого запроса к Bot API и ошибки.
+
+    Подключается после send_scheduler, поэтому ожидание лимитов не входит
+    во время запроса, а каждый повтор после RetryAfter учитывается отдельно.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            self.registry.api_retry_after.inc(api_method)
+            raise
+        except Exception as e:
+            self.registry.api_errors.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            self.registry.api_latency.observe(time.perf_counter() - started, api_method)
+
+async def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP-сервер с GET /metrics в текстовом формате Prometheus"""
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from catalog import get_catalog
+
+def format_order_id(seq: int) -> str:
+    """ID заказа по порядковому номеру (42 -> ORDER_00042)"""
+    return f"ORDER_{seq:05d}"
+
+def order_seq(order_id: str) -> int:
+    """Порядковый номер заказа по его ID (ORDER_00042 -> 42)"""
+    return int(order_id.rsplit("_", 1)[-1])
+
+class Order:
+    """Заказ подписки.
+
+    Компактная запись со __slots__: план хранится по plan_id, а не копией
+    словаря из каталога; время - числом (Unix timestamp). Цена
+    фиксируется в момент выбора плана и не меняется с каталогом.
+    payment_id - ключ платежа у провайдера: ID заказа со случайным
+    суффиксом, потому что номера заказов в памяти после перезапуска
+    начинаются заново.
+    """
+    __slots__ = (
+        "seq", "user_id", "username", "first_name", "created_at", "status",
+        "plan_id", "price", "spotify_login", "payment_url", "completed_at", "payment_id"
+    )
+
+    FIELDS = __slots__
+
+    def __init__(self, seq: int, user_id: int, username: Optional[str] = "", first_name: Optional[str] = "",
+                 created_at: float = 0.0, status: str = "created", plan_id: Optional[str] = None,
+                 price: Optional[int] = None, spotify_login: Optional[str] = None,
+                 payment_url: Optional[str] = None, completed_at: Optional[float] = None,
+                 payment_id: Optional[str] = None):
+        self.seq = seq
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.created_at = created_at
+        self.status = status
+        self.plan_id = plan_id
+        self.price = price
+        self.spotify_login = spotify_login
+        self.payment_url = payment_url
+        self.completed_at = completed_at
+        self.payment_id = payment_id
+
+    @property
+    def order_id(self) -> str:
+        return format_order_id(self.seq)
+
+    @property
+    def plan(self) -> Optional[Dict[str, Any]]:
+        """План подписки из каталога (в том числе снятый с продажи)"""
+        return get_catalog().known.get(self.plan_id) if self.plan_id else None
+
+    @property
+    def plan_name(self) -> str:
+        plan = self.plan
+        return plan["name"] if plan else "не выбрано"
+
+    @property
+    def created_at_iso(self) -> str:
+        return datetime.fromtimestamp(self.created_at).isoformat()
+
+    @property
+    def completed_at_iso(self) -> Optional[str]:
+        return datetime.fromtimestamp(self.completed_at).isoformat() if self.completed_at else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь для сохранения на диск (время - в ISO-формате)"""
+        data = {field: getattr(self, field) for field in self.FIELDS if field != "seq"}
+        data["order_id"] = self.order_id
+        data["created_at"] = self.created_at_iso
+        data["completed_at"] = self.completed_at_iso
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Order":
+        """Восстанавливает заказ из словаря, в том числе старого формата с копией плана"""
+        plan_id = data.get("plan_id")
+        price = data.get("price")
+        legacy_plan = data.get("subscription_plan")
+        if legacy_plan and not plan_id:
+            plan_id = next((pid for pid, plan in get_catalog().known.items()
+                            if plan["name"] == legacy_plan.get("name")), None)
+        if legacy_plan and price is None:
+            price = legacy_plan.get("price")
+        completed_at = data.get("completed_at")
+        return cls(
+            seq=order_seq(data["order_id"]),
+            user_id=data["user_id"],
+            username=data.get("username"),
+            first_name=data.get("first_name"),
+            created_at=datetime.fromisoformat(data["created_at"]).timestamp(),
+            status=data.get("status", "created"),
+            plan_id=plan_id,
+            price=price,
+            spotify_login=data.get("spotify_login"),
+            payment_url=data.get("payment_url"),
+            completed_at=datetime.fromisoformat(completed_at).timestamp() if completed_at else None,
+            payment_id=data.get("payment_id"),
+        )
+
+    def __repr__(self) -> str:
+        return f"Order({self.order_id}, user_id={self.user_id}, status={self.status})"
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import db
+from send_scheduler import BULK, send_priority
+from config import ADMIN_ID, OUTBOX_DB_PATH, OUTBOX_DIGEST_WINDOW, OUTBOX_DIGEST_MAX, OUTBOX_MAX_BACKOFF
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину сообщения с запасом
+MAX_MESSAGE_LENGTH = 4000
+DIGEST_SEPARATOR = "\n─────────────────\n"
+
+class AdminOutbox:
+    """Очередь уведомлений администратору.
+
+    Обработчики только кладут текст в очередь; фоновая задача отправляет его,
+    повторяя попытки с экспоненциальной задержкой (или столько, сколько просит
+    Telegram в RetryAfter). Уведомления, пришедшие в течение digest_window,
+    объединяются в одно сообщение-сводку. Очередь хранится в SQLite и
+    переживает перезапуск.
+    """
+
+    def __init__(self, path: str, chat_id: str, digest_window: float = 2.0,
+                 digest_max: int = 10, max_backoff: float = 300):
+        self.chat_id = chat_id
+        self.digest_window = digest_window
+        self.digest_max = digest_max
+        self.max_backoff = max_backoff
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admin-outbox")
+        self._conn = db.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)"
+            )
+        rows = self._conn.execute("SELECT id, text FROM outbox ORDER BY id").fetchall()
+        self._pending: Deque[Tuple[int, str]] = deque(rows)
+        self._ids = itertools.count(rows[-1][0] + 1 if rows else 1)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        if rows:
+            logger.info("Восстановлено %d неотправленных уведомлений администратору", len(rows))
+
+    def enqueue(self, text: str):
+        """Ставит уведомление в очередь на отправку"""
+        item_id = next(self._ids)
+        self._pending.append((item_id, text))
+        self._submit(self._db_insert, item_id, text, time.time())
+        if self._wakeup:
+            self._wakeup.set()
+
+    # Работа с базой (выполняется в фоновом потоке)
+
+    def _db_insert(self, item_id: int, text: str, created: float):
+        with self._conn:
+            self._conn.execute("INSERT INTO outbox (id, text, created) VALUES (?, ?, ?)", (item_id, text, created))
+
+    def _db_delete(self, item_ids: List[int]):
+        with self._conn:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(item_id,) for item_id in item_ids])
+
+    def _submit(self, func, *args):
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._log_db_error)
+
+    @staticmethod
+    def _log_db_error(future):
+        if future.exception() is not None:
+            logger.error("Ошибка записи очереди уведомлений: %s", future.exception())
+
+    # Отправка
+
+    def _take_batch(self) -> List[Tuple[int, str]]:
+        """Берет из очереди уведомления, помещающиеся в одно сообщение"""
+        batch = [self._pending[0]]
+        length = len(batch[0][1])
+        for item in itertools.islice(self._pending, 1, self.digest_max):
+            length += len(DIGEST_SEPARATOR) + len(item[1])
+            if length > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(item)
+        return batch
+
+    @staticmethod
+    def _format(batch: List[Tuple[int, str]]) -> str:
+        if len(batch) == 1:
+            return batch[0][1]
+        header = f"📬 Сводка уведомлений: {len(batch)}\n\n"
+        return header + DIGEST_SEPARATOR.join(text for _, text in batch)
+
+    async def _deliver(self, bot: Bot, text: str) -> bool:
+        """Отправляет сообщение, повторяя попытки до успеха или постоянной ошибки"""
+        attempt = 0
+        while True:
+            try:
+                await bot.send_message(self.chat_id, text)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning("Flood control при уведомлении администратора, ждем %s с", e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                # Повтор не поможет - например, администратор заблокировал бота
+                logger.error("Уведомление администратору отклонено: %s", e)
+                return False
+            except (TelegramAPIError, OSError, asyncio.TimeoutError) as e:
+                delay = min(2 ** attempt, self.max_backoff)
+                attempt += 1
+                logger.warning("Ошибка отправки уведомления администратору (попытка %d): %s. Повтор через %s с",
+                               attempt, e, delay)
+                await asyncio.sleep(delay)
+
+    async def _run(self, bot: Bot):
+        # Уведомления администратору уступают очередь ответам пользователям
+        send_priority.set(BULK)
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Ждем, не подойдут ли еще уведомления, чтобы отправить их одной сводкой
+                await asyncio.sleep(self.digest_window)
+
+            batch = self._take_batch()
+            delivered = await self._deliver(bot, self._format(batch))
+            for _ in batch:
+                self._pending.popleft()
+            self._submit(self._db_delete, [item_id for item_id, _ in batch])
+            if delivered:
+                logger.info("Отправлено администратору уведомлений: %d", len(batch))
+
+    def start(self, bot: Bot):
+        """Запускает фоновую отправку"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def flush(self, timeout: float):
+        """Дает фоновой задаче отправить очередь, но не дольше timeout секунд"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._pending and self._task and not self._task.done() and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self._pending:
+            logger.warning("Не отправлено уведомлений администратору: %d, отправим после запуска", len(self._pending))
+
+    async def close(self):
+        """Останавливает отправку; неотправленные уведомления остаются в базе"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Дожидаемся отложенных записей в базу
+        await asyncio.get_running_loop().run_in_executor(self._executor, lambda: None)
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+# Глобальная очередь уведомлений администратору
+admin_outbox = AdminOutbox(
+    OUTBOX_DB_PATH,
+    ADMIN_ID,
+    digest_window=OUTBOX_DIGEST_WINDOW,
+    digest_max=OUTBOX_DIGEST_MAX,
+    max_backoff=OUTBOX_MAX_BACKOFF
+)
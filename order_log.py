@@ -0,0 +1,346 @@
+"""Журнал событий заказов: сегменты JSONL только для дописывания и снимки.
+
+Каждое изменение заказа - строка журнала с номером события (lsn):
+    {"lsn": 42, "type": "completed", "order": {...}, "stats": {"funnel:completed": 1, ...}}
+    {"lsn": 43, "type": "archived", "order_id": "ORDER_00007"}
+"stats" - изменения счетчиков /stats (stats.OrderStats) этим событием;
+их итог хранится и в снимке, поэтому показатели учитывают заказы,
+ушедшие в архив.
+
+Фоновый поток пишет события пачками: все, что накопилось, пока шел
+предыдущий fsync, уходит на диск одним fsync (group commit). Каждые
+snapshot_every событий состояние всех заказов сохраняется снимком, и
+сегменты до него удаляются, так что при запуске читается последний снимок
+и только хвост журнала после него.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d+)\.jsonl$")
+SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d+)\.jsonl$")
+
+# Событие, удаляющее заказ из состояния (заказ перенесен в архив)
+DELETE_EVENT = "archived"
+
+class OrderEventLog:
+    """Журнал событий заказов в каталоге directory"""
+
+    RETRY_DELAY = 0.5  # пауза перед повтором неудачной записи, удваивается до RETRY_MAX_DELAY
+    RETRY_MAX_DELAY = 5.0
+    _RETRY = object()  # элемент очереди: повторить запись без новых событий
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 snapshot_every: int = 10000, batch_size: int = 1000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.snapshot_every = snapshot_every
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+
+        self.lsn = 0
+        self.snapshot_lsn = 0
+        self.max_seq = 0
+        # Состояние на момент последнего записанного события: ID заказа -> JSON заказа.
+        # Из него пишутся снимки, не трогая заказы в цикле событий
+        self._state: Dict[str, str] = {}
+        # Счетчики показателей на тот же момент
+        self.counters: Dict[str, int] = {}
+        self._file = None
+        self._segment_size = 0
+
+        self.fsyncs = 0
+        self.events_written = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._snapshots = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-snapshot")
+        self._snapshot_running = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    # Восстановление
+
+    def _files(self, pattern: "re.Pattern") -> List[Tuple[int, str]]:
+        found = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def recover(self) -> Dict[str, Dict[str, Any]]:
+        """Читает последний снимок и хвост журнала; возвращает заказы по ID.
+
+        Вызывается один раз до start().
+        """
+        orders: Dict[str, Dict[str, Any]] = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Снимок, не дописанный до аварийной остановки
+                os.remove(os.path.join(self.directory, name))
+        snapshots = self._files(SNAPSHOT_PATTERN)
+        if snapshots:
+            self.snapshot_lsn, path = snapshots[-1]
+            with open(path, encoding="utf-8") as file:
+                header = json.loads(file.readline())
+                self.max_seq = header["max_seq"]
+                self.counters = header["stats"]
+                for line in file:
+                    order = json.loads(line)
+                    orders[order["order_id"]] = order
+                    self._state[order["order_id"]] = line.rstrip("\n")
+        self.lsn = self.snapshot_lsn
+
+        replayed = 0
+        for _, path in self._files(SEGMENT_PATTERN):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная запись при аварийной остановке: ее fsync не завершился,
+                        # и подтверждения по ней никто не получил
+                        logger.warning("Журнал %s оборван после события %s", path, self.lsn)
+                        break
+                    if event["lsn"] <= self.lsn:
+                        continue
+                    self.lsn = event["lsn"]
+                    self._apply(event, orders)
+                    replayed += 1
+        logger.info(
+            "Журнал заказов: снимок на событии %s, повторено событий: %s, заказов: %s",
+            self.snapshot_lsn, replayed, len(orders)
+        )
+        return orders
+
+    def _apply(self, event: Dict[str, Any], orders: Dict[str, Dict[str, Any]]):
+        if event["type"] == DELETE_EVENT:
+            orders.pop(event["order_id"], None)
+            self._state.pop(event["order_id"], None)
+        else:
+            order = event["order"]
+            orders[order["order_id"]] = order
+            self._state[order["order_id"]] = json.dumps(order, ensure_ascii=False)
+            self.max_seq = max(self.max_seq, int(order["order_id"].rsplit("_", 1)[-1]))
+        self._count(event.get("stats"))
+
+    def _count(self, stats: Optional[Dict[str, int]]):
+        for key, value in (stats or {}).items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Запись
+
+    def start(self):
+        """Открывает новый сегмент и запускает фоновую запись"""
+        self._open_segment()
+        self._writer = threading.Thread(target=self._write_loop, name="order-log", daemon=True)
+        self._writer.start()
+
+    def _open_segment(self):
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.directory, f"segment-{self.lsn + 1:012d}.jsonl")
+        # Сегмент с этим номером мог остаться от аварийной остановки только с оборванной
+        # записью (целые события из него уже прочитаны в recover) - перезаписываем
+        self._file = open(path, "w", encoding="utf-8")
+        self._segment_size = 0
+        self._fsync_directory()
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def append(self, event_type: str, order: Dict[str, Any], stats: Optional[Dict[str, int]] = None):
+        """Ставит событие с новым состоянием заказа и изменениями счетчиков в очередь на запись"""
+        self._queue.put((event_type, order["order_id"], order, stats))
+
+    def append_delete(self, order_id: str):
+        """Ставит удаление заказа (перенос в архив) в очередь на запись"""
+        self._queue.put((DELETE_EVENT, order_id, None, None))
+
+    def flush(self):
+        """Дожидается записи на диск всех поставленных событий"""
+        if not self._writer or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    async def sync(self):
+        """Асинхронно дожидается fsync всех поставленных событий"""
+        if not self._writer or not self._writer.is_alive():
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((loop, future))
+        await future
+
+    def _write_loop(self):
+        """Фоновый поток: пишет накопившиеся события и делает один fsync на пачку.
+
+        События, которые не удалось записать, уже получили lsn и вошли в
+        состояние снимков, поэтому не теряются: они пишутся заново в новый
+        сегмент раньше новых событий, с растущей паузой между попытками.
+        """
+        pending: List[str] = []
+        delay = self.RETRY_DELAY
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters = []
+            stop = False
+            for item in items:
+                if item is None:
+                    stop = True
+                elif item is self._RETRY:
+                    pass
+                elif isinstance(item, threading.Event) or len(item) == 2:
+                    # flush() или sync()
+                    waiters.append(item)
+                else:
+                    pending.append(self._encode(*item))
+
+            error = None
+            if pending:
+                try:
+                    self._write(pending)
+                    pending = []
+                    delay = self.RETRY_DELAY
+                except Exception as e:
+                    error = e
+                    logger.error(
+                        "Ошибка записи %d событий журнала заказов, повтор через %.1f с: %s", len(pending), delay, e
+                    )
+                    self._reopen_after_error()
+            for waiter in waiters:
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                else:
+                    loop, future = waiter
+                    loop.call_soon_threadsafe(self._resolve, future, error)
+            if stop:
+                if pending:
+                    logger.error("При остановке не записано %d событий журнала заказов", len(pending))
+                return
+            if error:
+                time.sleep(delay)
+                delay = min(delay * 2, self.RETRY_MAX_DELAY)
+                if self._queue.empty():
+                    # Повтор без новых событий
+                    self._queue.put(self._RETRY)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: Optional[Exception]):
+        if future.done():
+            return
+        if error:
+            # Ожидающий sync() не должен считать изменения сохраненными
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+    def _reopen_after_error(self):
+        """Повтор и следующие события - в новый сегмент, после возможно недописанной строки.
+
+        События, все же попавшие в старый сегмент, при восстановлении
+        пропускаются по lsn.
+        """
+        try:
+            self._open_segment()
+        except Exception as e:
+            logger.error("Не удалось открыть новый сегмент журнала заказов: %s", e)
+
+    def _encode(self, event_type: str, order_id: str, order: Optional[Dict[str, Any]],
+                stats: Optional[Dict[str, int]]) -> str:
+        self.lsn += 1
+        if order is None:
+            self._state.pop(order_id, None)
+            return f'{{"lsn": {self.lsn}, "type": "{event_type}", "order_id": "{order_id}"}}\n'
+        order_json = json.dumps(order, ensure_ascii=False)
+        self._state[order_id] = order_json
+        self.max_seq = max(self.max_seq, int(order_id.rsplit("_", 1)[-1]))
+        if not stats:
+            return f'{{"lsn": {self.lsn}, "type": "{event_type}", "order": {order_json}}}\n'
+        self._count(stats)
+        return f'{{"lsn": {self.lsn}, "type": "{event_type}", "order": {order_json}, "stats": {json.dumps(stats)}}}\n'
+
+    def _write(self, lines: List[str]):
+        data = "".join(lines)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self.events_written += len(lines)
+        self._segment_size += len(data)
+
+        if self.lsn - self.snapshot_lsn >= self.snapshot_every and not self._snapshot_running.is_set():
+            # Снимок пишется в своем потоке по копии состояния, с нового сегмента
+            self._snapshot_running.set()
+            self._open_segment()
+            self._snapshots.submit(self._write_snapshot, self.lsn, self.max_seq, dict(self._state), dict(self.counters))
+        elif self._segment_size >= self.segment_bytes:
+            self._open_segment()
+
+    # Снимки
+
+    def _write_snapshot(self, lsn: int, max_seq: int, state: Dict[str, str], counters: Dict[str, int]):
+        try:
+            path = os.path.join(self.directory, f"snapshot-{lsn:012d}.jsonl")
+            tmp_path = f"{path}.tmp"
+            header = {"lsn": lsn, "max_seq": max_seq, "stats": counters}
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(json.dumps(header) + "\n")
+                for order_json in state.values():
+                    file.write(order_json + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+            self._fsync_directory()
+            self.snapshot_lsn = lsn
+
+            # Все события до снимка больше не нужны
+            for first_lsn, old in self._files(SEGMENT_PATTERN):
+                if first_lsn <= lsn:
+                    os.remove(old)
+            for snapshot_lsn, old in self._files(SNAPSHOT_PATTERN):
+                if snapshot_lsn < lsn:
+                    os.remove(old)
+            logger.info("Снимок заказов на событии %s: %s заказов", lsn, len(state))
+        except Exception as e:
+            logger.error("Ошибка записи снимка заказов: %s", e)
+        finally:
+            self._snapshot_running.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lsn": self.lsn,
+            "snapshot_lsn": self.snapshot_lsn,
+            "events_written": self.events_written,
+            "fsyncs": self.fsyncs,
+            "segments": len(self._files(SEGMENT_PATTERN)),
+        }
+
+    def close(self):
+        """Дописывает события, дожидается снимка и закрывает журнал"""
+        if self._writer and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._snapshots.shutdown(wait=True)
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from aiohttp import web
+
+from models import Order
+from payments import PAYMENT_PAID, PAYMENT_PENDING, PaidCallback, PaymentProvider, payment_provider
+from storage import OrderStorage, order_storage
+from config import (
+    PAYMENT_WEBHOOK_PATH, RECONCILE_INTERVAL, RECONCILE_BATCH_SIZE, RECONCILE_MIN_AGE, PAYMENT_HOLD_MAX_AGE
+)
+
+logger = logging.getLogger(__name__)
+
+class PaymentWebhook:
+    """Прием уведомлений провайдера об оплате.
+
+    Ответ 200 отправляется после обработки: если заказ не удалось завершить
+    (ошибка записи) или он не найден ни в хранилище, ни в архиве, ответ 503,
+    и провайдер повторит уведомление. Повторные уведомления по уже
+    завершенному заказу ничего не меняют.
+    """
+
+    def __init__(self, provider: PaymentProvider, path: str):
+        self.provider = provider
+        self.path = path
+        self.received = 0
+        self.rejected = 0
+        self._on_paid: Optional[PaidCallback] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            events = self.provider.parse_webhook(request.headers, body)
+        except (ValueError, KeyError, TypeError) as e:
+            self.rejected += 1
+            logger.warning("Отклонено уведомление об оплате: %s", e)
+            return web.Response(status=400)
+        self.received += len(events)
+        for event in events:
+            if event.status == PAYMENT_PAID:
+                try:
+                    await self._on_paid(event, "webhook")
+                except Exception as e:
+                    # Заказ не найден или не записан: провайдер повторит уведомление
+                    logger.error("Уведомление об оплате не обработано: %s", e)
+                    return web.Response(status=503)
+        return web.json_response({})
+
+    async def start(self, on_paid: PaidCallback, host: str, port: int):
+        """Запускает HTTP-сервер уведомлений (для провайдеров, которые их присылают)"""
+        if not self.provider.confirms_payments:
+            return
+        self._on_paid = on_paid
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Уведомления об оплате принимаются на %s:%s%s", host, port, self.path)
+
+    async def close(self):
+        """Останавливает прием, дождавшись уже начатых уведомлений"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+class PaymentReconciler:
+    """Фоновая сверка заказов в статусе awaiting_payment с провайдером.
+
+    Подстраховывает потерянные уведомления: раз в interval секунд заказы,
+    ожидающие оплаты дольше min_age, проверяются пачками по batch_size
+    одним запросом статусов на пачку, оплаченные завершаются. Платежи,
+    которые провайдер отменил или не знает, запоминаются до следующего
+    прохода: только такие заказы OrderReaper может перенести в архив.
+    Открытый платеж держит заказ не дольше max_hold_age секунд: провайдер
+    может вообще не отменять платежи, а поздняя оплата все равно вернет
+    заказ из архива.
+    """
+
+    def __init__(self, storage: OrderStorage, provider: PaymentProvider, interval: float = 60,
+                 batch_size: int = 100, min_age: float = 120, max_hold_age: float = 7 * 24 * 3600):
+        self.storage = storage
+        self.provider = provider
+        self.interval = interval
+        self.batch_size = min(batch_size, provider.batch_limit)
+        self.min_age = min_age
+        self.max_hold_age = max_hold_age
+        self.requests = 0
+        self.checked = 0
+        self.confirmed = 0
+        self._closed: Set[str] = set()  # payment_id платежей, которые уже не будут оплачены
+        self._on_paid: Optional[PaidCallback] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def reconcile(self) -> int:
+        """Один проход сверки; возвращает число завершенных заказов"""
+        cutoff = time.time() - self.min_age
+        payment_ids = [order.payment_id for order in self.storage.get_orders_by_status("awaiting_payment")
+                       if order.created_at <= cutoff and order.payment_id]
+        confirmed = 0
+        closed = set()
+        for i in range(0, len(payment_ids), self.batch_size):
+            batch = payment_ids[i:i + self.batch_size]
+            statuses = await self.provider.get_statuses(batch)
+            self.requests += 1
+            self.checked += len(batch)
+            for payment_id in batch:
+                event = statuses.get(payment_id)
+                if event is None or event.status not in (PAYMENT_PAID, PAYMENT_PENDING):
+                    closed.add(payment_id)
+                    continue
+                try:
+                    if event.status == PAYMENT_PAID and await self._on_paid(event, "reconcile"):
+                        confirmed += 1
+                except Exception as e:
+                    logger.error("Сверка: оплата не обработана: %s", e)
+        self._closed = closed
+        if confirmed:
+            self.confirmed += confirmed
+            logger.info("Сверка с провайдером: завершено заказов %d из %d", confirmed, len(payment_ids))
+        return confirmed
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set():
+                break
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error("Ошибка сверки платежей: %s", e)
+
+    def holds(self, order: Order) -> bool:
+        """У заказа открыт платеж: провайдер может прислать оплату, заказ нельзя архивировать"""
+        if self.max_hold_age > 0 and time.time() - order.created_at > self.max_hold_age:
+            return False
+        return (self.provider.confirms_payments and order.status == "awaiting_payment"
+                and bool(order.payment_id) and order.payment_id not in self._closed)
+
+    def start(self, on_paid: PaidCallback):
+        """Запускает периодическую сверку (для провайдеров, которые сообщают статусы)"""
+        self._on_paid = on_paid
+        if self.provider.confirms_payments and self.interval > 0:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Останавливает сверку, дав закончить текущий проход"""
+        if self._task:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {"requests": self.requests, "checked": self.checked, "confirmed": self.confirmed}
+
+# Глобальные прием уведомлений и сверка
+payment_webhook = PaymentWebhook(payment_provider, PAYMENT_WEBHOOK_PATH)
+payment_reconciler = PaymentReconciler(
+    order_storage, payment_provider,
+    interval=RECONCILE_INTERVAL,
+    batch_size=RECONCILE_BATCH_SIZE,
+    min_age=RECONCILE_MIN_AGE,
+    max_hold_age=PAYMENT_HOLD_MAX_AGE
+)
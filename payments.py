@@ -0,0 +1,134 @@
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional
+
+import aiohttp
+
+from models import Order
+from config import PAYMENT_PROVIDER, PAYMENT_API_URL, PAYMENT_SECRET, PAYMENT_WEBHOOK_PATH, PAYMENT_NOTIFY_URL
+
+logger = logging.getLogger(__name__)
+
+# Статусы платежа у провайдера
+PAYMENT_PENDING = "pending"
+PAYMENT_PAID = "paid"
+PAYMENT_CANCELED = "canceled"
+
+SIGNATURE_HEADER = "X-Payment-Signature"
+
+@dataclass(frozen=True)
+class PaymentEvent:
+    """Состояние платежа по заказу, как его сообщает провайдер"""
+    payment_id: str
+    status: str
+    amount: Optional[int] = None  # оплаченная сумма, ₽
+
+    @property
+    def order_id(self) -> str:
+        return payment_order_id(self.payment_id)
+
+def new_payment_id(order: Order) -> str:
+    """Уникальный ключ платежа: ORDER_00042-<случайный суффикс>.
+
+    Один ID заказа не годится: с хранилищем в памяти номера после
+    перезапуска выдаются заново, и у провайдера новый заказ совпал бы
+    со старым, уже оплаченным платежом.
+    """
+    return f"{order.order_id}-{secrets.token_hex(6)}"
+
+def payment_order_id(payment_id: str) -> str:
+    """ID заказа по ключу платежа"""
+    return payment_id.split("-", 1)[0]
+
+# Вызывается для оплаченного платежа; True - заказ завершен этим вызовом
+PaidCallback = Callable[[PaymentEvent, str], Awaitable[bool]]
+
+def sign(secret: str, body: bytes) -> str:
+    """Подпись тела уведомления: HMAC-SHA256 в hex"""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+class PaymentProvider:
+    """Платежный провайдер: ссылка на оплату, уведомления и проверка статусов.
+
+    confirms_payments=False - провайдер не сообщает об оплате, и заказ
+    завершается по кнопке "Я оплатил" (ручная проверка администратором).
+    """
+    name = "manual"
+    confirms_payments = False
+    batch_limit = 100  # платежей в одном запросе статусов
+
+    async def create_payment(self, order: Order, notify_url: str) -> str:
+        """Создает платеж order.payment_id по заказу и возвращает ссылку на оплату"""
+        return f"https://payment-gateway.example.com/pay?order_id={order.order_id}&amount={order.price}"
+
+    def parse_webhook(self, headers: Mapping[str, str], body: bytes) -> List[PaymentEvent]:
+        """Проверяет подпись уведомления и разбирает его; ValueError - уведомление отклоняется"""
+        raise ValueError("Провайдер не присылает уведомлений")
+
+    async def get_statuses(self, payment_ids: List[str]) -> Dict[str, PaymentEvent]:
+        """Статусы платежей по их ключам одним запросом (не больше batch_limit платежей)"""
+        return {}
+
+    async def close(self):
+        pass
+
+class FakePaymentProvider(PaymentProvider):
+    """Клиент локального провайдера из fake_provider.py для проверки оплаты без сети"""
+    name = "fake"
+    confirms_payments = True
+
+    def __init__(self, api_url: str, secret: str):
+        self.api_url = api_url.rstrip("/")
+        self.secret = secret
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _request(self, path: str, payload: Dict) -> Dict:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {self.secret}"},
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        async with self._session.post(f"{self.api_url}{path}", json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def create_payment(self, order: Order, notify_url: str) -> str:
+        data = await self._request("/api/payments", {
+            "payment_id": order.payment_id, "amount": order.price, "notify_url": notify_url
+        })
+        return data["url"]
+
+    def parse_webhook(self, headers: Mapping[str, str], body: bytes) -> List[PaymentEvent]:
+        if not hmac.compare_digest(headers.get(SIGNATURE_HEADER, ""), sign(self.secret, body)):
+            raise ValueError("Неверная подпись уведомления")
+        data = json.loads(body)
+        return [PaymentEvent(data["payment_id"], data["status"], data.get("amount"))]
+
+    async def get_statuses(self, payment_ids: List[str]) -> Dict[str, PaymentEvent]:
+        data = await self._request("/api/payments/status", {"payment_ids": payment_ids})
+        return {
+            payment_id: PaymentEvent(payment_id, payment["status"], payment.get("amount"))
+            for payment_id, payment in data["payments"].items()
+        }
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+def create_payment_provider() -> PaymentProvider:
+    """Провайдер согласно настройкам"""
+    if PAYMENT_PROVIDER == "fake":
+        return FakePaymentProvider(PAYMENT_API_URL, PAYMENT_SECRET)
+    if PAYMENT_PROVIDER != "manual":
+        logger.warning("Неизвестный PAYMENT_PROVIDER=%s, оплата подтверждается вручную", PAYMENT_PROVIDER)
+    return PaymentProvider()
+
+# Глобальный провайдер
+payment_provider = create_payment_provider()
+# Адрес уведомлений, который передается провайдеру при создании платежа
+payment_notify_url = f"{PAYMENT_NOTIFY_URL.rstrip('/')}{PAYMENT_WEBHOOK_PATH}"
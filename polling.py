@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+def signal_stop_event() -> asyncio.Event:
+    """Событие, которое выставляют SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+    return stop_event
+
+class OffsetStore:
+    """Файл с позицией чтения getUpdates.
+
+    offset - следующее обновление, которое нужно запросить у Telegram;
+    pending - обновления до него, которые получены, но еще обрабатываются
+    (как их отдал Telegram): после перезапуска они обрабатываются заново.
+    Файл заменяется атомарно: после сбоя остается старая или новая версия
+    целиком.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+        if not self.path or not os.path.exists(self.path):
+            return None, []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("offset"), list(data.get("pending", ()))
+        except (OSError, ValueError) as e:
+            logger.error("Не удалось прочитать позицию обновлений %s: %s", self.path, e)
+            return None, []
+
+    def save(self, offset: Optional[int], pending: Sequence[Dict[str, Any]] = ()):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"offset": offset, "pending": list(pending)}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+class UpdateTracker:
+    """Позиция чтения и полученные, но еще не обработанные обновления.
+
+    Telegram отдает обновления по возрастанию update_id, начиная с offset,
+    поэтому offset сразу сдвигается за последнее полученное: обновления
+    в обработке хранятся здесь целиком и сохраняются вместе с позицией.
+    """
+
+    def __init__(self, offset: Optional[int] = None):
+        self.offset = offset
+        self.in_flight: Dict[int, Dict[str, Any]] = {}
+
+    def is_new(self, update_id: int) -> bool:
+        if self.offset is not None and update_id < self.offset:
+            return False
+        return update_id not in self.in_flight
+
+    def started(self, update_id: int, payload: Dict[str, Any]):
+        self.in_flight[update_id] = payload
+
+    def received_upto(self, update_id: int):
+        if self.offset is None or update_id >= self.offset:
+            self.offset = update_id + 1
+
+    def finished(self, update_id: int):
+        self.in_flight.pop(update_id, None)
+
+    def checkpoint(self) -> Tuple[Optional[int], Tuple[int, ...]]:
+        """Что изменилось с прошлого сохранения: позиция и id обновлений в обработке"""
+        return self.offset, tuple(sorted(self.in_flight))
+
+    def pending(self) -> List[Dict[str, Any]]:
+        return [self.in_flight[update_id] for update_id in sorted(self.in_flight)]
+
+class ReliablePolling:
+    """getUpdates без потери обновлений при перезапуске.
+
+    Telegram считает обновление доставленным, когда getUpdates вызывается
+    с offset больше его update_id. offset сдвигается сразу за последнее
+    полученное обновление, а обновления, которые еще обрабатываются,
+    сохраняются целиком в файл вместе с позицией перед каждым запросом.
+    Поэтому медленный обработчик не задерживает остальные: Telegram не
+    повторяет уже выданные обновления, а после перезапуска прерванные
+    обработчики запускаются заново из файла. Новые обновления не
+    запрашиваются, пока заняты все concurrency обработчиков.
+
+    При остановке новые обновления не запрашиваются, обработчики
+    дорабатывают (не дольше drain_timeout), позиция сохраняется и
+    подтверждается Telegram.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, store: OffsetStore, concurrency: int,
+                 polling_timeout: int = 30, drain_timeout: float = 30, allowed_updates: Optional[List[str]] = None):
+        self.bot = bot
+        self.dp = dp
+        self.store = store
+        self.polling_timeout = polling_timeout
+        self.drain_timeout = drain_timeout
+        self.allowed_updates = allowed_updates
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._saved: Optional[Tuple[Optional[int], Tuple[int, ...]]] = None
+        self.tracker = UpdateTracker()
+        self.handled = 0
+        self.redelivered = 0
+        self.replayed = 0
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except asyncio.CancelledError:
+            # Прервано при остановке: остается в обработке и запустится после перезапуска
+            self._semaphore.release()
+            raise
+        except Exception as e:
+            logger.error("Ошибка обработки обновления %s: %s", update.update_id, e)
+        self.tracker.finished(update.update_id)
+        self.handled += 1
+        self._semaphore.release()
+
+    async def _start(self, update: Update, payload: Dict[str, Any]):
+        await self._semaphore.acquire()
+        self.tracker.started(update.update_id, payload)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _save(self) -> bool:
+        """Сохраняет позицию и обновления в обработке; False - файл не записан"""
+        checkpoint = self.tracker.checkpoint()
+        if checkpoint == self._saved:
+            return True
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.store.save, checkpoint[0], self.tracker.pending()
+            )
+            self._saved = checkpoint
+            return True
+        except OSError as e:
+            logger.error("Не удалось сохранить позицию обновлений: %s", e)
+            return False
+
+    async def _replay(self, pending: List[Dict[str, Any]]):
+        """Заново запускает обновления, которые обрабатывались при остановке"""
+        for payload in pending:
+            try:
+                update = Update.model_validate(payload, context={"bot": self.bot})
+            except ValueError as e:
+                logger.error("Пропущено сохраненное обновление %s: %s", payload.get("update_id"), e)
+                continue
+            await self._start(update, payload)
+            self.replayed += 1
+        if pending:
+            logger.info("Повторно обрабатываются %d прерванных обновлений", self.replayed)
+
+    async def run(self, stop_event: Optional[asyncio.Event] = None):
+        """Получает и обрабатывает обновления до stop_event (по умолчанию SIGINT/SIGTERM)"""
+        stop_event = stop_event or signal_stop_event()
+        offset, pending = self.store.load()
+        self.tracker = UpdateTracker(offset)
+        self._saved = self.tracker.checkpoint() if not pending else None
+        if self.tracker.offset is not None:
+            logger.info("Продолжение с обновления %s", self.tracker.offset)
+        try:
+            await self._replay(pending)
+            while not stop_event.is_set():
+                # Обновления, за которые сдвигается offset, должны быть в файле до запроса
+                if not await self._save():
+                    await asyncio.sleep(1)
+                    continue
+                get_updates = asyncio.create_task(self.bot.get_updates(
+                    offset=self.tracker.offset, timeout=self.polling_timeout, allowed_updates=self.allowed_updates
+                ))
+                stop_wait = asyncio.create_task(stop_event.wait())
+                await asyncio.wait({get_updates, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+                stop_wait.cancel()
+                if not get_updates.done():
+                    get_updates.cancel()
+                    break
+                try:
+                    updates = get_updates.result()
+                except Exception as e:
+                    logger.error("Ошибка получения обновлений: %s", e)
+                    await asyncio.sleep(1)
+                    continue
+
+                for update in updates:
+                    if not self.tracker.is_new(update.update_id):
+                        self.redelivered += 1
+                        continue
+                    # Ждет свободного обработчика: так же сдерживаются и запросы к Telegram
+                    await self._start(update, update.model_dump(mode="json", by_alias=True, exclude_none=True))
+                if updates:
+                    self.tracker.received_upto(updates[-1].update_id)
+        finally:
+            await self.drain()
+
+    async def drain(self):
+        """Дожидается обработчиков, сохраняет позицию и подтверждает ее Telegram"""
+        if self._tasks:
+            logger.info("Ожидание %d обновлений в обработке...", len(self._tasks))
+            _, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+            if pending:
+                # Не завершенные обновления остаются в файле и запустятся после перезапуска
+                logger.warning("Не дождались %d обновлений за %s с, прерываем", len(pending), self.drain_timeout)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        offset = self.tracker.offset
+        if await self._save() and offset is not None:
+            try:
+                # Подтверждаем полученные, чтобы Telegram не хранил их до следующего запуска
+                await self.bot.get_updates(offset=offset, limit=1, timeout=0, allowed_updates=self.allowed_updates)
+            except Exception as e:
+                logger.warning("Не удалось подтвердить позицию обновлений: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._tasks),
+            "handled": self.handled,
+            "redelivered": self.redelivered,
+            "replayed": self.replayed,
+            "offset": self.tracker.offset or 0,
+        }
@@ -0,0 +1,79 @@
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pydantic import ConfigDict
+
+from catalog import PlanCatalog, get_catalog
+from keyboards import (
+    get_main_menu_keyboard, get_subscription_keyboard, get_back_to_start_keyboard, get_back_to_menu_keyboard,
+    get_renewal_keyboard
+)
+from texts import format_subscription_text, format_plan_selected_texts
+
+logger = logging.getLogger(__name__)
+
+class FrozenInlineKeyboardButton(InlineKeyboardButton):
+    """Кнопка, которую нельзя изменить после создания"""
+    model_config = ConfigDict(frozen=True)
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """Клавиатура, которую нельзя изменить после создания"""
+    model_config = ConfigDict(frozen=True)
+
+def freeze_keyboard(keyboard: InlineKeyboardMarkup) -> FrozenInlineKeyboardMarkup:
+    """Копирует клавиатуру в неизменяемые модели для общего использования"""
+    return FrozenInlineKeyboardMarkup(inline_keyboard=[
+        [FrozenInlineKeyboardButton(**button.model_dump(exclude_none=True)) for button in row]
+        for row in keyboard.inline_keyboard
+    ])
+
+@dataclass(frozen=True)
+class RenderCache:
+    """Готовые клавиатуры и тексты, собранные один раз на версию каталога планов.
+
+    Объекты общие для всех обновлений, поэтому клавиатуры заморожены.
+    Кэш хранит свой каталог: обработчик берет цены и тексты из одной версии,
+    даже если каталог обновится посреди обработки.
+    """
+    catalog: PlanCatalog
+    main_menu_keyboard: InlineKeyboardMarkup
+    subscription_keyboard: InlineKeyboardMarkup
+    back_to_start_keyboard: InlineKeyboardMarkup
+    back_to_menu_keyboard: InlineKeyboardMarkup
+    renewal_keyboard: InlineKeyboardMarkup
+    subscription_text: str
+    plan_selected_texts: Mapping[str, str]  # plan_id -> текст запроса данных Spotify
+
+def build_render_cache(catalog: PlanCatalog) -> RenderCache:
+    """Собирает все статические клавиатуры и тексты для каталога планов"""
+    plans = catalog.plans
+    return RenderCache(
+        catalog=catalog,
+        main_menu_keyboard=freeze_keyboard(get_main_menu_keyboard()),
+        subscription_keyboard=freeze_keyboard(get_subscription_keyboard(plans, catalog.version)),
+        back_to_start_keyboard=freeze_keyboard(get_back_to_start_keyboard()),
+        back_to_menu_keyboard=freeze_keyboard(get_back_to_menu_keyboard()),
+        renewal_keyboard=freeze_keyboard(get_renewal_keyboard()),
+        subscription_text=format_subscription_text(plans),
+        plan_selected_texts=MappingProxyType(format_plan_selected_texts(plans)),
+    )
+
+_render_cache: Optional[RenderCache] = None
+
+def init_render_cache() -> RenderCache:
+    """Строит кэш отрисовки для текущей версии каталога"""
+    global _render_cache
+    catalog = get_catalog()
+    _render_cache = build_render_cache(catalog)
+    logger.info("Кэш отрисовки собран для %d планов, версия каталога %s", len(catalog.plans), catalog.version)
+    return _render_cache
+
+def get_render_cache() -> RenderCache:
+    """Возвращает общий кэш отрисовки; после обновления каталога первый вызов собирает его заново"""
+    cache = _render_cache
+    if cache is None or cache.catalog is not get_catalog():
+        cache = init_render_cache()
+    return cache
@@ -0,0 +1,299 @@
+import asyncio
+import calendar
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+
+import db
+from catalog import get_catalog
+from models import Order, format_order_id
+from send_scheduler import BULK, send_priority
+from storage import OrderStorage, order_storage
+from render import get_render_cache
+from texts import RENEWAL_REMINDER_TEXT
+from config import RENEWAL_REMIND_BEFORE, RENEWAL_DB_PATH, RENEWAL_RETRY_DELAY, RENEWAL_SEND_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTIONS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS subscriptions ("
+    "seq INTEGER NOT NULL, user_id INTEGER NOT NULL, completed_at INTEGER NOT NULL, "
+    "plan_id TEXT NOT NULL, expires_at REAL NOT NULL, reminded_at REAL, "
+    "PRIMARY KEY (seq, user_id, completed_at))"
+)
+
+# Самый длинный месяц с запасом на переход на летнее время, сек
+MAX_MONTH = 31 * 24 * 3600 + 3600
+
+def add_months(timestamp: float, months: int) -> float:
+    """Тот же день через months месяцев (31 января + 1 месяц -> 28/29 февраля)"""
+    start = datetime.fromtimestamp(timestamp)
+    month = start.month - 1 + months
+    year, month = start.year + month // 12, month % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return start.replace(year=year, month=month, day=day).timestamp()
+
+class Reminder(NamedTuple):
+    """Запись расписания; сравнивается по remind_at, поэтому годится для кучи.
+
+    Подписка определяется заказом, пользователем и временем оплаты, а не
+    одним номером заказа: в хранилище в памяти номера после перезапуска
+    начинаются заново, а строки таблицы остаются.
+    """
+    remind_at: float
+    seq: int  # номер заказа
+    user_id: int
+    completed_at: int  # время оплаты, целые секунды
+    plan_id: str
+    expires_at: float
+
+    @property
+    def key(self) -> Tuple[int, int, int]:
+        return self.seq, self.user_id, self.completed_at
+
+    @property
+    def order_id(self) -> str:
+        return format_order_id(self.seq)
+
+def subscription_key(order: Order) -> Tuple[int, int, int]:
+    return order.seq, order.user_id, int(order.completed_at or 0)
+
+def subscription_expiry(order: Order) -> Optional[float]:
+    """Окончание подписки оплаченного заказа: дата оплаты + срок плана"""
+    plan = order.plan
+    if order.status != "completed" or not order.completed_at or not plan:
+        return None
+    return add_months(order.completed_at, plan["months"])
+
+class RenewalScheduler:
+    """Напоминания о продлении незадолго до окончания подписки.
+
+    Сроки напоминаний лежат в куче записей Reminder: фоновая задача спит до
+    ближайшего срока и не перебирает заказы. Подписка (заказ, пользователь,
+    план, время оплаты и окончания) и отметка об отправленном напоминании
+    хранятся в SQLite, поэтому при запуске куча собирается из таблицы без
+    расчета дат, а напоминание отправляется по данным строки, даже если
+    заказа уже нет в памяти. Считаются только оплаченные заказы, которых
+    в таблице еще нет. Напоминания уходят с приоритетом BULK через
+    планировщик отправки и не задерживают ответы пользователям.
+    """
+
+    def __init__(self, storage: OrderStorage, path: str, remind_before: float,
+                 retry_delay: float = 600, concurrency: int = 10):
+        self.storage = storage
+        self.remind_before = remind_before
+        self.retry_delay = retry_delay
+        self.concurrency = concurrency
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self._heap: List[Reminder] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="renewals")
+        self._conn = db.connect(path)
+        with self._conn:
+            self._conn.execute(SUBSCRIPTIONS_SCHEMA)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "scheduled": len(self._heap),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "next_in_seconds": max(0.0, self._heap[0].remind_at - time.time()) if self._heap else 0,
+        }
+
+    def rebuild(self) -> int:
+        """Собирает кучу из таблицы и дописывает в нее оплаченные заказы, которых там нет"""
+        now = time.time()
+        with self._conn:
+            # Подписки, которые уже закончились, больше не нужны
+            self._conn.execute("DELETE FROM subscriptions WHERE expires_at <= ?", (now,))
+        rows = self._conn.execute(
+            "SELECT seq, user_id, completed_at, plan_id, expires_at, reminded_at FROM subscriptions"
+        ).fetchall()
+        known = {(seq, user_id, completed_at) for seq, user_id, completed_at, _, _, _ in rows}
+        heap = [Reminder(expires_at - self.remind_before, seq, user_id, completed_at, plan_id, expires_at)
+                for seq, user_id, completed_at, plan_id, expires_at, reminded_at in rows
+                if reminded_at is None]
+
+        added = []
+        plans = get_catalog().known
+        for order in self.storage.get_orders_by_status("completed"):
+            plan = plans.get(order.plan_id)
+            if not plan or not order.completed_at or order.completed_at + plan["months"] * MAX_MONTH <= now:
+                # Заведомо закончилась: даты не считаем
+                continue
+            if subscription_key(order) in known:
+                continue
+            expires_at = subscription_expiry(order)
+            if expires_at is not None and expires_at > now:
+                reminder = self._reminder(order, expires_at)
+                added.append(reminder)
+                heap.append(reminder)
+        if added:
+            self._submit(self._db_insert, added)
+        heapq.heapify(heap)
+        self._heap = heap
+        return len(heap)
+
+    def schedule(self, order: Order):
+        """Добавляет напоминание для только что оплаченного заказа"""
+        if self.remind_before <= 0:
+            return
+        expires_at = subscription_expiry(order)
+        if expires_at is None or expires_at <= time.time():
+            return
+        reminder = self._reminder(order, expires_at)
+        self._submit(self._db_insert, [reminder])
+        heapq.heappush(self._heap, reminder)
+        if self._wakeup and self._heap[0] is reminder:
+            self._wakeup.set()
+
+    def _reminder(self, order: Order, expires_at: float) -> Reminder:
+        return Reminder(expires_at - self.remind_before, *subscription_key(order), order.plan_id, expires_at)
+
+    # Работа с базой (выполняется в фоновом потоке)
+
+    def _db_insert(self, reminders: List[Reminder]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO subscriptions (seq, user_id, completed_at, plan_id, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(*reminder.key, reminder.plan_id, reminder.expires_at) for reminder in reminders]
+            )
+
+    def _db_mark_reminded(self, reminders: List[Reminder], reminded_at: float):
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE subscriptions SET reminded_at = ? WHERE seq = ? AND user_id = ? AND completed_at = ?",
+                [(reminded_at, *reminder.key) for reminder in reminders]
+            )
+
+    def _submit(self, func, *args):
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._log_db_error)
+
+    @staticmethod
+    def _log_db_error(future):
+        if future.exception() is not None:
+            logger.error("Ошибка записи расписания напоминаний: %s", future.exception())
+
+    # Отправка
+
+    def _is_current(self, reminder: Reminder) -> bool:
+        """Подписка еще действует: заказ с тем же ID в хранилище - именно этот
+        (а не заказ с повторно выданным номером), и пользователь еще не продлил"""
+        order = self.storage.orders.get(reminder.seq)
+        if order and subscription_key(order) == reminder.key and order.status != "completed":
+            return False
+        for other in self.storage.get_user_orders(reminder.user_id):
+            if (subscription_expiry(other) or 0) > reminder.expires_at:
+                # Есть оплаченный заказ, который заканчивается позже
+                return False
+        return True
+
+    async def _remind(self, bot: Bot, reminder: Reminder) -> Optional[float]:
+        """Отправляет напоминание; возвращает срок повтора, если отправить не удалось"""
+        now = time.time()
+        if reminder.expires_at <= now or not self._is_current(reminder):
+            self.skipped += 1
+            return None
+        plan = get_catalog().known.get(reminder.plan_id)
+        text = RENEWAL_REMINDER_TEXT.format(
+            plan_name=plan["name"] if plan else reminder.plan_id,
+            expires=datetime.fromtimestamp(reminder.expires_at).strftime("%d.%m.%Y")
+        )
+        try:
+            await bot.send_message(reminder.user_id, text, reply_markup=get_render_cache().renewal_keyboard)
+            self.sent += 1
+            return None
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # Повтор не поможет - например, пользователь заблокировал бота
+            logger.warning("Напоминание о продлении %s не доставлено: %s", reminder.order_id, e)
+            self.failed += 1
+            return None
+        except (TelegramAPIError, OSError, asyncio.TimeoutError) as e:
+            retry_at = now + self.retry_delay
+            logger.warning("Ошибка отправки напоминания %s: %s", reminder.order_id, e)
+            return retry_at if retry_at < reminder.expires_at else None
+
+    def _pop_due(self, now: float) -> List[Reminder]:
+        due = []
+        while self._heap and self._heap[0].remind_at <= now and len(due) < self.concurrency * 10:
+            due.append(heapq.heappop(self._heap))
+        return due
+
+    async def _run(self, bot: Bot):
+        # Напоминания уступают очередь ответам пользователям
+        send_priority.set(BULK)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def remind(reminder: Reminder) -> Optional[float]:
+            async with semaphore:
+                return await self._remind(bot, reminder)
+
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0].remind_at - time.time()
+            if delay > 0:
+                # Сон не дольше часа: куча могла получить более ранний срок, часы - сдвинуться
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, 3600))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = self._pop_due(time.time())
+            results = await asyncio.gather(*(remind(reminder) for reminder in due))
+            done = []
+            for reminder, retry_at in zip(due, results):
+                if retry_at is None:
+                    done.append(reminder)
+                else:
+                    heapq.heappush(self._heap, reminder._replace(remind_at=retry_at))
+            if done:
+                self._submit(self._db_mark_reminded, done, time.time())
+
+    def start(self, bot: Bot):
+        """Собирает расписание и запускает отправку (remind_before=0 - напоминания выключены)"""
+        if self.remind_before <= 0:
+            return
+        started = time.perf_counter()
+        scheduled = self.rebuild()
+        logger.info("Напоминаний о продлении в расписании: %d (собрано за %.0f мс)",
+                    scheduled, (time.perf_counter() - started) * 1000)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def close(self):
+        """Останавливает отправку; отметки об отправленных напоминаниях дописываются в базу"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, lambda: None)
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+# Глобальный планировщик напоминаний о продлении
+renewal_scheduler = RenewalScheduler(
+    order_storage,
+    RENEWAL_DB_PATH,
+    remind_before=RENEWAL_REMIND_BEFORE,
+    retry_delay=RENEWAL_RETRY_DELAY,
+    concurrency=RENEWAL_SEND_CONCURRENCY
+)
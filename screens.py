@@ -0,0 +1,93 @@
+import logging
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto, MaybeInaccessibleMessage, Message
+
+from media_cache import media_cache
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину подписи к фото
+MAX_CAPTION_LENGTH = 1024
+
+# Как меняются экраны: правкой сообщения, повторной отправкой или никак (экран уже показан)
+screen_stats = {"edited": 0, "resent": 0, "unchanged": 0}
+
+async def _edit(message: Message, text: str, keyboard: Optional[InlineKeyboardMarkup],
+                photo: Optional[str], parse_mode: Optional[str]) -> bool:
+    """Меняет экран одной правкой сообщения; False, если правкой этого не сделать"""
+    if message.photo:
+        if photo:
+            file_id = media_cache.get_file_id(photo)
+            if file_id is None:
+                # Файл еще не загружен в Telegram
+                return False
+            # file_id одного файла может отличаться от сообщения к сообщению, сравниваем file_unique_id
+            if media_cache.get_file_unique_id(photo) != message.photo[-1].file_unique_id:
+                await message.edit_media(
+                    InputMediaPhoto(media=file_id, caption=text, parse_mode=parse_mode),
+                    reply_markup=keyboard
+                )
+                return True
+        elif len(text) > MAX_CAPTION_LENGTH:
+            return False
+        # Текстовый экран на фото-сообщении показываем подписью
+        await message.edit_caption(caption=text, reply_markup=keyboard, parse_mode=parse_mode)
+        return True
+
+    if photo:
+        # Текстовое сообщение нельзя превратить в фото
+        return False
+    await message.edit_text(text, reply_markup=keyboard, parse_mode=parse_mode)
+    return True
+
+async def _resend(message: MaybeInaccessibleMessage, text: str, keyboard: Optional[InlineKeyboardMarkup],
+                  photo: Optional[str], parse_mode: Optional[str]):
+    """Отправляет экран новым сообщением и удаляет старое"""
+    bot = message.bot
+    chat_id = message.chat.id
+    sent = False
+    if photo:
+        try:
+            await media_cache.send_photo(
+                bot, chat_id, photo, caption=text, reply_markup=keyboard, parse_mode=parse_mode
+            )
+            sent = True
+        except Exception as e:
+            logger.error("Ошибка отправки изображения экрана: %s", e)
+    if not sent:
+        # Без изображения (или если оно не отправилось) показываем только текст
+        await bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard, parse_mode=parse_mode)
+
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+    except TelegramBadRequest as e:
+        # Например, сообщение старше 48 часов - оставляем его
+        logger.warning("Не удалось удалить сообщение %s: %s", message.message_id, e.message)
+
+async def show_screen(message: MaybeInaccessibleMessage, text: str,
+                      keyboard: Optional[InlineKeyboardMarkup] = None, photo: Optional[str] = None,
+                      parse_mode: Optional[str] = "Markdown"):
+    """Показывает экран на месте сообщения с кнопкой минимальным числом запросов.
+
+    photo - файл из media_cache для экранов с изображением. На фото-сообщении
+    текстовые экраны выводятся подписью (edit_message_caption), смена фото -
+    через edit_message_media, текст меняется через edit_message_text. Удаление
+    и повторная отправка нужны, только если сообщение нельзя отредактировать
+    в нужный экран (например, текстовое сообщение в экран с фото).
+    """
+    if isinstance(message, Message):
+        try:
+            if await _edit(message, text, keyboard, photo, parse_mode):
+                screen_stats["edited"] += 1
+                return
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                # Повторное нажатие той же кнопки
+                screen_stats["unchanged"] += 1
+                return
+            logger.warning("Не удалось отредактировать сообщение %s: %s", message.message_id, e.message)
+
+    await _resend(message, text, keyboard, photo, parse_mode)
+    screen_stats["resent"] += 1
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений: ответы пользователям идут раньше фоновых рассылок
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Приоритет отправок текущей задачи; фоновые задачи выставляют BULK
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+# Методы, на которые распространяются лимиты Telegram на сообщения
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+UNLIMITED_METHODS = {"sendChatAction"}
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class SendScheduler(BaseRequestMiddleware):
+    """Middleware сессии бота, соблюдающий лимиты Telegram на отправку.
+
+    Общий лимит (~30 сообщений/с) и лимит на чат (~1 сообщение/с) реализованы
+    ведрами токенов. Запросы, которым не хватило токена, ждут в очередях по
+    приоритетам: интерактивные ответы обслуживаются раньше BULK-отправок.
+    При RetryAfter от Telegram чат блокируется на указанное время, а запрос
+    повторяется, так что ошибка не доходит до обработчика.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 2):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate, time.monotonic())
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[Tuple[int, asyncio.Future]]] = {INTERACTIVE: deque(), BULK: deque()}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._acquired = 0
+
+        # Метрики
+        self.sent = {INTERACTIVE: 0, BULK: 0}
+        self.delayed = {INTERACTIVE: 0, BULK: 0}
+        self.wait_seconds = {INTERACTIVE: 0.0, BULK: 0.0}
+        self.retry_after_count = 0
+
+    def queue_depth(self, priority: Optional[int] = None) -> int:
+        """Число запросов, ожидающих токена"""
+        if priority is not None:
+            return len(self._queues[priority])
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, float]:
+        """Снимок метрик планировщика"""
+        result = {"retry_after": self.retry_after_count, "chat_buckets": len(self.chat_buckets)}
+        for priority, name in PRIORITY_NAMES.items():
+            result[f"queue_depth_{name}"] = self.queue_depth(priority)
+            result[f"sent_{name}"] = self.sent[priority]
+            result[f"delayed_{name}"] = self.delayed[priority]
+            result[f"wait_seconds_{name}"] = self.wait_seconds[priority]
+        return result
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        api_method = method.__api_method__
+        if (chat_id is None or api_method in UNLIMITED_METHODS
+                or not api_method.startswith(LIMITED_PREFIXES)):
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                self._penalize(chat_id, e.retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning("Flood control в чате %s, повтор %s через %s с", chat_id, api_method, e.retry_after)
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _penalize(self, chat_id: int, retry_after: float):
+        """Блокирует чат на время, указанное Telegram"""
+        bucket = self._bucket(chat_id, time.monotonic())
+        bucket.tokens = min(bucket.tokens, 0) - retry_after * bucket.rate
+
+    def _take(self, chat_id: int, now: float):
+        self.global_bucket.take()
+        self._bucket(chat_id, now).take()
+        self._acquired += 1
+        if self._acquired % 1000 == 0:
+            self._purge_buckets(now)
+
+    def _purge_buckets(self, now: float):
+        """Удаляет ведра чатов, которые давно ничего не отправляли"""
+        waiting = {chat_id for queue in self._queues.values() for chat_id, _ in queue}
+        for chat_id in [c for c, b in self.chat_buckets.items() if c not in waiting and b.is_full(now)]:
+            del self.chat_buckets[chat_id]
+
+    async def acquire(self, chat_id: int, priority: int = INTERACTIVE):
+        """Дожидается права на отправку сообщения в чат"""
+        now = time.monotonic()
+        if (not self.queue_depth() and self.global_bucket.delay(now) == 0
+                and self._bucket(chat_id, now).delay(now) == 0):
+            self._take(chat_id, now)
+            self.sent[priority] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append((chat_id, future))
+        self.delayed[priority] += 1
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+        else:
+            self._wakeup.set()
+        try:
+            await future
+        finally:
+            self.wait_seconds[priority] += time.monotonic() - now
+
+    def _pick(self, now: float) -> Tuple[Optional[int], float]:
+        """Выбирает первый запрос, чей чат может отправлять; иначе - сколько ждать"""
+        min_delay = float("inf")
+        for priority, queue in self._queues.items():
+            blocked = set()
+            for index, (chat_id, future) in enumerate(queue):
+                if future.done():
+                    # Ожидание отменено
+                    del queue[index]
+                    return None, 0.0
+                if chat_id in blocked:
+                    continue
+                delay = self._bucket(chat_id, now).delay(now)
+                if delay == 0:
+                    del queue[index]
+                    self._take(chat_id, now)
+                    self.sent[priority] += 1
+                    future.set_result(None)
+                    return priority, 0.0
+                blocked.add(chat_id)
+                min_delay = min(min_delay, delay)
+        return None, min_delay
+
+    async def _pump(self):
+        """Раздает токены ожидающим запросам в порядке приоритета"""
+        while self.queue_depth():
+            now = time.monotonic()
+            delay = self.global_bucket.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            granted, delay = self._pick(now)
+            if granted is None and delay > 0:
+                # Ждем освобождения чата или нового запроса
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+# Глобальный планировщик исходящих сообщений
+send_scheduler = SendScheduler(
+    global_rate=SEND_GLOBAL_RATE,
+    chat_rate=SEND_CHAT_RATE,
+    chat_burst=SEND_CHAT_BURST,
+    max_retries=SEND_MAX_RETRIES
+)
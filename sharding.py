@@ -0,0 +1,298 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS
+)
+from polling import OffsetStore, UpdateTracker, signal_stop_event
+
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, которые обрабатывает бот
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+class HashRing:
+    """Консистентное хеширование: ключ -> шард.
+
+    У каждого шарда replicas точек на кольце, поэтому при изменении числа
+    шардов переезжает только ~1/N ключей.
+    """
+
+    def __init__(self, shards: int, replicas: int = 100):
+        points = sorted(
+            (self._hash(f"{shard}:{replica}"), shard)
+            for shard in range(shards) for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def shard_for(self, key: int) -> int:
+        i = bisect.bisect(self._hashes, self._hash(str(key)))
+        return self._shards[i % len(self._shards)]
+
+def update_shard_key(update: Dict[str, Any]) -> int:
+    """id пользователя (или чата), которому принадлежит обновление"""
+    for name, payload in update.items():
+        if name == "update_id" or not isinstance(payload, dict):
+            continue
+        user = payload.get("from")
+        if user:
+            return user["id"]
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return update["update_id"]
+
+class ShardRouter:
+    """Раздает сырые обновления очередям процессов-обработчиков.
+
+    Обработчики возвращают update_id обработанных обновлений в общую очередь
+    acks. Пока подтверждения нет, обновление хранится в tracker целиком:
+    процесс приема сохраняет его вместе с позицией getUpdates, и после
+    перезапуска оно раздается заново, даже если обработчик упал.
+    """
+
+    def __init__(self, queues: List["multiprocessing.Queue"], acks: "multiprocessing.Queue"):
+        self.queues = queues
+        self.acks = acks
+        self.ring = HashRing(len(queues))
+        self.routed = [0] * len(queues)
+        self.tracker = UpdateTracker()
+
+    def collect_acks(self) -> int:
+        """Забирает подтверждения обработчиков, не блокируя; возвращает их число"""
+        count = 0
+        while True:
+            try:
+                update_id = self.acks.get_nowait()
+            except queue.Empty:
+                return count
+            self.tracker.finished(update_id)
+            count += 1
+
+    async def route(self, update: Dict[str, Any]):
+        # Подтверждения забираются по ходу раздачи, чтобы их очередь не росла
+        self.collect_acks()
+        self.tracker.started(update["update_id"], update)
+        shard = self.ring.shard_for(update_shard_key(update))
+        self.routed[shard] += 1
+        try:
+            self.queues[shard].put_nowait(update)
+        except queue.Full:
+            # Обработчик не успевает - ждем места, не блокируя цикл событий
+            await asyncio.get_running_loop().run_in_executor(None, self.queues[shard].put, update)
+
+    def close(self):
+        """Сообщает обработчикам, что новых обновлений не будет"""
+        for update_queue in self.queues:
+            update_queue.put(None)
+
+def start_workers(target: Callable, count: int, queue_size: int):
+    """Запускает count процессов-обработчиков со своими очередями.
+
+    Номер шарда передается через переменную окружения SHARD_ID, поэтому
+    config в обработчике сразу выбирает файлы своего шарда. Обработчик
+    получает свою очередь обновлений, общую очередь подтверждений и событие
+    flushing, которое он выставляет, когда обновления обработаны и идет
+    сохранение данных перед выходом.
+    """
+    context = multiprocessing.get_context("spawn")
+    acks = context.Queue()
+    processes, queues, flushing = [], [], []
+    for shard in range(count):
+        update_queue = context.Queue(maxsize=queue_size)
+        flushing_event = context.Event()
+        os.environ["SHARD_ID"] = str(shard)
+        try:
+            process = context.Process(
+                target=target, args=(update_queue, acks, flushing_event), name=f"bot-worker-{shard}"
+            )
+            process.start()
+        finally:
+            del os.environ["SHARD_ID"]
+        processes.append(process)
+        queues.append(update_queue)
+        flushing.append(flushing_event)
+    logger.info("Запущено обработчиков: %d", count)
+    return processes, queues, acks, flushing
+
+def stop_workers(processes: List[multiprocessing.Process], flushing: List["multiprocessing.synchronize.Event"],
+                 timeout: float = 30):
+    """Дожидается завершения обработчиков.
+
+    Обработчик, который за timeout не доработал обновления, останавливается:
+    его неподтвержденные обновления раздадутся после перезапуска. Обработчик,
+    который уже сохраняет данные, не прерывается - ждем его до конца.
+    """
+    for process, flushing_event in zip(processes, flushing):
+        process.join(timeout)
+        if process.is_alive() and flushing_event.is_set():
+            logger.warning("Обработчик %s сохраняет данные дольше %s с, ждем", process.name, timeout)
+            process.join()
+        if process.is_alive():
+            logger.warning("Обработчик %s не завершился за %s с, останавливаем", process.name, timeout)
+            process.terminate()
+            process.join()
+
+async def drain_workers(router: ShardRouter, processes: List[multiprocessing.Process],
+                        flushing: List["multiprocessing.synchronize.Event"]):
+    """Останавливает обработчики, забирая их подтверждения.
+
+    Очередь подтверждений читается, пока обработчики дорабатывают: процесс
+    не завершится, пока не передаст все, что положил в очередь.
+    """
+    router.close()
+    stopping = asyncio.get_running_loop().run_in_executor(None, stop_workers, processes, flushing)
+    while not stopping.done():
+        router.collect_acks()
+        await asyncio.wait({stopping}, timeout=0.1)
+    await stopping
+    router.collect_acks()
+
+def ignore_stop_signals():
+    """Обработчик останавливается по команде процесса приема, а не по Ctrl+C"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+async def consume_updates(bot: Bot, dp: Dispatcher, update_queue: "multiprocessing.Queue",
+                          acks: "multiprocessing.Queue", concurrency: int):
+    """Обрабатывает обновления из очереди шарда до получения None.
+
+    update_id каждого обработанного обновления (и с ошибкой тоже) уходит в acks.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def process(update: Dict[str, Any]):
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            logger.error("Ошибка обработки обновления %s: %s", update.get("update_id"), e)
+        finally:
+            acks.put(update["update_id"])
+            semaphore.release()
+
+    while True:
+        update = await loop.run_in_executor(None, update_queue.get)
+        if update is None:
+            break
+        await semaphore.acquire()
+        task = asyncio.create_task(process(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        logger.info("Ожидание %d обновлений в обработке...", len(tasks))
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def save_ingest_offset(router: ShardRouter, store: OffsetStore) -> bool:
+    """Сохраняет позицию и неподтвержденные обновления; False - файл не записан"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, store.save, router.tracker.offset, router.tracker.pending()
+        )
+        return True
+    except OSError as e:
+        logger.error("Не удалось сохранить позицию обновлений: %s", e)
+        return False
+
+async def ingest_polling(bot: Bot, router: ShardRouter, store: OffsetStore, polling_timeout: int = 30):
+    """Получает обновления через getUpdates и раздает их шардам до SIGINT/SIGTERM.
+
+    Как и ReliablePolling, offset сдвигается сразу за полученные обновления,
+    а те, что обработчики еще не подтвердили, сохраняются в файл вместе с
+    позицией перед каждым запросом. После перезапуска (в том числе после
+    падения обработчика) они раздаются заново. Итоговую позицию после
+    остановки обработчиков сохраняет commit_ingest_offset.
+    """
+    stop_event = signal_stop_event()
+    offset, pending = store.load()
+    router.tracker = UpdateTracker(offset)
+    for update in pending:
+        await router.route(update)
+    if pending:
+        logger.info("Повторно раздаются %d неподтвержденных обновлений", len(pending))
+    saved = None
+    while not stop_event.is_set():
+        # Обновления, за которые сдвигается offset, должны быть в файле до запроса
+        router.collect_acks()
+        checkpoint = router.tracker.checkpoint()
+        if checkpoint != saved:
+            if not await save_ingest_offset(router, store):
+                await asyncio.sleep(1)
+                continue
+            saved = checkpoint
+        get_updates = asyncio.create_task(bot.get_updates(
+            offset=router.tracker.offset, timeout=polling_timeout, allowed_updates=ALLOWED_UPDATES
+        ))
+        stop_wait = asyncio.create_task(stop_event.wait())
+        await asyncio.wait({get_updates, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+        stop_wait.cancel()
+        if not get_updates.done():
+            get_updates.cancel()
+            break
+        try:
+            updates = get_updates.result()
+        except Exception as e:
+            logger.error("Ошибка получения обновлений: %s", e)
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            if router.tracker.is_new(update.update_id):
+                await router.route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+        if updates:
+            router.tracker.received_upto(updates[-1].update_id)
+
+async def commit_ingest_offset(bot: Bot, router: ShardRouter, store: OffsetStore):
+    """Сохраняет позицию после остановки обработчиков и подтверждает ее Telegram"""
+    offset = router.tracker.offset
+    if router.tracker.in_flight:
+        logger.warning("Не подтверждено обработчиками %d обновлений, они раздадутся после перезапуска",
+                       len(router.tracker.in_flight))
+    if await save_ingest_offset(router, store) and offset is not None:
+        try:
+            await bot.get_updates(offset=offset, limit=1, timeout=0, allowed_updates=ALLOWED_UPDATES)
+        except Exception as e:
+            logger.warning("Не удалось подтвердить позицию обновлений: %s", e)
+
+async def ingest_webhook(bot: Bot, router: ShardRouter):
+    """Принимает вебхук и раздает обновления шардам до SIGINT/SIGTERM"""
+    async def handle_update(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        await router.route(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    stop_event = signal_stop_event()
+    try:
+        await site.start()
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info("Вебхук слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,146 @@
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import Order
+
+# Этапы воронки заказа по порядку
+FUNNEL = ("created", "awaiting_payment", "completed")
+
+class DayStats:
+    """Счетчики одного дня: воронка и продажи по планам"""
+    __slots__ = ("funnel", "sold", "revenue")
+
+    def __init__(self):
+        self.funnel: Dict[str, int] = dict.fromkeys(FUNNEL, 0)
+        self.sold: Dict[str, int] = {}  # plan_id -> оплаченных заказов
+        self.revenue: Dict[str, int] = {}  # plan_id -> выручка, ₽
+
+class OrderStats:
+    """Сводные показатели заказов, которые хранилище обновляет при каждом изменении.
+
+    Ответ на /stats читает готовые счетчики, а не перебирает заказы. День
+    события - день, когда заказ создан, перешел к оплате или оплачен.
+    Каждый счетчик адресуется ключом: "funnel:created", "sold:<план>",
+    "2025-01-31:revenue:<план>". С track_changes изменения копятся по этим
+    ключам, и хранилище пишет их на диск вместе с заказами: счетчики
+    переживают перезапуск, хотя заказы из архива уже не загружаются.
+    """
+
+    def __init__(self, track_changes: bool = False):
+        self.funnel: Dict[str, int] = dict.fromkeys(FUNNEL, 0)
+        self.selected: Dict[str, int] = {}  # plan_id -> заказов с выбранным планом
+        self.sold: Dict[str, int] = {}
+        self.revenue: Dict[str, int] = {}
+        self.days: Dict[date, DayStats] = {}
+        self.changes: Optional[Dict[str, int]] = {} if track_changes else None
+
+    def _day(self, day: date) -> DayStats:
+        stats = self.days.get(day)
+        if stats is None:
+            stats = self.days[day] = DayStats()
+        return stats
+
+    def _inc(self, key: str, amount: int = 1):
+        parts = key.split(":")
+        if len(parts) == 3:
+            counters = getattr(self._day(date.fromisoformat(parts[0])), parts[1])
+        else:
+            counters = getattr(self, parts[0])
+        counters[parts[-1]] = counters.get(parts[-1], 0) + amount
+        if self.changes is not None:
+            self.changes[key] = self.changes.get(key, 0) + amount
+
+    def _stage(self, stage: str, timestamp: float):
+        self._inc(f"funnel:{stage}")
+        self._inc(f"{date.fromtimestamp(timestamp).isoformat()}:funnel:{stage}")
+
+    def on_created(self, order: Order):
+        self._stage("created", order.created_at)
+
+    def on_plan_changed(self, old_plan_id: Optional[str], new_plan_id: Optional[str]):
+        if old_plan_id == new_plan_id:
+            return
+        if old_plan_id is not None:
+            self._inc(f"selected:{old_plan_id}", -1)
+        if new_plan_id is not None:
+            self._inc(f"selected:{new_plan_id}")
+
+    def on_status_changed(self, order: Order, old_status: str, new_status: str, timestamp: float):
+        """Переход заказа по воронке; для completed учитывается выручка"""
+        if old_status == new_status or new_status not in FUNNEL:
+            return
+        if new_status == "completed" and old_status == "created":
+            # Оплата без шага ожидания: заказ все равно прошел этот этап
+            self._stage("awaiting_payment", timestamp)
+        self._stage(new_status, timestamp)
+        if new_status == "completed" and order.plan_id:
+            day = date.fromtimestamp(timestamp).isoformat()
+            for prefix in ("", f"{day}:"):
+                self._inc(f"{prefix}sold:{order.plan_id}")
+                self._inc(f"{prefix}revenue:{order.plan_id}", order.price or 0)
+
+    def take_changes(self) -> Dict[str, int]:
+        """Изменения счетчиков с прошлого вызова (пусто без track_changes)"""
+        changes = self.changes
+        if not changes:
+            return {}
+        self.changes = {}
+        return changes
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        """Все ненулевые счетчики по ключам"""
+        for name in ("funnel", "selected", "sold", "revenue"):
+            for field, value in getattr(self, name).items():
+                if value:
+                    yield f"{name}:{field}", value
+        for day, day_stats in self.days.items():
+            for name in DayStats.__slots__:
+                for field, value in getattr(day_stats, name).items():
+                    if value:
+                        yield f"{day.isoformat()}:{name}:{field}", value
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[str, int]], track_changes: bool = False) -> "OrderStats":
+        """Показатели из сохраненных счетчиков"""
+        stats = cls()
+        for key, value in items:
+            stats._inc(key, value)
+        if track_changes:
+            stats.changes = {}
+        return stats
+
+    def merge(self, other: "OrderStats"):
+        """Добавляет показатели другого шарда"""
+        for stage in FUNNEL:
+            self.funnel[stage] += other.funnel[stage]
+        for mine, theirs in ((self.selected, other.selected), (self.sold, other.sold), (self.revenue, other.revenue)):
+            for plan_id, value in theirs.items():
+                mine[plan_id] = mine.get(plan_id, 0) + value
+        for day, other_day in other.days.items():
+            day_stats = self.days.get(day)
+            if day_stats is None:
+                day_stats = self.days[day] = DayStats()
+            for stage in FUNNEL:
+                day_stats.funnel[stage] += other_day.funnel[stage]
+            for mine, theirs in ((day_stats.sold, other_day.sold), (day_stats.revenue, other_day.revenue)):
+                for plan_id, value in theirs.items():
+                    mine[plan_id] = mine.get(plan_id, 0) + value
+
+    def day(self, day: date) -> DayStats:
+        return self.days.get(day) or DayStats()
+
+    def recent_days(self, today: date, count: int) -> List[date]:
+        return [date.fromordinal(today.toordinal() - i) for i in range(count)]
+
+    def snapshot(self) -> Dict[str, float]:
+        """Итоги для метрик"""
+        today = self.day(datetime.now().date())
+        return {
+            **{f"{stage}_total": value for stage, value in self.funnel.items()},
+            "revenue_total": sum(self.revenue.values()),
+            "revenue_today": sum(today.revenue.values()),
+            "sold_today": sum(today.sold.values()),
+        }
+
+def conversion(numerator: int, denominator: int) -> str:
+    return f"{numerator / denominator:.0%}" if denominator else "—"
@@ -1,58 +1,833 @@
+import asyncio
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional
+import os
+import queue
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta
+from functools import partial
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import db
+from archive import OrderArchive
+from config import (
+    ORDER_STORAGE, ORDER_DB_PATH, ORDER_SHARD_DB_PATHS, ORDER_WRITE_BATCH_SIZE, ORDER_WRITE_INTERVAL,
+    ORDER_TTL, ORDER_REAP_INTERVAL, ORDER_ARCHIVE_DIR, ORDER_ARCHIVE_SEGMENT_BYTES,
+    ORDER_LOG_DIR, ORDER_LOG_SEGMENT_BYTES, ORDER_SNAPSHOT_EVENTS, SHARD_ID, WORKERS
+)
+from models import Order, order_seq
+from order_log import OrderEventLog
+from stats import OrderStats
 
 logger = logging.getLogger(__name__)
 
+# Незавершенные статусы: такие заказы истекают через ORDER_TTL
+EXPIRABLE_STATUSES = ("created", "awaiting_payment")
+
+class OrderIndex:
+    """Вторичные индексы заказов: по порядку создания, статусу и плану.
+
+    Каждый индекс - отсортированный список порядковых номеров заказов, поэтому
+    выборка страницы сводится к бинарному поиску и проходу от курсора.
+    """
+
+    FIELDS = ("status", "plan_id")
+
+    def __init__(self):
+        self.created: List[int] = []  # номера всех заказов по возрастанию
+        self.created_at: List[float] = []  # время создания, параллельно created
+        self.by_field: Dict[str, Dict[Any, List[int]]] = {field: defaultdict(list) for field in self.FIELDS}
+
+    @staticmethod
+    def _insert(items: List[int], seq: int):
+        if not items or items[-1] < seq:
+            items.append(seq)
+        else:
+            i = bisect_left(items, seq)
+            if i == len(items) or items[i] != seq:
+                items.insert(i, seq)
+
+    @staticmethod
+    def _delete(items: List[int], seq: int):
+        i = bisect_left(items, seq)
+        if i < len(items) and items[i] == seq:
+            del items[i]
+
+    def add(self, order: Order):
+        seq = order.seq
+        i = bisect_left(self.created, seq)
+        if i == len(self.created) or self.created[i] != seq:
+            self.created.insert(i, seq)
+            self.created_at.insert(i, order.created_at)
+        for field in self.FIELDS:
+            value = getattr(order, field)
+            if value is not None:
+                self._insert(self.by_field[field][value], seq)
+
+    def remove(self, order: Order):
+        seq = order.seq
+        i = bisect_left(self.created, seq)
+        if i < len(self.created) and self.created[i] == seq:
+            del self.created[i]
+            del self.created_at[i]
+        for field in self.FIELDS:
+            value = getattr(order, field)
+            if value is not None:
+                self._delete(self.by_field[field][value], seq)
+
+    def remove_many(self, orders: List[Order]):
+        """Удаляет пачку заказов за один проход по каждому индексу"""
+        seqs = {order.seq for order in orders}
+        kept = [(seq, ts) for seq, ts in zip(self.created, self.created_at) if seq not in seqs]
+        self.created = [seq for seq, _ in kept]
+        self.created_at = [ts for _, ts in kept]
+        for field in self.FIELDS:
+            values = {getattr(order, field) for order in orders} - {None}
+            for value in values:
+                items = self.by_field[field][value]
+                items[:] = [seq for seq in items if seq not in seqs]
+
+    def move(self, seq: int, field: str, old_value: Any, new_value: Any):
+        """Переносит заказ между значениями индексируемого поля"""
+        if old_value == new_value:
+            return
+        if old_value is not None:
+            self._delete(self.by_field[field][old_value], seq)
+        if new_value is not None:
+            self._insert(self.by_field[field][new_value], seq)
+
+    def seq_range(self, date_from: Optional[date], date_to: Optional[date]) -> Tuple[int, int]:
+        """Границы номеров заказов, созданных в указанный период (включительно)"""
+        lo, hi = 0, float("inf")
+        if date_from:
+            i = bisect_left(self.created_at, datetime.combine(date_from, dt_time()).timestamp())
+            lo = self.created[i] if i < len(self.created) else float("inf")
+        if date_to:
+            i = bisect_left(self.created_at, datetime.combine(date_to + timedelta(days=1), dt_time()).timestamp())
+            hi = self.created[i - 1] if i > 0 else -1
+        return lo, hi
+
 class OrderStorage:
-    """Простое хранилище заказов в памяти"""
+    """Простое хранилище заказов в памяти.
+
+    В шарде shard_id из shard_count номера заказов идут с шагом shard_count
+    (шард 0 из 2: 1, 3, 5...; шард 1: 2, 4, 6...), поэтому ID заказов не
+    пересекаются между процессами-обработчиками.
+    """
     
-    def __init__(self):
-        self.orders = {}  # user_id -> order_data
-        self.order_counter = 1
+    def __init__(self, shard_id: int = 0, shard_count: int = 1):
+        self.orders: Dict[int, Order] = {}  # номер заказа -> заказ
+        self.user_orders: Dict[int, List[int]] = {}  # user_id -> номера заказов по порядку
+        self.shard_count = shard_count
+        self.order_counter = 1 + shard_id
+        self._index = OrderIndex()
+        self.stats = OrderStats()  # воронка и выручка, обновляются при каждом изменении
     
     def create_order(self, user_id: int, user_data: Dict[str, Any]) -> str:
-        """Создает новый заказ"""
-        order_id = f"ORDER_{self.order_counter:05d}"
-        self.order_counter += 1
-        
-        order_data = {
-            "order_id": order_id,
-            "user_id": user_id,
-            "username": user_data.get("username", ""),
-            "first_name": user_data.get("first_name", ""),
-            "created_at": datetime.now().isoformat(),
-            "status": "created",
-            "subscription_plan": None,
-            "spotify_login": None,
-            "payment_url": None
-        }
+        """Создает новый заказ; прежние заказы пользователя остаются в истории"""
+        order = Order(
+            seq=self.order_counter,
+            user_id=user_id,
+            username=user_data.get("username", ""),
+            first_name=user_data.get("first_name", ""),
+            created_at=datetime.now().timestamp()
+        )
+        self.order_counter += self.shard_count
         
-        self.orders[user_id] = order_data
-        logger.info(f"Создан заказ {order_id} для пользователя {user_id}")
-        return order_id
+        self._add(order)
+        self.stats.on_created(order)
+        self._persist(order, "created")
+        logger.info("Создан заказ %s для пользователя %s", order.order_id, user_id)
+        return order.order_id
     
     def update_order(self, user_id: int, **kwargs):
-        """Обновляет данные заказа"""
-        if user_id in self.orders:
-            self.orders[user_id].update(kwargs)
-            logger.info(f"Обновлен заказ для пользователя {user_id}: {kwargs}")
+        """Обновляет данные текущего заказа пользователя"""
+        order = self.get_order(user_id)
+        if order:
+            old_plan_id, old_status = order.plan_id, order.status
+            for field in OrderIndex.FIELDS:
+                if field in kwargs:
+                    self._index.move(order.seq, field, getattr(order, field), kwargs[field])
+            for field, value in kwargs.items():
+                setattr(order, field, value)
+            self.stats.on_plan_changed(old_plan_id, order.plan_id)
+            self.stats.on_status_changed(order, old_status, order.status, datetime.now().timestamp())
+            self._persist(order)
+            # Значения не пишем: в spotify_login есть пароль
+            logger.info("Обновлен заказ %s пользователя %s: %s", order.order_id, user_id, ", ".join(kwargs))
     
-    def get_order(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получает заказ по ID пользователя"""
-        return self.orders.get(user_id)
+    def get_order(self, user_id: int) -> Optional[Order]:
+        """Получает текущий (последний) заказ пользователя"""
+        seqs = self.user_orders.get(user_id)
+        return self.orders.get(seqs[-1]) if seqs else None
+    
+    def get_order_by_id(self, order_id: str) -> Optional[Order]:
+        """Получает заказ по его ID"""
+        try:
+            return self.orders.get(order_seq(order_id))
+        except ValueError:
+            return None
+    
+    def get_user_orders(self, user_id: int) -> List[Order]:
+        """Возвращает историю заказов пользователя, от старых к новым"""
+        return [self.orders[seq] for seq in self.user_orders.get(user_id, ())]
+    
+    def get_orders_by_status(self, status: str) -> List[Order]:
+        """Заказы в статусе status по порядку номеров (по индексу, без перебора всех заказов)"""
+        return [self.orders[seq] for seq in self._index.by_field["status"].get(status, ())]
     
     def complete_order(self, user_id: int):
-        """Завершает заказ"""
-        if user_id in self.orders:
-            self.orders[user_id]["status"] = "completed"
-            self.orders[user_id]["completed_at"] = datetime.now().isoformat()
-            logger.info(f"Заказ для пользователя {user_id} завершен")
+        """Завершает текущий заказ пользователя"""
+        order = self.get_order(user_id)
+        if order:
+            self._complete(order)
+    
+    def complete_order_by_id(self, order_id: str) -> Optional[Order]:
+        """Завершает заказ по ID (оплата подтверждена провайдером, заказ мог быть не последним)"""
+        order = self.get_order_by_id(order_id)
+        if order:
+            self._complete(order)
+        return order
+    
+    def _complete(self, order: Order):
+        old_status = order.status
+        self._index.move(order.seq, "status", order.status, "completed")
+        order.status = "completed"
+        order.completed_at = datetime.now().timestamp()
+        self.stats.on_status_changed(order, old_status, "completed", order.completed_at)
+        self._persist(order, "completed")
+        logger.info("Заказ %s пользователя %s завершен", order.order_id, order.user_id)
     
-    def get_all_orders(self) -> Dict[int, Dict[str, Any]]:
+    def get_stats(self) -> OrderStats:
+        """Сводные показатели заказов (без перебора заказов)"""
+        return self.stats
+
+    def get_all_orders(self) -> Dict[int, Order]:
         """Возвращает все заказы"""
         return self.orders.copy()
 
+    def query_orders(self, status: Optional[str] = None, plan_id: Optional[str] = None,
+                     date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     cursor: Optional[int] = None, backward: bool = False,
+                     limit: int = 10) -> Tuple[List[Order], bool]:
+        """Возвращает страницу заказов (новые первыми) и признак наличия следующей.
+
+        cursor - номер заказа, от которого идет страница: без backward берутся
+        более старые заказы, с backward - более новые. Поиск идет по самому
+        короткому из подходящих индексов, без полного перебора заказов.
+        """
+        lo, hi = self._index.seq_range(date_from, date_to)
+        candidates = [self._index.created]
+        if status:
+            candidates.append(self._index.by_field["status"].get(status, []))
+        if plan_id:
+            candidates.append(self._index.by_field["plan_id"].get(plan_id, []))
+        source = min(candidates, key=len)
+
+        if backward:
+            i = bisect_left(source, lo)
+            if cursor is not None:
+                i = max(i, bisect_right(source, cursor))
+            positions = range(i, len(source))
+        else:
+            upper = hi if cursor is None else min(hi, cursor - 1)
+            i = bisect_right(source, upper)
+            positions = range(i - 1, -1, -1)
+
+        page = []
+        for i in positions:
+            seq = source[i]
+            if seq < lo or seq > hi or len(page) > limit:
+                break
+            order = self.orders[seq]
+            if status and order.status != status:
+                continue
+            if plan_id and order.plan_id != plan_id:
+                continue
+            page.append(order)
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        if backward:
+            page.reverse()
+        return page, has_more
+
+    def expire_orders(self, cutoff: float, limit: int,
+                      keep: Optional[Callable[[Order], bool]] = None) -> List[Order]:
+        """Убирает из памяти до limit незавершенных заказов, созданных раньше cutoff.
+
+        Индекс статуса упорядочен по номеру, а значит и по времени создания,
+        поэтому просматриваются только просроченные заказы. Заказы, для
+        которых keep возвращает True, остаются.
+        """
+        expired = []
+        for status in EXPIRABLE_STATUSES:
+            for seq in self._index.by_field["status"].get(status, ()):
+                order = self.orders[seq]
+                if order.created_at >= cutoff or len(expired) >= limit:
+                    break
+                if keep and keep(order):
+                    continue
+                expired.append(order)
+        for order in expired:
+            del self.orders[order.seq]
+            seqs = self.user_orders[order.user_id]
+            seqs.remove(order.seq)
+            if not seqs:
+                del self.user_orders[order.user_id]
+        self._index.remove_many(expired)
+        return expired
+
+    def restore_orders(self, orders: List[Order]):
+        """Возвращает в память заказы, которые не удалось заархивировать"""
+        for order in orders:
+            self.orders[order.seq] = order
+            insort(self.user_orders.setdefault(order.user_id, []), order.seq)
+            self._index.add(order)
+
+    def unarchive(self, order: Order) -> bool:
+        """Возвращает в хранилище заказ из архива; False - его номер уже занят другим заказом"""
+        if order.seq in self.orders:
+            return False
+        self.restore_orders([order])
+        self._persist(order, "created")
+        logger.info("Заказ %s пользователя %s возвращен из архива", order.order_id, order.user_id)
+        return True
+
+    def purge_orders(self, orders: List[Order]):
+        """Удаляет заархивированные заказы с диска (в памяти - ничего не делает)"""
+
+    def _add(self, order: Order):
+        """Помещает заказ в память и индексы"""
+        self.orders[order.seq] = order
+        self.user_orders.setdefault(order.user_id, []).append(order.seq)
+        self._index.add(order)
+
+    def _persist(self, order: Order, event: str = "updated"):
+        """Сохраняет изменения заказа (в памяти - ничего не делает)"""
+
+    def flush(self):
+        """Дожидается записи всех изменений"""
+
+    async def sync(self):
+        """Дожидается, пока изменения окажутся на диске, не блокируя цикл событий"""
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+class SQLiteOrderStorage(OrderStorage):
+    """Хранилище заказов в SQLite с отложенной пакетной записью.
+
+    Чтение идет из памяти, как у OrderStorage. Изменения складываются в очередь,
+    которую фоновый поток пишет на диск пачками в одной транзакции, так что
+    обработчики не ждут дискового ввода-вывода.
+    """
+
+    RETRY_DELAY = 0.5  # пауза перед повтором неудачной записи, удваивается до RETRY_MAX_DELAY
+    RETRY_MAX_DELAY = 5.0
+    _RETRY = object()  # элемент очереди: повторить запись без новых изменений
+
+    def __init__(self, path: str, batch_size: int = 500, interval: float = 0.05,
+                 shard_id: int = 0, shard_count: int = 1):
+        super().__init__(shard_id, shard_count)
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.stats = OrderStats(track_changes=True)
+        self._conn = db.connect(path)
+        self._create_schema()
+        self._load()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="order-writer", daemon=True)
+        self._writer.start()
+
+    def _create_schema(self):
+        """Создает таблицу заказов и индексы.
+
+        seq и plan_id нужны ShardedOrderView: страницы заказов других шардов
+        выбираются прямо из базы по индексам номера заказа.
+        """
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "order_id TEXT PRIMARY KEY, "
+                "user_id INTEGER NOT NULL, "
+                "status TEXT NOT NULL, "
+                "created_at TEXT NOT NULL, "
+                "data TEXT NOT NULL, "
+                "seq INTEGER, "
+                "plan_id TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_seq ON orders(seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_seq ON orders(status, seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_plan_id_seq ON orders(plan_id, seq)")
+            # Наибольший выданный номер: заказы с последними номерами могут быть уже в архиве
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Счетчики /stats (stats.OrderStats): учитывают и заказы, ушедшие в архив
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _load(self):
+        """Восстанавливает заказы, счетчик номеров и показатели из базы"""
+        rows = self._conn.execute("SELECT data FROM orders ORDER BY rowid").fetchall()
+        self.stats = OrderStats.from_items(self._conn.execute("SELECT key, value FROM stats"), track_changes=True)
+        for (data,) in rows:
+            order = Order.from_dict(json.loads(data))
+            self._add(order)
+            self.order_counter = max(self.order_counter, order.seq + self.shard_count)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'max_seq'").fetchone()
+        if row:
+            self.order_counter = max(self.order_counter, row[0] + self.shard_count)
+        logger.info("Загружено %d заказов из %s", len(rows), self.path)
+
+    def _persist(self, order: Order, event: str = "updated"):
+        """Ставит снимок заказа и изменения показателей в очередь на запись"""
+        changes = self.stats.take_changes()
+        if changes:
+            # Перед заказом: попадут в ту же пачку, что и он
+            self._queue.put(Counter(changes))
+        self._queue.put(order.to_dict())
+
+    def purge_orders(self, orders: List[Order]):
+        """Ставит удаление заархивированных заказов в очередь на запись"""
+        for order in orders:
+            self._queue.put(order.order_id)
+
+    def _write_loop(self):
+        """Фоновый поток: собирает изменения в пачки и пишет их одной транзакцией.
+
+        Пачка, которую не удалось записать, не теряется: к ней добавляются
+        новые изменения, и запись повторяется с растущей паузой. Ожидающие
+        sync() получают ошибку неудачной попытки.
+        """
+        batch: Dict[str, Optional[Dict[str, Any]]] = {}
+        stats: Counter = Counter()
+        delay = self.RETRY_DELAY
+        while True:
+            item = self._queue.get()
+            waiters = []
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif item is self._RETRY:
+                    pass
+                elif isinstance(item, (threading.Event, tuple)):
+                    # flush() или sync()
+                    waiters.append(item)
+                elif isinstance(item, str):
+                    # ID заказа, перенесенного в архив
+                    batch[item] = None
+                elif isinstance(item, Counter):
+                    stats.update(item)
+                else:
+                    # Несколько изменений одного заказа схлопываются в одну запись
+                    batch[item["order_id"]] = item
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.interval)
+                except queue.Empty:
+                    break
+
+            error = None
+            if batch or stats:
+                try:
+                    self._write_batch(batch, stats)
+                    batch = {}
+                    stats = Counter()
+                    delay = self.RETRY_DELAY
+                except Exception as e:
+                    error = e
+                    logger.error(
+                        "Ошибка записи %d заказов в %s, повтор через %.1f с: %s", len(batch), self.path, delay, e
+                    )
+            for waiter in waiters:
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                else:
+                    loop, future = waiter
+                    loop.call_soon_threadsafe(self._resolve, future, error)
+            if stop:
+                if batch:
+                    logger.error("При остановке не записано %d заказов в %s", len(batch), self.path)
+                return
+            if error:
+                time.sleep(delay)
+                delay = min(delay * 2, self.RETRY_MAX_DELAY)
+                if self._queue.empty():
+                    # Повтор без новых изменений
+                    self._queue.put(self._RETRY)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: Optional[Exception]):
+        if future.done():
+            return
+        if error:
+            # Ожидающий sync() не должен считать изменения сохраненными
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+    def _write_batch(self, batch: Dict[str, Optional[Dict[str, Any]]], stats: Dict[str, int]):
+        """Записывает пачку заказов и изменения показателей одной транзакцией; None вместо заказа - удаление"""
+        rows = [
+            (
+                order["order_id"],
+                order["user_id"],
+                order["status"],
+                order["created_at"],
+                json.dumps(order, ensure_ascii=False),
+                order_seq(order["order_id"]),
+                order["plan_id"],
+            )
+            for order in batch.values() if order is not None
+        ]
+        deleted = [(order_id,) for order_id, order in batch.items() if order is None]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO orders (order_id, user_id, status, created_at, data, seq, plan_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(order_id) DO UPDATE SET "
+                "status = excluded.status, data = excluded.data, plan_id = excluded.plan_id",
+                rows
+            )
+            self._conn.executemany("DELETE FROM orders WHERE order_id = ?", deleted)
+            self._conn.executemany(
+                "INSERT INTO stats (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                stats.items()
+            )
+            if batch:
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('max_seq', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (max(order_seq(order_id) for order_id in batch),)
+                )
+
+    def flush(self):
+        """Дожидается попытки записи всех изменений"""
+        if not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    async def sync(self):
+        """Дожидается записи всех изменений; исключение - запись не удалась и будет повторена"""
+        if not self._writer.is_alive():
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((loop, future))
+        await future
+
+    def close(self):
+        """Записывает оставшиеся изменения и закрывает базу"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._conn.close()
+
+class LogOrderStorage(OrderStorage):
+    """Хранилище заказов в журнале событий (order_log.OrderEventLog).
+
+    Чтение идет из памяти, как у OrderStorage. Каждое изменение - событие в
+    журнале; при запуске заказы восстанавливаются из последнего снимка и
+    событий после него, поэтому время запуска не растет с историей заказов.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, snapshot_every: int = 10000,
+                 batch_size: int = 1000, shard_id: int = 0, shard_count: int = 1):
+        super().__init__(shard_id, shard_count)
+        self.path = directory
+        self.log = OrderEventLog(directory, segment_bytes, snapshot_every, batch_size)
+        records = self.log.recover()
+        self.stats = OrderStats.from_items(self.log.counters.items(), track_changes=True)
+        for data in sorted(records.values(), key=lambda data: order_seq(data["order_id"])):
+            self._add(Order.from_dict(data))
+        if self.log.max_seq:
+            self.order_counter = max(self.order_counter, self.log.max_seq + shard_count)
+        self.log.start()
+        logger.info("Загружено %d заказов из журнала %s", len(records), directory)
+
+    def _persist(self, order: Order, event: str = "updated"):
+        """Ставит событие с новым состоянием заказа и изменениями показателей в журнал"""
+        self.log.append(event, order.to_dict(), self.stats.take_changes())
+
+    def purge_orders(self, orders: List[Order]):
+        """Записывает в журнал перенос заказов в архив"""
+        for order in orders:
+            self.log.append_delete(order.order_id)
+
+    def flush(self):
+        self.log.flush()
+
+    async def sync(self):
+        await self.log.sync()
+
+    def close(self):
+        """Дописывает журнал и закрывает его"""
+        self.log.close()
+
+class ShardedOrderView:
+    """Заказы всех шардов для отчетов администратора.
+
+    Свой шард читается из памяти, остальные - запросами к их базам SQLite
+    (только чтение) в отдельном потоке, не занимая цикл событий. Страница -
+    один запрос по индексу номера заказа, показатели - готовые счетчики из
+    таблицы stats шарда. Без других шардов (paths пуст) это просто свое
+    хранилище.
+    """
+
+    def __init__(self, local: OrderStorage, paths: List[str]):
+        self.local = local
+        local_path = getattr(local, "path", None)
+        self.paths = [path for path in paths if path != local_path]
+        self._connections: Dict[str, sqlite3.Connection] = {}  # только из потока _executor
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard-reader")
+
+    def _read(self, path: str, read: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._connections.get(path)
+        if conn is None:
+            conn = self._connections[path] = db.connect_readonly(path)
+        try:
+            return read(conn)
+        except Exception:
+            # Следующий запрос откроет базу заново
+            del self._connections[path]
+            conn.close()
+            raise
+
+    async def _read_shards(self, read: Callable[[sqlite3.Connection], Any]) -> List[Any]:
+        """Результаты read по базам других шардов; недоступный шард пропускается"""
+        loop = asyncio.get_running_loop()
+        results = []
+        for path in self.paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                results.append(await loop.run_in_executor(self._executor, self._read, path, read))
+            except Exception as e:
+                logger.error("Не удалось прочитать заказы шарда %s: %s", path, e)
+        return results
+
+    @staticmethod
+    def _read_stats(conn: sqlite3.Connection) -> OrderStats:
+        return OrderStats.from_items(conn.execute("SELECT key, value FROM stats"))
+
+    @staticmethod
+    def _read_page(conn: sqlite3.Connection, cursor: Optional[int], backward: bool, limit: int,
+                   status: Optional[str] = None, plan_id: Optional[str] = None,
+                   date_from: Optional[date] = None, date_to: Optional[date] = None) -> Tuple[List[Order], bool]:
+        """Страница заказов шарда одним запросом, как OrderStorage.query_orders"""
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if plan_id:
+            where.append("plan_id = ?")
+            params.append(plan_id)
+        # Номера растут вместе со временем создания: даты переводятся в границы номеров
+        if date_from:
+            where.append("seq >= (SELECT seq FROM orders WHERE created_at >= ? ORDER BY created_at LIMIT 1)")
+            params.append(datetime.combine(date_from, dt_time.min).isoformat())
+        if date_to:
+            where.append("seq <= (SELECT seq FROM orders WHERE created_at < ? ORDER BY created_at DESC LIMIT 1)")
+            params.append(datetime.combine(date_to + timedelta(days=1), dt_time.min).isoformat())
+        if cursor is not None:
+            where.append("seq > ?" if backward else "seq < ?")
+            params.append(cursor)
+        rows = conn.execute(
+            "SELECT data FROM orders"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + f" ORDER BY seq {'ASC' if backward else 'DESC'} LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        page = [Order.from_dict(json.loads(data)) for (data,) in rows[:limit]]
+        if backward:
+            page.reverse()
+        return page, len(rows) > limit
+
+    async def get_stats(self) -> OrderStats:
+        """Показатели всех шардов"""
+        merged = OrderStats()
+        merged.merge(self.local.stats)
+        for stats in await self._read_shards(self._read_stats):
+            merged.merge(stats)
+        return merged
+
+    async def query_orders(self, cursor: Optional[int] = None, backward: bool = False, limit: int = 10,
+                           **filters) -> Tuple[List[Order], bool]:
+        """Страница заказов по всем шардам; параметры как у OrderStorage.query_orders.
+
+        Номера заказов уникальны во всех шардах, поэтому страницы шардов
+        сливаются по номеру и курсор работает так же, как в одном хранилище.
+        """
+        pages = [self.local.query_orders(cursor=cursor, backward=backward, limit=limit, **filters)]
+        pages += await self._read_shards(
+            partial(self._read_page, cursor=cursor, backward=backward, limit=limit, **filters)
+        )
+        orders = sorted((order for page, _ in pages for order in page), key=lambda order: order.seq, reverse=True)
+        has_more = len(orders) > limit or any(more for _, more in pages)
+        # Нужны заказы, ближайшие к курсору: при backward это самые старые из найденных
+        return (orders[-limit:] if backward else orders[:limit]), has_more
+
+    def _close_connections(self):
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def close(self):
+        """Закрывает базы других шардов"""
+        self._executor.submit(self._close_connections)
+        self._executor.shutdown(wait=True)
+
+class OrderReaper:
+    """Фоновый перенос брошенных заказов в архив.
+
+    Заказ, который дольше ttl секунд остается в статусе created или
+    awaiting_payment, дописывается в сжатый архив и только после этого
+    удаляется из памяти и базы. В памяти остаются активные и завершенные
+    заказы, а не все нажатия "Оформить подписку". Заказ с открытым
+    платежом у провайдера (keep в start) не архивируется; оплату,
+    пришедшую все же после архивации, restore возвращает в хранилище.
+    """
+
+    def __init__(self, storage: OrderStorage, archive: OrderArchive, ttl: float,
+                 interval: float = 600, batch_size: int = 5000):
+        self.storage = storage
+        self.archive = archive
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self.archived = 0
+        self.restored = 0
+        self._keep: Optional[Callable[[Order], bool]] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-archive")
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "archived": self.archived,
+            "restored": self.restored,
+            "orders_in_memory": len(self.storage.orders),
+        }
+
+    async def reap(self) -> int:
+        """Один проход: переносит просроченные заказы в архив и возвращает их число"""
+        loop = asyncio.get_running_loop()
+        total = 0
+        while True:
+            now = time.time()
+            expired = self.storage.expire_orders(now - self.ttl, self.batch_size, self._keep)
+            if not expired:
+                break
+            archived_at = datetime.fromtimestamp(now).isoformat()
+            records = [dict(order.to_dict(), archived_at=archived_at) for order in expired]
+            try:
+                # Сжатие и fsync - в отдельном потоке
+                await loop.run_in_executor(self._executor, self.archive.append, records)
+            except Exception:
+                # Заказы остаются в хранилище до следующего прохода
+                self.storage.restore_orders(expired)
+                raise
+            self.storage.purge_orders(expired)
+            total += len(expired)
+            if len(expired) < self.batch_size:
+                break
+        if total:
+            self.archived += total
+            logger.info("В архив перенесено брошенных заказов: %d", total)
+        return total
+
+    async def restore(self, order_id: str, payment_id: str) -> Optional[Order]:
+        """Возвращает из архива заказ, ожидавший оплаты платежом payment_id.
+
+        None - такого заказа в архиве нет или его номер в хранилище уже
+        занят (хранилище в памяти после перезапуска выдает номера заново).
+        """
+        def find() -> Optional[Dict[str, Any]]:
+            found = None
+            for record in self.archive.query(order_id=order_id, status="awaiting_payment"):
+                if record.get("payment_id") == payment_id:
+                    found = record
+            return found
+
+        record = await asyncio.get_running_loop().run_in_executor(self._executor, find)
+        if record is None:
+            return None
+        record.pop("archived_at", None)
+        order = Order.from_dict(record)
+        if not self.storage.unarchive(order):
+            return None
+        self.restored += 1
+        return order
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error("Ошибка переноса заказов в архив: %s", e)
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, keep: Optional[Callable[[Order], bool]] = None):
+        """Запускает периодическую очистку (ttl=0 - заказы не истекают).
+
+        keep(order) -> True: заказ не архивируется, даже если просрочен.
+        """
+        self._keep = keep
+        if self.ttl > 0:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Останавливает очистку, дав дописать текущую пачку в архив"""
+        if self._task:
+            self._stop.set()
+            await self._task
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+def create_order_storage() -> OrderStorage:
+    """Создает хранилище заказов согласно настройкам"""
+    if ORDER_STORAGE == "log":
+        return LogOrderStorage(ORDER_LOG_DIR, ORDER_LOG_SEGMENT_BYTES, ORDER_SNAPSHOT_EVENTS, ORDER_WRITE_BATCH_SIZE,
+                               shard_id=SHARD_ID or 0, shard_count=max(WORKERS, 1))
+    if ORDER_STORAGE == "sqlite":
+        return SQLiteOrderStorage(ORDER_DB_PATH, ORDER_WRITE_BATCH_SIZE, ORDER_WRITE_INTERVAL,
+                                  shard_id=SHARD_ID or 0, shard_count=max(WORKERS, 1))
+    return OrderStorage(shard_id=SHARD_ID or 0, shard_count=max(WORKERS, 1))
+
+def create_admin_order_view(storage: OrderStorage) -> ShardedOrderView:
+    """Источник заказов для /orders, /export и /stats: в обработчике шарда - все шарды"""
+    if SHARD_ID is None:
+        return ShardedOrderView(storage, [])
+    if ORDER_STORAGE != "sqlite":
+        logger.warning("ORDER_STORAGE=%s: /orders покажет только заказы своего шарда", ORDER_STORAGE)
+        return ShardedOrderView(storage, [])
+    return ShardedOrderView(storage, ORDER_SHARD_DB_PATHS)
+
 # Глобальный экземпляр хранилища
-order_storage = OrderStorage()
+order_storage = create_order_storage()
+# Заказы для отчетов администратора (с учетом всех шардов)
+admin_order_view = create_admin_order_view(order_storage)
+# Перенос брошенных заказов в архив
+order_reaper = OrderReaper(
+    order_storage,
+    OrderArchive(ORDER_ARCHIVE_DIR, ORDER_ARCHIVE_SEGMENT_BYTES),
+    ttl=ORDER_TTL,
+    interval=ORDER_REAP_INTERVAL
+)
@@ -0,0 +1,138 @@
+from typing import Any, Dict, Mapping
+
+# Тексты экранов бота (Markdown)
+
+WELCOME_TEXT = (
+    "🎵 **Добро пожаловать в Spotify Family Bot!** 🎵\n\n"
+    "🔥 Получите доступ к **Spotify Premium** по лучшим ценам!\n\n"
+    "✅ **Что вы получаете:**\n"
+    "• Безлимитная музыка без рекламы\n"
+    "• Высокое качество звука\n"
+    "• Скачивание треков для офлайн прослушивания\n"
+    "• Доступ ко всем функциям Spotify Premium\n\n"
+    "💚 **Выберите действие:**"
+)
+
+SUPPORT_TEXT = (
+    "💬 **Поддержка**\n\n"
+    "Если возникли дополнительные вопросы, обратитесь по этому контакту:\n\n"
+    "👤 https://t.me/chanceofrain"
+)
+
+FAQ_TEXT = (
+    "📖 **Часто задаваемые вопросы**\n\n"
+
+    "1️⃣ **Это официальная подписка?**\n"
+    "— Да, это настоящая подписка Spotify Premium через семейный план.\n\n"
+
+    "2️⃣ **Нужно ли что-то платить каждый месяц?**\n"
+    "— Нет. Вы платите один раз за выбранный срок (1 / 3 / 6 / 12 месяцев).\n\n"
+
+    "3️⃣ **Что мне нужно для подключения?**\n"
+    "— Логин и пароль от Spotify аккаунта.\n\n"
+
+    "4️⃣ **Как происходит добавление в семью?**\n"
+    "— Мы отправляем приглашение в семью Spotify, вы подтверждаете адрес.\n\n"
+
+    "5️⃣ **Это безопасно?**\n"
+    "— Да. Данные используются только для добавления в семью и не передаются третьим лицам.\n\n"
+
+    "6️⃣ **Сколько времени занимает подключение?**\n"
+    "— От 5 до 30 минут. Иногда до 2 часов.\n\n"
+
+    "7️⃣ **Что если меня удалят из семьи?**\n"
+    "— Мы восстановим вас бесплатно, если срок ещё не истёк.\n\n"
+
+    "8️⃣ **Можно ли продлить подписку?**\n"
+    "— Да, просто оформите новый срок через бота."
+)
+
+SUBSCRIPTION_HEADER = (
+    "🎵 **Выберите план подписки Spotify Premium:**\n\n"
+    "💚 **Доступные варианты:**\n"
+)
+
+SUBSCRIPTION_FOOTER = (
+    "\n✨ **Что включено в Premium:**\n"
+    "• Безлимитная музыка без рекламы\n"
+    "• Высокое качество звука (до 320 kbps)\n"
+    "• Офлайн прослушивание\n"
+    "• Пропуск треков без ограничений\n"
+    "• Доступ к Spotify Connect\n\n"
+    "💚 Выберите подходящий план:"
+)
+
+ENTER_LOGIN_TEXT = (
+    "📧 **Введите данные от Spotify:**\n\n"
+    "⚠️ **ВАЖНО:**\n"
+    "• Введите данные в формате: **логин:пароль**\n"
+    "• Проверьте данные перед отправкой — **они должны быть точными**\n"
+    "• Используйте **точно такой же** логин и пароль, как в приложении Spotify\n\n"
+    "📝 **Пример:**\n"
+    "• your_email@gmail.com:yourpassword123\n"
+    "• spotify_username:yourpassword\n\n"
+    "🔒 **Безопасность:** Данные используются только для добавления в семью и не передаются третьим лицам"
+)
+
+PAYMENT_TEXT_TEMPLATE = (
+    "💳 **К оплате:** {price}₽\n\n"
+    "📋 **Детали заказа:**\n"
+    "• **Подписка:** {plan_name}\n"
+    "• **Spotify аккаунт:** {spotify_login}\n\n"
+    "🔥 **Что делать дальше:**\n"
+    "1️⃣ Нажмите кнопку **'💳 Оплатить'**\n"
+    "2️⃣ Совершите платеж\n"
+    "3️⃣ Нажмите **'✅ Я оплатил'**\n\n"
+    "⚡️ После подтверждения оплаты вы получите доступ к Spotify Premium в течение 5-30 минут!"
+)
+
+PAYMENT_SUCCESS_TEXT = (
+    "✅ Оплата успешно обработана!\n\n"
+    "📞 Администратор свяжется с вами в ближайшее время для активации подписки.\n"
+    "Обычно это занимает до 24 часов."
+)
+
+PAYMENT_CREATE_ERROR_TEXT = (
+    "❌ Не удалось создать платеж. Попробуйте отправить данные еще раз через минуту."
+)
+
+# Ответ на "Я оплатил", если провайдер еще не получил оплату (всплывающее окно, до 200 символов)
+PAYMENT_NOT_RECEIVED_TEXT = (
+    "⏳ Оплата еще не поступила. Если вы уже оплатили, подождите пару минут - "
+    "заказ подтвердится автоматически."
+)
+
+# Напоминание о продлении перед окончанием подписки
+RENEWAL_REMINDER_TEXT = (
+    "⏰ Ваша подписка Spotify Premium ({plan_name}) заканчивается {expires}.\n\n"
+    "Продлите ее заранее, чтобы музыка не прерывалась!"
+)
+
+# Ответ на нажатие устаревшей или поврежденной кнопки
+STALE_CALLBACK_TEXT = "⌛ Эта кнопка больше не действует. Нажмите /start"
+
+# Шаг оформления, заказ которого уже не найден (перезапуск бота или заказ устарел)
+ORDER_LOST_TEXT = "⌛ Заказ не найден, оформите его заново: /start"
+
+def plan_savings(plan: Mapping[str, Any], plans: Mapping[str, Mapping[str, Any]]) -> int:
+    """Экономия плана относительно помесячной оплаты по самому короткому плану"""
+    base = min(plans.values(), key=lambda p: p["months"])
+    return base["price"] * plan["months"] // base["months"] - plan["price"]
+
+def format_subscription_text(plans: Mapping[str, Mapping[str, Any]]) -> str:
+    """Текст выбора плана; цены и экономия берутся из каталога"""
+    lines = []
+    for plan in plans.values():
+        line = f"🔸 **{plan['name']}** — {plan['price']}₽"
+        savings = plan_savings(plan, plans)
+        if savings > 0:
+            line += f" *(экономия {savings}₽)*"
+        lines.append(line + "\n")
+    return SUBSCRIPTION_HEADER + "".join(lines) + SUBSCRIPTION_FOOTER
+
+def format_plan_selected_text(plan: Mapping[str, Any]) -> str:
+    """Текст после выбора плана с запросом данных Spotify"""
+    return f"✅ **Выбрана подписка:** {plan['name']} — {plan['price']}₽\n\n" + ENTER_LOGIN_TEXT
+
+def format_plan_selected_texts(plans: Mapping[str, Mapping[str, Any]]) -> Dict[str, str]:
+    return {plan_id: format_plan_selected_text(plan) for plan_id, plan in plans.items()}
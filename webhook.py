@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import signal
+from typing import Any, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, UPDATE_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Прием обновлений вебхука с ограничением числа одновременных обработчиков.
+
+    Telegram получает ответ сразу, а обновление обрабатывается в фоновой задаче.
+    Когда заняты все max_concurrency слотов, новый запрос ждет освобождения
+    слота до ответа, и Telegram сам притормаживает доставку.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._feed_update_and_release(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _feed_update_and_release(self, bot: Bot, update: Dict[str, Any]):
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        except Exception as e:
+            logger.error("Ошибка обработки обновления из вебхука: %s", e)
+        finally:
+            self._semaphore.release()
+
+    async def close(self) -> None:
+        """Дожидается обработки уже принятых обновлений.
+
+        Сессию бота закрывает main после on_shutdown.
+        """
+        if self._background_feed_update_tasks:
+            logger.info("Ожидание %d обновлений в обработке...", len(self._background_feed_update_tasks))
+            await asyncio.gather(*self._background_feed_update_tasks, return_exceptions=True)
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запускает aiohttp-сервер вебхука и работает до SIGINT/SIGTERM"""
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp, bot,
+        max_concurrency=UPDATE_CONCURRENCY,
+        secret_token=WEBHOOK_SECRET or None
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await site.start()
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info("Вебхук слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+        await stop_event.wait()
+    finally:
+        # Перестаем принимать запросы, дожидаемся обработчиков и вызываем dp.shutdown
+        await runner.cleanup()